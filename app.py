@@ -1,35 +1,74 @@
 import os
 import json
 import re
-from flask import Flask, request, abort
-from linebot import LineBotApi, WebhookHandler
+import time
+import logging
+from concurrent.futures import wait
+from flask import Flask, request, abort, Response
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage, FlexSendMessage
 import openai
 from dotenv import load_dotenv
-from modules.product_query import handle_product_query
-from modules.price_query import handle_price_query
+from modules.product_query import handle_product_query, QUERY_PREFIX, LIVE_QUERY_PREFIX
+from modules.price_query import handle_price_query, quoted_price, PRICE_QUOTE_KEY
 from modules.product_compare import handle_product_compare
 from modules.product_recommend import handle_product_recommend
 from modules.popular_ranking import handle_popular_ranking
 from modules.product_review import handle_product_review
 from modules.wishlist import add_to_wishlist, view_wishlist, remove_from_wishlist, clear_wishlist
-from modules.user_state import UserState
+from modules.user_state import create_user_state_store
+from modules.event_queue import event_executor, QueueFullError
+from modules.deadline import set_event_deadline
+from modules.line_client import InstrumentedLineBotApi, capture_replies
+from modules.reply_dispatcher import begin_event, reply
+from modules.idempotency import SeenEventStore, STATUS_DONE
+from modules.metrics import STAGE_SECONDS, COMMANDS_TOTAL, COMMAND_SECONDS, DUPLICATE_EVENTS_TOTAL, render as render_metrics
+from modules.request_log import setup_logging, log_event, hash_user_id, should_log_body
 
 # 載入環境變數
 load_dotenv()
 
 app = Flask(__name__)
 
-# 設定Line Bot API
-line_bot_api = LineBotApi(os.environ.get('LINE_CHANNEL_ACCESS_TOKEN'))
+# 日誌經由佇列交給背景執行緒寫出，不佔用請求時間
+setup_logging(app.logger)
+
+# 設定Line Bot API（LINE_API_ENDPOINT 可指向壓力測試用的模擬伺服器）
+line_bot_api = InstrumentedLineBotApi(
+    os.environ.get('LINE_CHANNEL_ACCESS_TOKEN'),
+    endpoint=os.environ.get('LINE_API_ENDPOINT', InstrumentedLineBotApi.DEFAULT_API_ENDPOINT)
+)
 handler = WebhookHandler(os.environ.get('LINE_CHANNEL_SECRET'))
 
 # 設定OpenAI API
 openai.api_key = os.environ.get('OPENAI_API_KEY')
 
-# 用戶狀態管理
-user_states = {}
+# 用戶狀態管理（USER_STATE_BACKEND=sqlite 時由多個 worker 共用）
+user_states = create_user_state_store()
+
+# 已處理的 webhook 事件（多個 worker 共用），避免 LINE 重送時重複執行
+seen_events = SeenEventStore()
+
+# 非同步 webhook 模式：驗證簽章後立即回應，事件交由背景執行緒池處理
+ASYNC_WEBHOOK = os.environ.get('ASYNC_WEBHOOK', '0') == '1'
+# 佇列已滿時的處理方式："503" 讓 LINE 稍後重送，"reply" 直接回覆忙碌訊息
+WEBHOOK_BUSY_MODE = os.environ.get('WEBHOOK_BUSY_MODE', '503')
+
+# 指令對應的指標標籤
+COMMAND_LABELS = {
+    "離開": "exit",
+    "說明": "help",
+    "查看我的車車": "wishlist_view",
+    "清空購物車": "wishlist_clear",
+    "不添加": "wishlist_skip",
+    "查詢裝置": "product_query_start",
+    "查詢價格": "price_query_start",
+    "大車拼": "product_compare_start",
+    "求推薦": "product_recommend_start",
+    "金榜題名": "popular_ranking_start",
+    "評價大師": "product_review_start",
+}
 
 @app.route("/callback", methods=['POST'])
 def callback():
@@ -38,31 +77,195 @@ def callback():
 
     # 獲取請求體內容
     body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
 
-    # 處理 webhook body
+    # 驗證簽章並解析事件
+    started = time.perf_counter()
     try:
-        handler.handle(body, signature)
+        events = handler.parser.parse(body, signature)
     except InvalidSignatureError:
+        log_event(app.logger, "webhook_rejected", logging.WARNING, reason="invalid_signature", bytes=len(body))
         abort(400)
+    signature_seconds = time.perf_counter() - started
+    STAGE_SECONDS.observe(signature_seconds, stage="signature")
+
+    # 依取樣比例記錄完整內容（包含用戶訊息，預設不記錄）
+    if should_log_body():
+        log_event(app.logger, "webhook_body", body=body)
+
+    if not ASYNC_WEBHOOK:
+        # 在請求中處理事件，全部完成後才回應
+        process_events(events)
+        log_webhook(events, body, started, signature_seconds, "processed")
+        return 'OK'
+
+    # 交由背景執行緒池處理，立即回應 LINE 平台
+    try:
+        futures = submit_events(events)
+    except QueueFullError:
+        log_webhook(events, body, started, signature_seconds, "queue_full", logging.WARNING)
+        if WEBHOOK_BUSY_MODE == "reply":
+            reply_busy(events)
+            return 'OK'
+        abort(503)
+
+    if len(futures) < len(events):
+        # 只接受了一部分：已接受的事件會處理，503 會讓整批重送，因此其餘事件直接回覆忙碌訊息
+        log_webhook(events, body, started, signature_seconds, "partially_queued", logging.WARNING)
+        reply_busy(events[len(futures):])
+        return 'OK'
 
+    log_webhook(events, body, started, signature_seconds, "queued")
     return 'OK'
 
+def log_webhook(events, body, started, signature_seconds, outcome, level=logging.INFO):
+    """記錄一筆 webhook 的結構化日誌（不含訊息內容）"""
+    log_event(
+        app.logger, "webhook", level,
+        outcome=outcome,
+        events=len(events),
+        types=[event.type for event in events],
+        bytes=len(body),
+        signature_ms=round(signature_seconds * 1000, 2),
+        duration_ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """以 Prometheus 文字格式輸出本程序的指標"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+def event_key(event):
+    """事件的排序鍵：同一位用戶（或群組、聊天室）的事件依序處理"""
+    source = getattr(event, 'source', None)
+    return (getattr(source, 'user_id', None)
+            or getattr(source, 'group_id', None)
+            or getattr(source, 'room_id', None))
+
+def submit_events(events):
+    """依用戶排序提交事件：不同用戶的事件並行處理，同一用戶的事件依序處理
+
+    佇列放不下整批時只提交開頭的部分，回傳已提交事件的 Future。
+    """
+    return event_executor.submit_keyed_batch([
+        (event_key(event), dispatch_event, (event,), {})
+        for event in events
+    ])
+
+def process_events(events):
+    """處理同一個 webhook 中的事件並等待全部完成"""
+    try:
+        futures = submit_events(events)
+    except QueueFullError:
+        futures = []
+    wait(futures)
+    # 執行緒池放不下的事件在目前的執行緒依序處理（等已提交的事件完成，以維持同一用戶的順序）
+    for event in events[len(futures):]:
+        dispatch_event(event)
+
+def dispatch_event(event):
+    """將單一事件分派給對應的處理函數"""
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        handle_event_once(event, handle_message)
+
+def handle_event_once(event, handle):
+    """以 webhookEventId 確保每個事件只處理一次；重送的事件直接略過或補送未送達的回覆"""
+    event_id = getattr(event, 'webhook_event_id', None)
+    if not event_id:
+        handle(event)
+        return
+
+    status = seen_events.claim(event_id)
+    if status is not None:
+        redelivery = bool(getattr(getattr(event, 'delivery_context', None), 'is_redelivery', False))
+        replies = seen_events.take_replies(event_id) if status == STATUS_DONE else None
+        action = "replayed" if replies else "dropped"
+        DUPLICATE_EVENTS_TOTAL.inc(action=action)
+        log_event(
+            app.logger, "duplicate_event",
+            user=hash_user_id(event_key(event)), status=status, redelivery=redelivery, action=action,
+        )
+        if replies:
+            try:
+                line_bot_api.reply_message(event.reply_token, replies)
+            except LineBotApiError as e:
+                app.logger.error(f"LINE API Error while replaying replies: {str(e)}")
+        return
+
+    with capture_replies() as capture:
+        try:
+            handle(event)
+        finally:
+            # 先前因 reply token 過期而未送達的回覆留給重送的事件
+            seen_events.complete(event_id, capture.undelivered)
+
+def reply_busy(events):
+    """佇列已滿時回覆忙碌訊息"""
+    for event in events:
+        reply_token = getattr(event, 'reply_token', None)
+        if not reply_token:
+            continue
+        try:
+            line_bot_api.reply_message(
+                reply_token,
+                TextSendMessage(text="目前使用人數較多，請稍後再試。")
+            )
+        except LineBotApiError as e:
+            app.logger.error(f"LINE API Error in reply_busy: {str(e)}")
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
+    user_id = event.source.user_id
+    
+    # 取得用戶狀態（不存在時建立新的狀態）
+    lookup_started = time.perf_counter()
+    user_state = user_states.get(user_id)
+    started = time.perf_counter()
+    STAGE_SECONDS.observe(started - lookup_started, stage="state_lookup")
+    command = command_label(event.message.text, user_state)
+    try:
+        process_message(event, user_state)
+    finally:
+        elapsed = time.perf_counter() - started
+        COMMANDS_TOTAL.inc(command=command)
+        COMMAND_SECONDS.observe(elapsed, command=command)
+        # 將狀態寫回儲存，讓下一則訊息不論由哪個 worker 處理都能讀到
+        with STAGE_SECONDS.time(stage="state_save"):
+            user_states.save(user_id, user_state)
+        log_event(
+            app.logger, "message",
+            user=hash_user_id(user_id),
+            command=command,
+            state_lookup_ms=round((started - lookup_started) * 1000, 2),
+            duration_ms=round(elapsed * 1000, 2),
+        )
+
+def command_label(text, user_state):
+    """訊息對應的指標標籤：已知指令、等待輸入中的功能或 other"""
+    if text in COMMAND_LABELS:
+        return COMMAND_LABELS[text]
+    if text.startswith("移除"):
+        return "wishlist_remove"
+    if text.startswith("添加到願望清單:"):
+        return "wishlist_add"
+    if text.startswith((QUERY_PREFIX, LIVE_QUERY_PREFIX)):
+        return "product_query"
+    if user_state.waiting_for_input and user_state.current_state and not user_state.is_expired():
+        return user_state.current_state
+    return "other"
+
+def process_message(event, user_state):
+    """依用戶狀態處理文字訊息"""
     try:
         user_id = event.source.user_id
         text = event.message.text
         
-        # 初始化用戶狀態（如果不存在）
-        if user_id not in user_states:
-            user_states[user_id] = UserState()
-        
-        user_state = user_states[user_id]
+        # 以事件時間戳設定 reply token 的截止時間
+        set_event_deadline(event.timestamp)
+        begin_event(user_id, event.timestamp)
         
         # 檢查用戶狀態是否過期（30分鐘無活動）
         if user_state.is_expired():
-            app.logger.info(f"User {user_id} state expired, resetting")
+            log_event(app.logger, "state_expired", user=hash_user_id(user_id))
             user_state.reset()
         else:
             # 更新最後活動時間
@@ -71,30 +274,13 @@ def handle_message(event):
         # 處理「離開」指令 - 重置用戶狀態
         if text == "離開":
             user_state.reset()
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="已退出當前功能。輸入「說明」查看可用指令。")
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
-                # 檢查是否為 reply token 過期錯誤
-                if "Invalid reply token" in str(e):
-                    app.logger.warning(f"Reply token expired for user {user_id}")
-                    # 這裡可以考慮使用 push message 作為備選方案
-                    # line_bot_api.push_message(user_id, TextSendMessage(text="已退出當前功能。輸入「說明」查看可用指令。"))
+            reply(line_bot_api, event.reply_token, TextSendMessage(text="已退出當前功能。輸入「說明」查看可用指令。"))
             return
         
         # 處理「說明」指令
         if text == "說明":
             help_message = get_help_message()
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text=help_message)
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
+            reply(line_bot_api, event.reply_token, TextSendMessage(text=help_message))
             return
         
         # 處理願望清單相關指令
@@ -114,19 +300,25 @@ def handle_message(event):
         # 處理添加到願望清單的指令
         if text.startswith("添加到願望清單:"):
             product_name = text[8:].strip()
-            add_to_wishlist(line_bot_api, event.reply_token, user_id, product_name)
+            add_to_wishlist(
+                line_bot_api, event.reply_token, user_id, product_name,
+                quoted_price=quoted_price(user_state, product_name)
+            )
+            return
+        
+        # 處理從候選裝置中選擇（或略過目錄直接查詢）的快速回覆
+        if text.startswith((QUERY_PREFIX, LIVE_QUERY_PREFIX)):
+            user_state.reset()
+            handle_product_query(
+                line_bot_api, event.reply_token, text.split(":", 1)[1].strip(),
+                use_catalog=text.startswith(QUERY_PREFIX)
+            )
             return
         
         # 處理用戶選擇不添加到願望清單的情況
         if text == "不添加":
             help_message = get_help_message()
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text=help_message)
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
+            reply(line_bot_api, event.reply_token, TextSendMessage(text=help_message))
             return
         
         # 根據用戶當前狀態處理輸入
@@ -137,115 +329,27 @@ def handle_message(event):
         # 處理功能選擇
         if text == "查詢裝置":
             user_state.set_state("product_query", waiting_for_input=True)
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="請輸入您想查詢的裝置型號：")
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
-                # 檢查是否為 reply token 過期錯誤
-                if "Invalid reply token" in str(e):
-                    app.logger.warning(f"Reply token expired for user {user_id}")
-                    # 這裡可以考慮使用 push message 作為備選方案
-                    # line_bot_api.push_message(user_id, TextSendMessage(text="請輸入您想查詢的裝置型號："))
+            reply(line_bot_api, event.reply_token, TextSendMessage(text="請輸入您想查詢的裝置型號："))
         elif text == "查詢價格":
             user_state.set_state("price_query", waiting_for_input=True)
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="請輸入您想查詢價格的裝置型號：")
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
-                # 檢查是否為 reply token 過期錯誤
-                if "Invalid reply token" in str(e):
-                    app.logger.warning(f"Reply token expired for user {user_id}")
-                    # 這裡可以考慮使用 push message 作為備選方案
-                    # line_bot_api.push_message(user_id, TextSendMessage(text="請輸入您想查詢價格的裝置型號："))
+            reply(line_bot_api, event.reply_token, TextSendMessage(text="請輸入您想查詢價格的裝置型號："))
         elif text == "大車拼":
             user_state.set_state("product_compare", waiting_for_input=True)
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="請輸入您想比較的兩種裝置型號，以逗號分隔 ex:裝置Ａ, 裝置Ｂ")
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
-                # 檢查是否為 reply token 過期錯誤
-                if "Invalid reply token" in str(e):
-                    app.logger.warning(f"Reply token expired for user {user_id}")
-                    # 這裡可以考慮使用 push message 作為備選方案
-                    # line_bot_api.push_message(user_id, TextSendMessage(text="請輸入您想比較的兩種裝置型號，以逗號分隔 ex:裝置Ａ, 裝置Ｂ"))
+            reply(line_bot_api, event.reply_token, TextSendMessage(text="請輸入您想比較的2到4種裝置型號，以逗號分隔 ex:裝置Ａ, 裝置Ｂ, 裝置Ｃ"))
         elif text == "求推薦":
             user_state.set_state("product_recommend_type", waiting_for_input=True)
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="請輸入您想推薦的裝置類型（例如：手機、筆電、耳機等）：")
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
-                # 檢查是否為 reply token 過期錯誤
-                if "Invalid reply token" in str(e):
-                    app.logger.warning(f"Reply token expired for user {user_id}")
-                    # 這裡可以考慮使用 push message 作為備選方案
-                    # line_bot_api.push_message(user_id, TextSendMessage(text="請輸入您想推薦的裝置類型（例如：手機、筆電、耳機等）："))
+            reply(line_bot_api, event.reply_token, TextSendMessage(text="請輸入您想推薦的裝置類型（例如：手機、筆電、耳機等）："))
         elif text == "金榜題名":
             user_state.set_state("popular_ranking", waiting_for_input=True)
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="請輸入您想查詢的產品類型（例如：手機）：")
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
-                # 檢查是否為 reply token 過期錯誤
-                if "Invalid reply token" in str(e):
-                    app.logger.warning(f"Reply token expired for user {user_id}")
-                    # 這裡可以考慮使用 push message 作為備選方案
-                    # line_bot_api.push_message(user_id, TextSendMessage(text="請輸入您想查詢的產品類型（例如：手機）："))
+            reply(line_bot_api, event.reply_token, TextSendMessage(text="請輸入您想查詢的產品類型（例如：手機）："))
         elif text == "評價大師":
             user_state.set_state("product_review", waiting_for_input=True)
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="請輸入您想查詢評價的裝置型號：")
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
-                # 檢查是否為 reply token 過期錯誤
-                if "Invalid reply token" in str(e):
-                    app.logger.warning(f"Reply token expired for user {user_id}")
-                    # 這裡可以考慮使用 push message 作為備選方案
-                    # line_bot_api.push_message(user_id, TextSendMessage(text="請輸入您想查詢評價的裝置型號："))
+            reply(line_bot_api, event.reply_token, TextSendMessage(text="請輸入您想查詢評價的裝置型號："))
         else:
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="我不明白您的指令。請輸入「說明」查看可用功能。")
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error: {str(e)}")
-                # 檢查是否為 reply token 過期錯誤
-                if "Invalid reply token" in str(e):
-                    app.logger.warning(f"Reply token expired for user {user_id}")
-                    # 這裡可以考慮使用 push message 作為備選方案
-                    # line_bot_api.push_message(user_id, TextSendMessage(text="我不明白您的指令。請輸入「說明」查看可用功能。"))
+            reply(line_bot_api, event.reply_token, TextSendMessage(text="我不明白您的指令。請輸入「說明」查看可用功能。"))
     except Exception as e:
         app.logger.error(f"Error in handle_message: {str(e)}")
-        try:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="處理您的請求時發生錯誤，請稍後再試。")
-            )
-        except LineBotApiError as api_error:
-            app.logger.error(f"LINE API Error in error handler: {str(api_error)}")
-            # 檢查是否為 reply token 過期錯誤
-            if "Invalid reply token" in str(api_error):
-                app.logger.warning(f"Reply token expired for user {user_id}")
-                # 這裡可以考慮使用 push message 作為備選方案
-                # line_bot_api.push_message(user_id, TextSendMessage(text="處理您的請求時發生錯誤，請稍後再試。"))
+        reply(line_bot_api, event.reply_token, TextSendMessage(text="處理您的請求時發生錯誤，請稍後再試。"))
 
 def handle_user_input(event, user_state, text):
     """根據用戶當前狀態處理輸入"""
@@ -255,9 +359,13 @@ def handle_user_input(event, user_state, text):
             # 重置用戶狀態
             user_state.reset()
         elif user_state.current_state == "price_query":
-            handle_price_query(line_bot_api, event.reply_token, event.source.user_id, text)
-            # 重置用戶狀態
+            # 先重置用戶狀態，查詢到的最低價格保存在重置後的上下文中
             user_state.reset()
+            user_id = event.source.user_id
+            handle_price_query(
+                line_bot_api, event.reply_token, user_id, text,
+                remember=lambda quote: remember_price_quote(user_id, user_state, quote)
+            )
         elif user_state.current_state == "product_compare":
             handle_product_compare(line_bot_api, event.reply_token, text)
             # 重置用戶狀態
@@ -267,21 +375,13 @@ def handle_user_input(event, user_state, text):
             user_state.set_context("device_type", text)
             # 更新狀態為等待需求和預算
             user_state.set_state("product_recommend", waiting_for_input=True)
-            try:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text=f"請輸入您對{text}的需求和預算：")
-                )
-            except LineBotApiError as e:
-                app.logger.error(f"LINE API Error in product_recommend_type: {str(e)}")
-                # 檢查是否為 reply token 過期錯誤
-                if "Invalid reply token" in str(e):
-                    app.logger.warning(f"Reply token expired for user {event.source.user_id}")
-                    # 這裡可以考慮使用 push message 作為備選方案
-                    # line_bot_api.push_message(event.source.user_id, TextSendMessage(text=f"請輸入您對{text}的需求和預算："))
+            reply(line_bot_api, event.reply_token, TextSendMessage(text=f"請輸入您對{text}的需求和預算："))
             # 這裡不重置用戶狀態，因為還需要等待用戶輸入需求和預算
         elif user_state.current_state == "product_recommend":
-            handle_product_recommend(line_bot_api, event.reply_token, text, event.source.user_id)
+            handle_product_recommend(
+                line_bot_api, event.reply_token, text, event.source.user_id,
+                device_type=user_state.get_context("device_type")
+            )
             # 重置用戶狀態
             user_state.reset()
         elif user_state.current_state == "popular_ranking":
@@ -294,21 +394,16 @@ def handle_user_input(event, user_state, text):
             user_state.reset()
     except Exception as e:
         app.logger.error(f"Error in handle_user_input: {str(e)}")
-        try:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="處理您的請求時發生錯誤，請稍後再試。")
-            )
-        except LineBotApiError as api_error:
-            app.logger.error(f"LINE API Error in handle_user_input error handler: {str(api_error)}")
-            # 檢查是否為 reply token 過期錯誤
-            if "Invalid reply token" in str(api_error):
-                app.logger.warning(f"Reply token expired for user {event.source.user_id}")
-                # 這裡可以考慮使用 push message 作為備選方案
-                # line_bot_api.push_message(event.source.user_id, TextSendMessage(text="處理您的請求時發生錯誤，請稍後再試。"))
+        reply(line_bot_api, event.reply_token, TextSendMessage(text="處理您的請求時發生錯誤，請稍後再試。"))
         # 重置用戶狀態以避免卡在錯誤狀態
         user_state.reset()
 
+def remember_price_quote(user_id, user_state, quote):
+    """保存價格查詢得到的最低價格，讓「添加到願望清單」不必再次查詢"""
+    user_state.set_context(PRICE_QUOTE_KEY, quote)
+    # 先回覆「查詢中」時結果在背景產生，此時用戶狀態已經保存過，需另外寫回
+    user_states.update_context(user_id, PRICE_QUOTE_KEY, quote)
+
 def get_help_message():
     """返回幫助訊息"""
     return """🤖 3C小助手功能說明：
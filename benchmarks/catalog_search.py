@@ -0,0 +1,130 @@
+"""離線產品目錄比對延遲基準測試
+
+以產生的產品目錄（或 --catalog 指定的匯入檔）建立索引，
+對完全相符、不同寫法、打錯字、同系列其他型號與目錄外的輸入各比對多次，輸出延遲分佈與比對結果。
+直接回覆（hit）的產品與輸入原本對應的產品不同時計為 wrong；列出候選時檢查原本的產品是否在候選中。
+
+用法：
+    python benchmarks/catalog_search.py [--catalog products.json] [--products 300] [--rounds 2000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from modules.catalog import CatalogIndex, load_products, HIT, AMBIGUOUS
+from modules.product_names import canonical_key
+
+# 產生目錄用的系列與版本
+SERIES = [
+    ("iPhone ", ["13", "14", "15", "16"], ["", " Plus", " Pro", " Pro Max"]),
+    ("Galaxy S", ["22", "23", "24", "25"], ["", "+", " Ultra", " FE"]),
+    ("Galaxy A", ["15", "25", "35", "55"], ["", " 5G"]),
+    ("Galaxy Z ", ["Fold", "Flip"], ["4", "5", "6", "7"]),
+    ("Pixel ", ["7", "8", "9"], ["", " Pro", "a", " Pro XL"]),
+    ("OPPO Reno ", ["10", "11", "12", "13"], ["", " Pro", " F"]),
+    ("ROG Phone ", ["7", "8", "9"], ["", " Pro"]),
+    ("Xiaomi ", ["13", "14", "15"], ["", " Pro", " Ultra", "T"]),
+    ("iPad", [" Air", " Pro", " mini"], [" 11", " 13", " M2", " M4"]),
+    ("MacBook", [" Air", " Pro"], [" 13 M2", " 13 M3", " 14 M3", " 15 M3", " 16 M4"]),
+    ("ASUS Zenbook", [" 14", " 14 OLED", " S 13", " Duo"], ["", " 2024", " 2025"]),
+    ("Surface Pro ", ["9", "10", "11"], ["", " 5G"]),
+    ("Sony WH-1000XM", ["4", "5", "6"], [""]),
+    ("Apple Watch ", ["Series 9", "Series 10", "Ultra", "SE"], ["", " 2"]),
+    ("AirPods", ["", " Pro", " Max"], ["", " 2", " 3", " 4"]),
+]
+
+# 目錄外的輸入
+MISSES = ["Nintendo Switch 2", "電動牙刷", "Kindle Paperwhite", "Dyson V15", "PS5 Pro"]
+
+
+def generated_products(limit):
+    products = []
+    for brand, models, variants in SERIES:
+        for model in models:
+            for variant in variants:
+                name = f"{brand}{model}{variant}".strip()
+                products.append({
+                    "name": name, "category": None, "aliases": [], "specs": {"soc": "-"}, "updated_at": None,
+                })
+    return products[:limit]
+
+
+def typo(text, rng):
+    """交換相鄰的兩個字元"""
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 2)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def build_queries(products, rng):
+    """各種輸入與它原本對應的產品名稱（目錄中沒有對應的產品時為 None）"""
+    names = {canonical_key(product["name"]) for product in products}
+    queries = {"exact": [], "variant": [], "typo": [], "sibling": [], "miss": [(text, None) for text in MISSES]}
+    for product in products:
+        name = product["name"]
+        queries["exact"].append((name, name))
+        queries["variant"].append((name.lower().replace(" ", ""), name))
+        queries["typo"].append((typo(name, rng), name))
+        # 去掉最後一段的同系列型號（例如「iPhone 15 Pro Max」=>「iPhone 15 Pro」），不在目錄中時不應直接回覆
+        sibling = name.rsplit(" ", 1)[0]
+        if sibling != name and canonical_key(sibling) not in names:
+            queries["sibling"].append((sibling, None))
+    return {kind: texts for kind, texts in queries.items() if texts}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="離線產品目錄比對延遲基準測試")
+    parser.add_argument("--catalog", help="匯入檔（JSON 陣列或 .jsonl），預設使用產生的目錄")
+    parser.add_argument("--products", type=int, default=300, help="產生的目錄最多幾個產品")
+    parser.add_argument("--rounds", type=int, default=2000, help="每種輸入比對的次數")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    products = load_products(args.catalog) if args.catalog else generated_products(args.products)
+
+    started = time.perf_counter()
+    index = CatalogIndex(products)
+    print(f"{len(index)} 個產品，建立索引 {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    print(
+        f"{'input':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9} {'hit':>6} {'wrong':>6} "
+        f"{'ambig':>6} {'listed':>6} {'miss':>6}"
+    )
+    wrong_total = 0
+    for kind, texts in build_queries(products, rng).items():
+        timings = []
+        results = {"hit": 0, "ambiguous": 0, "miss": 0}
+        wrong = listed = 0
+        for _ in range(args.rounds):
+            text, expected = rng.choice(texts)
+            started = time.perf_counter()
+            result, matched = index.match(text)
+            timings.append((time.perf_counter() - started) * 1000)
+            results[result] += 1
+            names = [product["name"] for product in matched]
+            if result == HIT and names[0] != expected:
+                wrong += 1
+            elif result == AMBIGUOUS and expected in names:
+                listed += 1
+        wrong_total += wrong
+        print(
+            f"{kind:>8} {percentile(timings, 0.5):>9.4f} {percentile(timings, 0.99):>9.4f} {max(timings):>9.4f} "
+            f"{results['hit']:>6} {wrong:>6} {results['ambiguous']:>6} {listed:>6} {results['miss']:>6}"
+        )
+    # 直接回覆了錯誤的產品時以非零狀態結束
+    return 1 if wrong_total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
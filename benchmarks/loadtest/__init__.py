@@ -0,0 +1 @@
+"""離線壓力測試：簽章正確的 webhook、OpenAI 與 LINE API 模擬伺服器"""
@@ -0,0 +1,338 @@
+"""離線壓力測試
+
+以 gunicorn 啟動 wsgi:application，將 OpenAI 與 LINE API 指向本機模擬伺服器，
+再由多個模擬用戶送出簽章正確的 webhook（可混合多個事件與非文字事件）。
+每種 worker 設定會回報吞吐量、用戶收到最終結果的耗時 p50/p95/p99（先回覆「查詢中…」的查詢以之後的 push 計時）、
+reply token 首次回覆的 p99，以及錯過 reply token 時限的回覆數。
+
+用法：
+    python -m benchmarks.loadtest.run --configs 1x1,2x4,4x4 --senders 16 --messages 8 \\
+        --llm-latency lognormal:1.5,0.6 --llm-error-rate 0.02 [--stream] [--async-webhook]
+
+設定格式為「worker 數x每個 worker 的執行緒數」，執行緒數大於 1 時使用 gthread worker。
+"""
+import os
+import sys
+import math
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+
+from benchmarks.loadtest.signer import build_webhook, text_event, sticker_event, follow_event, new_reply_token
+from benchmarks.loadtest.stub_openai import OpenAIStub
+from benchmarks.loadtest.stub_line import LineStub, REPLY_TOKEN_WINDOW
+from modules.reply_dispatcher import ACK_TEXT
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+CHANNEL_SECRET = "loadtest-channel-secret"
+
+# 應用程式的資料檔設定（環境變數 -> 暫存目錄中的檔名）
+DATA_PATHS = {
+    "USER_STATE_DB_PATH": "user_states.db",
+    "WISHLIST_DB_PATH": "wishlist.db",
+    "WISHLIST_JSON_DIR": "wishlists",
+    "PRICE_HISTORY_DB_PATH": "price_history.db",
+    "PRICE_ALERT_CHECKPOINT": "price_alert_checkpoint.json",
+    "IDEMPOTENCY_DB_PATH": "seen_events.db",
+    "RANKING_DB_PATH": "rankings.db",
+    "SPEC_DB_PATH": "specs.db",
+    "CATALOG_DB_PATH": "catalog.db",
+    "PRODUCT_ALIAS_PATH": "product_aliases.json",
+}
+
+PRODUCTS = ["iPhone 15", "iPhone 15 Pro", "Galaxy S24", "Pixel 8", "小米 14", "MacBook Air M3", "AirPods Pro 2", "Sony WH-1000XM5"]
+
+# 模擬用戶的對話流程
+FLOWS = [
+    lambda rng: ["查詢裝置", rng.choice(PRODUCTS)],
+    lambda rng: ["查詢價格", rng.choice(PRODUCTS)],
+    lambda rng: ["評價大師", rng.choice(PRODUCTS)],
+    lambda rng: ["大車拼", ", ".join(rng.sample(PRODUCTS, 2))],
+    lambda rng: ["金榜題名", rng.choice(["手機", "筆電", "耳機"])],
+    lambda rng: ["求推薦", "手機", f"拍照好，預算{rng.choice([1, 2, 3])}萬"],
+    lambda rng: ["說明"],
+    lambda rng: ["查看我的車車"],
+]
+
+
+def percentile(values, pct):
+    """最近排名法的百分位數"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class VirtualUser:
+    """依序送出隨機對話流程中的訊息"""
+
+    def __init__(self, index, rng_seed):
+        self.user_id = f"U{index:032x}"
+        self.random = random.Random(rng_seed)
+        self.pending = []
+
+    def next_message(self):
+        if not self.pending:
+            self.pending = self.random.choice(FLOWS)(self.random)
+        return self.pending.pop(0)
+
+
+class Results:
+    """收集一次設定的測試結果"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reply_times = []
+        self.answer_times = []
+        self.webhook_times = []
+        self.bodies = 0
+        self.events = 0
+        self.missed = 0
+        self.acks = 0
+        self.unanswered = 0
+        self.webhook_errors = 0
+
+    def add(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                current = getattr(self, name)
+                if isinstance(current, list):
+                    current.extend(value)
+                else:
+                    setattr(self, name, current + value)
+
+
+def post_webhook(url, body, headers, timeout):
+    request = urllib.request.Request(url, data=body.encode("utf-8"), headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def run_sender(url, users, messages, line_stub, results, mixed_rate, reply_window, answer_timeout):
+    """一個傳送者負責數位用戶，每輪把每位用戶的下一則訊息放在同一個 webhook 中"""
+    for _ in range(messages):
+        events = []
+        waiters = {}
+        issued_at = time.monotonic()
+        timestamp_ms = int(time.time() * 1000)
+        for user in users:
+            token = new_reply_token()
+            events.append(text_event(user.user_id, user.next_message(), token, timestamp_ms))
+            waiters[token] = line_stub.issue(token, issued_at, user.user_id)
+        # 混合機器人不處理的事件，測試多事件 webhook 的分派
+        if random.random() < mixed_rate:
+            extra = random.choice([sticker_event, follow_event])
+            events.append(extra(random.choice(users).user_id, new_reply_token(), timestamp_ms))
+
+        body, headers = build_webhook(CHANNEL_SECRET, events)
+        status = post_webhook(url, body, headers, timeout=reply_window + 10)
+        webhook_time = time.monotonic() - issued_at
+        if status != 200:
+            results.add(bodies=1, events=len(events), webhook_errors=1, missed=len(waiters), webhook_times=[webhook_time])
+            continue
+
+        reply_times = []
+        answer_times = []
+        missed = acks = unanswered = 0
+        for token, waiter in waiters.items():
+            remaining = issued_at + reply_window - time.monotonic()
+            waiter.wait(max(remaining, 0))
+            elapsed = line_stub.reply_time(token)
+            if elapsed is None:
+                missed += 1
+                continue
+            reply_times.append(elapsed)
+            # 先回覆「查詢中…」時等待之後的 push，以用戶收到結果的時間計算
+            answered, acked = line_stub.wait_answer(token, max(issued_at + answer_timeout - time.monotonic(), 0))
+            acks += acked
+            if answered is None:
+                unanswered += 1
+            else:
+                answer_times.append(answered)
+        results.add(
+            bodies=1, events=len(events), missed=missed, acks=acks, unanswered=unanswered,
+            reply_times=reply_times, answer_times=answer_times, webhook_times=[webhook_time],
+        )
+
+
+def start_gunicorn(workers, threads, port, env, log_path):
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "-w", str(workers),
+        "--threads", str(threads),
+        "-k", "gthread" if threads > 1 else "sync",
+        "-b", f"127.0.0.1:{port}",
+        "--timeout", "120",
+        "wsgi:application",
+    ]
+    log = open(log_path, "w")
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def run_config(config, args, openai_stub, line_stub):
+    workers, _, threads = config.partition("x")
+    workers, threads = int(workers), int(threads or 1)
+    data_dir = tempfile.mkdtemp(prefix="linebot-loadtest-")
+    port = free_port()
+
+    env = dict(os.environ)
+    env.update({
+        "LINE_CHANNEL_SECRET": CHANNEL_SECRET,
+        "LINE_CHANNEL_ACCESS_TOKEN": "loadtest-token",
+        "LINE_API_ENDPOINT": line_stub.endpoint,
+        "OPENAI_API_KEY": "sk-loadtest",
+        "OPENAI_API_BASE": openai_stub.api_base,
+        "LLM_STREAM": "1" if args.stream else "0",
+        "ASYNC_WEBHOOK": "1" if args.async_webhook else "0",
+        # 多個 worker 必須共用用戶狀態
+        "USER_STATE_BACKEND": "sqlite" if workers > 1 else "memory",
+    })
+    # 所有儲存都放在暫存目錄，不寫入工作目錄，也不讀到之前測試留下的資料
+    env.update({name: os.path.join(data_dir, filename) for name, filename in DATA_PATHS.items()})
+    log_path = os.path.join(data_dir, "gunicorn.log")
+    process = start_gunicorn(workers, threads, port, env, log_path)
+    try:
+        if not wait_for_port(port):
+            print(f"{config}: gunicorn 未能啟動，請查看 {log_path}")
+            return None
+
+        url = f"http://127.0.0.1:{port}/callback"
+        results = Results()
+        llm_before = openai_stub.stats()["requests"]
+        line_before = line_stub.stats()
+        user_index = 0
+        senders = []
+        for _ in range(args.senders):
+            users = []
+            for _ in range(args.events_per_body):
+                users.append(VirtualUser(user_index, args.seed + user_index))
+                user_index += 1
+            senders.append(threading.Thread(
+                target=run_sender,
+                args=(url, users, args.messages, line_stub, results, args.mixed_rate, args.reply_window,
+                      args.answer_timeout),
+            ))
+
+        started = time.monotonic()
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join()
+        elapsed = time.monotonic() - started
+
+        line_after = line_stub.stats()
+        return {
+            "config": config,
+            "elapsed": elapsed,
+            "bodies": results.bodies,
+            "events": results.events,
+            "replies": len(results.reply_times),
+            "missed": results.missed,
+            "acks": results.acks,
+            "unanswered": results.unanswered,
+            "webhook_errors": results.webhook_errors,
+            "throughput": len(results.answer_times) / elapsed if elapsed else 0,
+            "p50": percentile(results.answer_times, 50),
+            "p95": percentile(results.answer_times, 95),
+            "p99": percentile(results.answer_times, 99),
+            "reply_p99": percentile(results.reply_times, 99),
+            "webhook_p99": percentile(results.webhook_times, 99),
+            "llm_calls": openai_stub.stats()["requests"] - llm_before,
+            "pushes": line_after["pushes"] - line_before["pushes"],
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def format_seconds(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def print_report(rows):
+    header = (
+        f"{'config':>8} {'bodies':>7} {'events':>7} {'replies':>8} {'missed':>7} {'acks':>5} {'unans':>6} {'5xx':>5} "
+        f"{'answer/s':>9} {'p50':>6} {'p95':>6} {'p99':>6} {'reply_p99':>10} {'hook_p99':>9} {'llm':>6} {'push':>5}"
+    )
+    print(header)
+    for row in rows:
+        print(
+            f"{row['config']:>8} {row['bodies']:>7} {row['events']:>7} {row['replies']:>8} {row['missed']:>7} "
+            f"{row['acks']:>5} {row['unanswered']:>6} {row['webhook_errors']:>5} {row['throughput']:>9.2f} "
+            f"{format_seconds(row['p50']):>6} {format_seconds(row['p95']):>6} {format_seconds(row['p99']):>6} "
+            f"{format_seconds(row['reply_p99']):>10} {format_seconds(row['webhook_p99']):>9} "
+            f"{row['llm_calls']:>6} {row['pushes']:>5}"
+        )
+    print("p50/p95/p99：用戶收到最終結果的秒數；reply_p99：reply token 首次回覆（可能是「查詢中…」）的秒數")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="離線壓力測試（模擬 OpenAI 與 LINE API）")
+    parser.add_argument("--configs", default="1x1,1x4,2x4", help="以逗號分隔的 gunicorn 設定，格式為 worker數x執行緒數")
+    parser.add_argument("--senders", type=int, default=8, help="同時送出 webhook 的傳送者數")
+    parser.add_argument("--events-per-body", type=int, default=1, help="每個 webhook 包含的文字訊息事件數（每個事件來自不同用戶）")
+    parser.add_argument("--messages", type=int, default=6, help="每位用戶送出的訊息數")
+    parser.add_argument("--mixed-rate", type=float, default=0.2, help="在 webhook 中額外混入貼圖或加入好友事件的機率")
+    parser.add_argument("--llm-latency", default="lognormal:1.5,0.6", help="OpenAI 模擬延遲分佈：fixed:秒、uniform:最小,最大、lognormal:中位數,sigma")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="OpenAI 模擬伺服器回傳 500 的比例")
+    parser.add_argument("--reply-window", type=float, default=REPLY_TOKEN_WINDOW, help="reply token 有效秒數")
+    parser.add_argument("--answer-timeout", type=float, default=180, help="先回覆「查詢中…」後等待 push 結果的最長秒數")
+    parser.add_argument("--stream", action="store_true", help="以串流方式呼叫 OpenAI（LLM_STREAM=1）")
+    parser.add_argument("--async-webhook", action="store_true", help="啟用非同步 webhook（ASYNC_WEBHOOK=1）")
+    parser.add_argument("--seed", type=int, default=1, help="隨機種子")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    openai_stub = OpenAIStub(args.llm_latency, args.llm_error_rate).start()
+    line_stub = LineStub(args.reply_window, ack_text=ACK_TEXT).start()
+    rows = []
+    try:
+        for config in args.configs.split(","):
+            print(f"執行 {config} ...", flush=True)
+            row = run_config(config.strip(), args, openai_stub, line_stub)
+            if row:
+                rows.append(row)
+    finally:
+        openai_stub.stop()
+        line_stub.stop()
+
+    print()
+    print_report(rows)
+    print(f"\nOpenAI 模擬伺服器：{openai_stub.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
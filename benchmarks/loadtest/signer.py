@@ -0,0 +1,61 @@
+"""產生帶有正確 X-Line-Signature 的 webhook 內容"""
+import hmac
+import json
+import time
+import base64
+import hashlib
+import uuid
+
+
+def sign(channel_secret, body):
+    """以 channel secret 計算 webhook 簽章（HMAC-SHA256 後 base64）"""
+    digest = hmac.new(channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+def new_reply_token():
+    return uuid.uuid4().hex
+
+
+def text_event(user_id, text, reply_token=None, timestamp_ms=None):
+    """用戶傳送文字訊息的事件"""
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": timestamp_ms or int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex.upper()[:26],
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": reply_token or new_reply_token(),
+        "message": {"id": str(uuid.uuid4().int)[:18], "type": "text", "text": text},
+    }
+
+
+def sticker_event(user_id, reply_token=None, timestamp_ms=None):
+    """貼圖訊息（機器人不處理，用來混合在多事件的 webhook 中）"""
+    event = text_event(user_id, "", reply_token, timestamp_ms)
+    event["message"] = {"id": str(uuid.uuid4().int)[:18], "type": "sticker", "packageId": "446", "stickerId": "1988"}
+    return event
+
+
+def follow_event(user_id, reply_token=None, timestamp_ms=None):
+    """加入好友事件"""
+    return {
+        "type": "follow",
+        "mode": "active",
+        "timestamp": timestamp_ms or int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex.upper()[:26],
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": reply_token or new_reply_token(),
+    }
+
+
+def build_webhook(channel_secret, events, destination="Uloadtest"):
+    """組合 webhook 內容，回傳 (body, headers)"""
+    body = json.dumps({"destination": destination, "events": events}, ensure_ascii=False)
+    headers = {
+        "Content-Type": "application/json; charset=UTF-8",
+        "X-Line-Signature": sign(channel_secret, body),
+    }
+    return body, headers
@@ -0,0 +1,155 @@
+"""LINE Messaging API 模擬伺服器：記錄每個 reply token 的回覆時間（超過時限即拒絕）與每位用戶收到 push 的時間"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# reply token 的有效時間（秒）
+REPLY_TOKEN_WINDOW = 60
+
+
+class LineStub:
+    """在背景執行緒提供 reply / push / multicast 端點"""
+
+    def __init__(self, reply_window=REPLY_TOKEN_WINDOW, ack_text=None, host="127.0.0.1", port=0):
+        self.reply_window = reply_window
+        self.ack_text = ack_text  # 以此文字回覆時代表結果稍後以 push 送出
+        self._tokens = {}  # reply token -> 發出時間（time.monotonic）
+        self._users = {}  # reply token -> 用戶 ID
+        self._replies = {}  # reply token -> 回覆時間
+        self._acked = set()  # 以確認訊息回覆的 reply token
+        self._pushes = {}  # 用戶 ID -> push 時間列表
+        self._waiters = {}  # reply token -> threading.Event
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.rejected = 0
+        self.pushes = 0
+        self.multicasts = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="line-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def issue(self, reply_token, issued_at=None, user_id=None):
+        """登記發出的 reply token，回傳收到回覆時會被設定的 Event"""
+        event = threading.Event()
+        with self._lock:
+            self._tokens[reply_token] = issued_at if issued_at is not None else time.monotonic()
+            self._users[reply_token] = user_id
+            self._waiters[reply_token] = event
+        return event
+
+    def reply_time(self, reply_token):
+        """回覆耗時（秒），沒有成功回覆時回傳 None"""
+        with self._lock:
+            replied = self._replies.get(reply_token)
+            if replied is None:
+                return None
+            return replied - self._tokens[reply_token]
+
+    def wait_answer(self, reply_token, timeout):
+        """等待最終結果送達，回傳耗時（秒）與是否經過確認訊息；逾時回傳 (None, 是否確認)
+
+        以確認訊息回覆時，結果是該用戶在確認之後收到的第一則 push。
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                answered = self._answered_at(reply_token)
+                acked = reply_token in self._acked
+                if answered is not None:
+                    return answered - self._tokens[reply_token], acked
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, acked
+                self._changed.wait(remaining)
+
+    def _answered_at(self, reply_token):
+        replied = self._replies.get(reply_token)
+        if replied is None or reply_token not in self._acked:
+            return replied
+        for pushed in self._pushes.get(self._users.get(reply_token), ()):
+            if pushed >= replied:
+                return pushed
+        return None
+
+    def _accept_reply(self, reply_token, messages):
+        now = time.monotonic()
+        with self._changed:
+            issued = self._tokens.get(reply_token)
+            if issued is None or reply_token in self._replies or now - issued > self.reply_window:
+                self.rejected += 1
+                return False
+            self._replies[reply_token] = now
+            if self.ack_text and messages and messages[0].get("text") == self.ack_text:
+                self._acked.add(reply_token)
+            waiter = self._waiters.get(reply_token)
+            self._changed.notify_all()
+        if waiter:
+            waiter.set()
+        return True
+
+    def _accept_push(self, user_id):
+        with self._changed:
+            self.pushes += 1
+            self._pushes.setdefault(user_id, []).append(time.monotonic())
+            self._changed.notify_all()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-Line-Request-Id", "loadtest")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/v2/bot/message/reply":
+                    if stub._accept_reply(payload.get("replyToken"), payload.get("messages")):
+                        self._send_json(200, {})
+                    else:
+                        self._send_json(400, {"message": "Invalid reply token"})
+                elif self.path == "/v2/bot/message/push":
+                    stub._accept_push(payload.get("to"))
+                    self._send_json(200, {})
+                elif self.path == "/v2/bot/message/multicast":
+                    with stub._lock:
+                        stub.multicasts += 1
+                    self._send_json(200, {})
+                else:
+                    self._send_json(404, {"message": "Not found"})
+
+        return Handler
+
+    def stats(self):
+        with self._lock:
+            return {
+                "replies": len(self._replies),
+                "acks": len(self._acked),
+                "rejected": self.rejected,
+                "pushes": self.pushes,
+                "multicasts": self.multicasts,
+            }
@@ -0,0 +1,166 @@
+"""OpenAI 相容的模擬伺服器：可設定延遲分佈、錯誤率，支援串流回覆"""
+import json
+import math
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from modules.prompts import SYSTEM_MESSAGES
+
+# 由系統提示詞判斷呼叫的功能
+FEATURES_BY_PROMPT = {message: feature for feature, message in SYSTEM_MESSAGES.items()}
+
+# 一般回覆的內容（約 300 字）
+SAMPLE_ANSWER = (
+    "📱 規格重點\n處理器：旗艦級晶片\n螢幕：6.1 吋 OLED 120Hz\n相機：4800 萬畫素主鏡頭\n電池：全天續航，支援快充\n"
+    "💰 價格參考：NT$24,900 起\n👍 優點：效能強、拍照穩定、系統更新長\n👎 缺點：充電速度普通、價格偏高\n"
+) * 3
+
+
+def parse_latency(spec):
+    """解析延遲分佈設定，回傳產生延遲秒數的函數
+
+    fixed:0.8          固定 0.8 秒
+    uniform:0.5,3      0.5 到 3 秒均勻分佈
+    lognormal:1.5,0.6  中位數 1.5 秒、sigma 0.6 的對數常態分佈（接近真實 LLM 的長尾）
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    raise ValueError(f"不支援的延遲分佈：{spec}")
+
+
+class OpenAIStub:
+    """在背景執行緒提供 /v1/chat/completions"""
+
+    def __init__(self, latency="lognormal:1.5,0.6", error_rate=0.0, host="127.0.0.1", port=0):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.streams = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_base(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="openai-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _answer(self, payload):
+        """依功能回覆符合格式的內容"""
+        system = next((m.get("content") for m in payload.get("messages", []) if m.get("role") == "system"), None)
+        feature = FEATURES_BY_PROMPT.get(system)
+        price = random.randint(5000, 50000)
+        if feature == "lowest_price":
+            return str(price)
+        if feature == "price_query":
+            return f"最低價：NT${price:,}\n{SAMPLE_ANSWER}"
+        if feature == "spec_extract":
+            return json.dumps({
+                "is_3c": True, "soc": "旗艦級晶片", "ram": "8GB", "storage": "128GB、256GB",
+                "display": "6.1 吋 OLED 120Hz", "battery": "4000mAh", "camera": "4800 萬畫素", "weight": "180g",
+                "release_date": "2024-09",
+            }, ensure_ascii=False)
+        return SAMPLE_ANSWER
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, data):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                stub._count("requests")
+                delay = stub.latency()
+
+                if random.random() < stub.error_rate:
+                    stub._count("errors")
+                    time.sleep(delay / 2)
+                    self._send_json(500, {"error": {"message": "stub upstream error", "type": "server_error"}})
+                    return
+
+                answer = stub._answer(payload)
+                if payload.get("stream"):
+                    stub._count("streams")
+                    self._stream(payload, answer, delay)
+                    return
+
+                time.sleep(delay)
+                self._send_json(200, {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": payload.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                    "usage": {
+                        "prompt_tokens": sum(len(m.get("content", "")) for m in payload.get("messages", [])),
+                        "completion_tokens": len(answer),
+                        "total_tokens": 0,
+                    },
+                })
+
+            def _stream(self, payload, answer, delay):
+                """以 server-sent events 分段送出，首段前等待約 1/4 的延遲"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = [answer[i:i + 20] for i in range(0, len(answer), 20)]
+                time.sleep(delay / 4)
+                step = (delay * 3 / 4) / max(len(pieces), 1)
+                try:
+                    for piece in pieces:
+                        chunk = {
+                            "id": "chatcmpl-stub",
+                            "object": "chat.completion.chunk",
+                            "model": payload.get("model"),
+                            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                        }
+                        self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                        time.sleep(step)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # 用戶端達到字數上限後提早關閉連線
+                    pass
+                self.close_connection = True
+
+        return Handler
+
+    def stats(self):
+        return {"requests": self.requests, "errors": self.errors, "streams": self.streams}
@@ -0,0 +1,205 @@
+"""各功能 token 用量、費用與耗時報告
+
+比較改版前後的系統提示詞長度；提供 /metrics 的輸出（網址或存檔）時，
+再依實際的 token 用量與 OpenAI 耗時計算每次呼叫的費用。
+同時提供改版前（或 TOKEN_BUDGET_ADAPTIVE=0）的 /metrics 時，直接比較兩次的用量與耗時；
+否則以系統提示詞縮短的 token 數估算改版前的費用。
+
+改版前的系統提示詞長度記錄在 benchmarks/token_baseline.json；
+提供 --baseline-ref 時改從該 git 版本重新估算，加上 --save-baseline 可更新記錄檔。
+
+用法：
+    python -m benchmarks.token_budget [--baseline-ref <git ref> [--save-baseline]] \\
+        [--metrics http://127.0.0.1:5000/metrics] [--baseline-metrics metrics-before.txt]
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from modules.prompts import SYSTEM_MESSAGES
+from modules.token_budget import BASELINES, LLM_PRICE_INPUT, LLM_PRICE_OUTPUT, estimate_tokens
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# 改版前各功能系統提示詞的估算 token 數（系統提示詞集中到 modules/prompts.py 之前的版本）
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "token_baseline.json")
+
+# 改版前各功能系統提示詞所在的模組
+BASELINE_SOURCES = {
+    "product_query": "modules/product_query.py",
+    "product_review": "modules/product_review.py",
+    "price_query": "modules/price_query.py",
+    "popular_ranking": "modules/popular_ranking.py",
+    "product_compare": "modules/product_compare.py",
+    "product_recommend": "modules/product_recommend.py",
+    "lowest_price": "modules/wishlist.py",
+}
+
+_SYSTEM_PROMPT = re.compile(r'(?:system_message|SYSTEM_MESSAGE) = """(.*?)"""', re.S)
+_SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def baseline_system_tokens(ref):
+    """從指定的 git 版本取出各功能原本的系統提示詞並估算 token 數"""
+    tokens = {}
+    for feature, path in BASELINE_SOURCES.items():
+        result = subprocess.run(["git", "show", f"{ref}:{path}"], cwd=REPO_ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise ValueError(f"無法從 {ref} 讀取 {path}：{result.stderr.strip()}")
+        source = result.stdout
+        match = _SYSTEM_PROMPT.search(source)
+        if match:
+            tokens[feature] = estimate_tokens(match.group(1))
+    return tokens
+
+
+def load_baseline(path=BASELINE_PATH):
+    """讀取記錄的改版前系統提示詞 token 數"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(tokens, path=BASELINE_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(tokens, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def load_metrics(source):
+    """讀取 Prometheus 文字格式的指標，回傳 {(名稱, 標籤...): 數值}"""
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source, timeout=10) as response:
+            text = response.read().decode("utf-8")
+    else:
+        with open(source, encoding="utf-8") as f:
+            text = f.read()
+
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        key = (name,) + tuple(sorted(_LABEL.findall(labels or "")))
+        samples[key] = float(value)
+    return samples
+
+
+def feature_usage(samples):
+    """依功能彙整呼叫次數、token 用量與平均耗時"""
+    usage = {}
+    for key, value in samples.items():
+        name, labels = key[0], dict(key[1:])
+        feature = labels.get("feature")
+        if not feature:
+            continue
+        row = usage.setdefault(feature, {"calls": 0, "prompt": 0, "completion": 0, "seconds": 0.0, "attempts": 0})
+        if name == "linebot_llm_requests_total" and labels.get("outcome") == "ok":
+            row["calls"] = value
+        elif name == "linebot_llm_tokens_total":
+            row[labels.get("kind")] = value
+        elif name == "linebot_llm_seconds_sum":
+            row["seconds"] = value
+        elif name == "linebot_llm_seconds_count":
+            row["attempts"] = value
+
+    rows = {}
+    for feature, row in usage.items():
+        if not row["calls"]:
+            continue
+        prompt = row["prompt"] / row["calls"]
+        completion = row["completion"] / row["calls"]
+        rows[feature] = {
+            "prompt": prompt,
+            "completion": completion,
+            "cost": cost_per_call(prompt, completion),
+            "latency": row["seconds"] / row["attempts"] if row["attempts"] else None,
+        }
+    return rows
+
+
+def cost_per_call(prompt_tokens, completion_tokens):
+    return (prompt_tokens * LLM_PRICE_INPUT + completion_tokens * LLM_PRICE_OUTPUT) / 1e6
+
+
+def format_seconds(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def percent(before, after):
+    return f"{(1 - after / before) * 100:+.1f}%" if before else "-"
+
+
+def print_prompt_report(baseline_tokens):
+    print("系統提示詞（估算 token 數）")
+    print(f"{'feature':>18} {'before':>7} {'after':>6} {'saved':>7} {'base_max':>10}")
+    for feature in BASELINE_SOURCES:
+        before = baseline_tokens.get(feature)
+        after = estimate_tokens(SYSTEM_MESSAGES[feature])
+        print(
+            f"{feature:>18} {before or '-':>7} {after:>6} {percent(before, after) if before else '-':>7} "
+            f"{BASELINES[feature]['max_tokens']:>10}"
+        )
+
+
+def print_usage_report(current, baseline, baseline_tokens):
+    print()
+    print(f"每次呼叫的用量與費用（每百萬 token：輸入 ${LLM_PRICE_INPUT}、輸出 ${LLM_PRICE_OUTPUT}）")
+    print(
+        f"{'feature':>18} {'prompt':>7} {'compl':>6} {'cost($)':>10} {'base($)':>10} {'saved':>7} "
+        f"{'latency':>8} {'base':>6} {'saved':>7}"
+    )
+    for feature, row in sorted(current.items()):
+        before = baseline.get(feature)
+        if before is None:
+            # 沒有改版前的實測數據：用戶訊息相同，以系統提示詞縮短的部分估算
+            prompt = row["prompt"]
+            if feature in baseline_tokens:
+                prompt += baseline_tokens[feature] - estimate_tokens(SYSTEM_MESSAGES[feature])
+            before = {"cost": cost_per_call(prompt, row["completion"]), "latency": None}
+        latency = row["latency"]
+        base_latency = before["latency"]
+        print(
+            f"{feature:>18} {row['prompt']:>7.0f} {row['completion']:>6.0f} {row['cost']:>10.6f} "
+            f"{before['cost']:>10.6f} {percent(before['cost'], row['cost']):>7} "
+            f"{format_seconds(latency):>8} {format_seconds(base_latency):>6} "
+            f"{percent(base_latency, latency) if base_latency and latency is not None else '-':>7}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="各功能 token 用量、費用與耗時報告")
+    parser.add_argument("--baseline-ref", help="從此 git 版本重新估算原本的系統提示詞長度（預設讀取 token_baseline.json）")
+    parser.add_argument("--save-baseline", action="store_true", help="將 --baseline-ref 的估算結果寫回 token_baseline.json")
+    parser.add_argument("--metrics", help="目前版本的 /metrics 網址或存檔")
+    parser.add_argument("--baseline-metrics", help="改版前（或 TOKEN_BUDGET_ADAPTIVE=0）的 /metrics 網址或存檔")
+    args = parser.parse_args(argv)
+
+    if args.baseline_ref:
+        try:
+            baseline_tokens = baseline_system_tokens(args.baseline_ref)
+        except (OSError, ValueError) as e:
+            print(f"無法估算改版前的系統提示詞：{str(e)}")
+            return 1
+        if args.save_baseline:
+            save_baseline(baseline_tokens)
+    else:
+        baseline_tokens = load_baseline()
+    print_prompt_report(baseline_tokens)
+
+    if args.metrics:
+        current = feature_usage(load_metrics(args.metrics))
+        baseline = feature_usage(load_metrics(args.baseline_metrics)) if args.baseline_metrics else {}
+        print_usage_report(current, baseline, baseline_tokens)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
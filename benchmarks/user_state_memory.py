@@ -0,0 +1,83 @@
+"""用戶狀態記憶體基準測試
+
+模擬大量不同用戶依序傳訊息，每隔一段時間記錄程序的 RSS。
+有上限的 InMemoryUserStateStore 在達到 USER_STATE_MAX_ENTRIES 後 RSS 應維持平穩；
+加上 --unbounded 可與舊版（一般 dict、永不清除）比較。
+
+用法：
+    python benchmarks/user_state_memory.py [--users 1000000] [--max-entries 100000] [--unbounded]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from modules.user_state import InMemoryUserStateStore, UserState
+
+
+def current_rss_mb():
+    """目前程序的 RSS（MB）"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        # 非 Linux 環境只能取得峰值 RSS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+
+
+class UnboundedStore:
+    """舊版行為：模組層級 dict，狀態永不清除"""
+
+    def __init__(self):
+        self._states = {}
+
+    def get(self, user_id):
+        if user_id not in self._states:
+            self._states[user_id] = UserState()
+        return self._states[user_id]
+
+    def save(self, user_id, state):
+        self._states[user_id] = state
+
+    def __len__(self):
+        return len(self._states)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用戶狀態記憶體基準測試")
+    parser.add_argument("--users", type=int, default=1000000, help="不同用戶 ID 的數量")
+    parser.add_argument("--max-entries", type=int, default=100000, help="記憶體中最多保留的用戶數")
+    parser.add_argument("--samples", type=int, default=10, help="記錄 RSS 的次數")
+    parser.add_argument("--unbounded", action="store_true", help="改用舊版永不清除的 dict")
+    args = parser.parse_args()
+
+    store = UnboundedStore() if args.unbounded else InMemoryUserStateStore(max_entries=args.max_entries)
+    step = max(1, args.users // args.samples)
+    baseline = current_rss_mb()
+    started = time.perf_counter()
+
+    print(f"{'users':>10} {'entries':>10} {'rss_mb':>10} {'delta_mb':>10}")
+    for i in range(1, args.users + 1):
+        user_id = f"U{i:032x}"
+        state = store.get(user_id)
+        state.update_activity_time()
+        # 部分用戶進入兩步驟流程，帶有上下文
+        if i % 4 == 0:
+            state.set_state("product_recommend", waiting_for_input=True)
+            state.set_context("device_type", "手機")
+        store.save(user_id, state)
+        if i % step == 0:
+            rss = current_rss_mb()
+            print(f"{i:>10} {len(store):>10} {rss:>10.1f} {rss - baseline:>10.1f}")
+
+    elapsed = time.perf_counter() - started
+    print(f"\n{args.users} 位用戶，耗時 {elapsed:.1f} 秒（每次存取 {elapsed / args.users * 1e6:.2f} 微秒）")
+
+
+if __name__ == "__main__":
+    main()
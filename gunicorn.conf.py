@@ -0,0 +1,10 @@
+from modules.event_queue import EVENT_DRAIN_TIMEOUT
+
+# 收到 SIGTERM 後等待進行中請求的秒數，需大於排空背景事件的時間
+graceful_timeout = EVENT_DRAIN_TIMEOUT + 5
+
+
+def worker_exit(server, worker):
+    """worker 結束前排空背景事件與「查詢中…」之後的查詢，讓已接受的事件都送出回覆"""
+    from modules.event_queue import event_executor
+    event_executor.shutdown()
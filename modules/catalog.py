@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import datetime
+import argparse
+import threading
+from modules.sqlite_db import SQLiteDatabase
+from modules.product_names import canonical_key
+from modules.spec_store import SPEC_FIELDS
+from modules.metrics import register_collector
+
+# 離線產品目錄設定
+CATALOG_DB_PATH = os.environ.get('CATALOG_DB_PATH', "data/catalog.db")
+CATALOG_CANDIDATE = float(os.environ.get('CATALOG_CANDIDATE', 0.45))  # 相似度達此值的產品列為候選
+CATALOG_MAX_CANDIDATES = int(os.environ.get('CATALOG_MAX_CANDIDATES', 4))  # 快速回覆最多列出的候選產品
+CATALOG_RELOAD_INTERVAL = float(os.environ.get('CATALOG_RELOAD_INTERVAL', 60))  # 每隔此秒數檢查目錄是否重新匯入
+
+# 查詢結果
+HIT = "hit"
+AMBIGUOUS = "ambiguous"
+MISS = "miss"
+
+_SPEC_KEYS = {field for field, _ in SPEC_FIELDS}
+_SPEC_LABELS = {label: field for field, label in SPEC_FIELDS}
+
+
+def grams(key):
+    """標準鍵的字元二元組（單一字元時使用字元本身）"""
+    if len(key) < 2:
+        return {key} if key else set()
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+class CatalogIndex:
+    """記憶體中的產品目錄索引：標準鍵完全相符或以字元二元組的倒排索引計算相似度"""
+
+    def __init__(self, products):
+        self.products = list(products)
+        self._exact = {}
+        self._key_grams = []
+        self._key_product = []
+        self._postings = {}
+        for position, product in enumerate(self.products):
+            for name in [product["name"]] + product["aliases"]:
+                key = canonical_key(name)
+                if not key:
+                    continue
+                self._exact.setdefault(key, position)
+                key_id = len(self._key_grams)
+                key_grams = grams(key)
+                self._key_grams.append(len(key_grams))
+                self._key_product.append(position)
+                for gram in key_grams:
+                    self._postings.setdefault(gram, []).append(key_id)
+
+    def __len__(self):
+        return len(self.products)
+
+    def search(self, text, limit=CATALOG_MAX_CANDIDATES):
+        """回傳相似度最高的產品 [(相似度, 產品)]，相似度為 Dice 係數（完全相符為 1）"""
+        key = canonical_key(text)
+        if not key:
+            return []
+        exact = self._exact.get(key)
+
+        query = grams(key)
+        overlaps = {}
+        for gram in query:
+            for key_id in self._postings.get(gram, ()):
+                overlaps[key_id] = overlaps.get(key_id, 0) + 1
+
+        scores = {}
+        for key_id, overlap in overlaps.items():
+            score = 2 * overlap / (len(query) + self._key_grams[key_id])
+            position = self._key_product[key_id]
+            if score > scores.get(position, 0):
+                scores[position] = score
+        if exact is not None:
+            scores[exact] = 1.0
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        return [(score, self.products[position]) for position, score in ranked]
+
+    def match(self, text):
+        """判斷輸入對應的產品，回傳 (HIT, [產品])、(AMBIGUOUS, [候選產品...]) 或 (MISS, [])
+
+        只有標準鍵與產品名稱或別名完全相同才算確定；「iPhone 15 Pro」與「iPhone 15 Pro Max」、
+        「Pixel 8a」與「Pixel 8」這類只差型號或後綴的產品相似度很高，一律列為候選讓用戶選擇。
+        """
+        exact = self._exact.get(canonical_key(text))
+        if exact is not None:
+            return HIT, [self.products[exact]]
+        results = self.search(text, limit=CATALOG_MAX_CANDIDATES)
+        candidates = [product for score, product in results if score >= CATALOG_CANDIDATE]
+        if candidates:
+            return AMBIGUOUS, candidates
+        return MISS, []
+
+
+class CatalogStore:
+    """離線產品目錄：產品名稱、別名、類型與規格，由匯入指令寫入"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS catalog_products (
+        canonical_name TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        category TEXT,
+        aliases TEXT NOT NULL,
+        specs TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        imported_at TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path=CATALOG_DB_PATH):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+
+    def import_products(self, products, replace=False):
+        """寫入產品（同一標準產品覆寫）；replace 時先清空目錄，回傳寫入筆數"""
+        imported_at = datetime.datetime.now().isoformat()
+        rows = [
+            (canonical_key(product["name"]), product["name"], product.get("category"),
+             json.dumps(product["aliases"], ensure_ascii=False),
+             json.dumps(product["specs"], ensure_ascii=False),
+             product.get("updated_at") or imported_at[:10], imported_at)
+            for product in products
+        ]
+        with self.db.transaction() as conn:
+            if replace:
+                conn.execute("DELETE FROM catalog_products")
+            conn.executemany(
+                "INSERT OR REPLACE INTO catalog_products "
+                "(canonical_name, name, category, aliases, specs, updated_at, imported_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def all(self):
+        rows = self.db.execute(
+            "SELECT name, category, aliases, specs, updated_at FROM catalog_products ORDER BY name"
+        ).fetchall()
+        return [
+            {
+                "name": row["name"],
+                "category": row["category"],
+                "aliases": json.loads(row["aliases"]),
+                "specs": json.loads(row["specs"]),
+                "updated_at": datetime.datetime.fromisoformat(row["updated_at"]),
+            }
+            for row in rows
+        ]
+
+    def version(self):
+        """目錄的版本（筆數與最後匯入時間），用來判斷是否需要重建索引"""
+        row = self.db.execute("SELECT COUNT(*), MAX(imported_at) FROM catalog_products").fetchone()
+        return tuple(row)
+
+
+def parse_product(data):
+    """整理匯入檔中的一個產品：name 必填，aliases 為字串或清單，specs 的欄位可用英文或中文名稱"""
+    name = str(data.get("name") or "").strip()
+    if not name:
+        raise ValueError("產品缺少 name")
+    aliases = data.get("aliases") or []
+    if isinstance(aliases, str):
+        aliases = aliases.split(",")
+    specs = {}
+    for field, value in (data.get("specs") or {}).items():
+        field = _SPEC_LABELS.get(field, field)
+        if field not in _SPEC_KEYS:
+            print(f"{name}：略過未知的規格欄位 {field}")
+            continue
+        if value not in (None, ""):
+            specs[field] = str(value).strip()
+    updated_at = data.get("updated_at")
+    if updated_at:
+        datetime.date.fromisoformat(str(updated_at)[:10])
+    return {
+        "name": name,
+        "category": data.get("category"),
+        "aliases": [alias.strip() for alias in aliases if alias and alias.strip()],
+        "specs": specs,
+        "updated_at": str(updated_at)[:10] if updated_at else None,
+    }
+
+
+def load_products(path):
+    """讀取匯入檔：JSON 陣列或每行一個 JSON 物件（.jsonl）"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".jsonl"):
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        items = json.loads(text)
+    return [parse_product(item) for item in items]
+
+
+class Catalog:
+    """讀取目錄儲存並維護記憶體索引；其他 worker 重新匯入後會在下次檢查時重建"""
+
+    def __init__(self, store=None, reload_interval=CATALOG_RELOAD_INTERVAL):
+        self.store = store or CatalogStore()
+        self.reload_interval = reload_interval
+        self.index = CatalogIndex([])
+        self._version = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def current_index(self):
+        """取得目前的索引，必要時重建"""
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.reload_interval:
+            return self.index
+        with self._lock:
+            if self._version is None or now - self._checked_at >= self.reload_interval:
+                version = self.store.version()
+                if version != self._version:
+                    self.index = CatalogIndex(self.store.all())
+                    self._version = version
+                self._checked_at = now
+        return self.index
+
+    def match(self, text):
+        return self.current_index().match(text)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """取得產品目錄"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = Catalog()
+    return _catalog
+
+
+@register_collector
+def _catalog_metrics():
+    """目錄中的產品數量"""
+    if _catalog is None:
+        return []
+    return [("linebot_catalog_products", "gauge", "Products in the offline catalog", [({}, len(_catalog.index))])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="離線產品目錄")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="匯入產品（JSON 陣列或 .jsonl）")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--replace", action="store_true", help="先清空目錄再匯入")
+    search_parser = commands.add_parser("search", help="測試輸入對應的產品")
+    search_parser.add_argument("text")
+    args = parser.parse_args(argv)
+
+    store = CatalogStore()
+    if args.command == "import":
+        try:
+            products = load_products(args.path)
+        except (OSError, ValueError) as e:
+            print(f"無法讀取匯入檔：{str(e)}")
+            return 1
+        count = store.import_products(products, replace=args.replace)
+        print(f"已匯入 {count} 個產品，目錄共 {store.version()[0]} 個產品")
+        return 0
+
+    index = CatalogIndex(store.all())
+    started = time.perf_counter()
+    result, _ = index.match(args.text)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"{result}（{elapsed:.3f} ms）")
+    for score, product in index.search(args.text):
+        print(f"  {score:.2f}  {product['name']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import os
+import time
+import threading
+
+# LINE reply token 的有效時間（秒）
+REPLY_TOKEN_TTL = float(os.environ.get('REPLY_TOKEN_TTL', 60))
+
+# 每個執行緒目前處理中事件的截止時間
+_local = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    """等待結果時已超過 reply token 的截止時間"""
+
+
+def set_event_deadline(event_timestamp):
+    """根據 LINE 事件時間戳（毫秒）設定目前執行緒的截止時間"""
+    if event_timestamp:
+        _local.deadline = event_timestamp / 1000.0 + REPLY_TOKEN_TTL
+    else:
+        _local.deadline = time.time() + REPLY_TOKEN_TTL
+
+
+def set_deadline(value):
+    """直接設定目前執行緒的截止時間（例如將呼叫者的截止時間帶到背景執行緒）"""
+    _local.deadline = value
+
+
+def clear_deadline():
+    """清除目前執行緒的截止時間"""
+    _local.deadline = None
+
+
+def get_deadline():
+    """取得目前執行緒的截止時間（epoch 秒），未設定時回傳 None"""
+    return getattr(_local, 'deadline', None)
+
+
+def remaining():
+    """距離截止時間的剩餘秒數，未設定時回傳 None"""
+    deadline = get_deadline()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.time())
@@ -0,0 +1,136 @@
+import os
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+
+# 背景事件處理設定
+EVENT_WORKERS = int(os.environ.get('EVENT_WORKERS', 8))  # 同時處理的事件數
+EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', 32))  # 等待中的事件上限
+EVENT_DRAIN_TIMEOUT = float(os.environ.get('EVENT_DRAIN_TIMEOUT', 25))  # 關閉時等待進行中工作的秒數
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """事件佇列已滿，無法再接受新工作"""
+
+
+class EventExecutor:
+    """有界的背景執行緒池，佇列滿時立即拒絕新工作
+
+    submit_keyed 提交的工作依 key（例如用戶 ID）排成各自的序列：
+    不同 key 的工作共用執行緒池並行處理，同一個 key 的工作嚴格依提交順序執行。
+    """
+
+    def __init__(self, max_workers=EVENT_WORKERS, queue_size=EVENT_QUEUE_SIZE):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="event-worker")
+        self._capacity = max_workers + queue_size
+        self._pending = 0
+        self._closed = False
+        self._lock = threading.Condition()
+        self._keyed = {}  # key -> 等待中的工作；存在代表該 key 已有執行緒在處理
+
+    @property
+    def pending(self):
+        """目前執行中與等待中的工作數量"""
+        return self._pending
+
+    def submit(self, fn, *args, **kwargs):
+        """提交工作；佇列已滿或已關閉時拋出 QueueFullError"""
+        with self._lock:
+            if self._closed or self._pending >= self._capacity:
+                raise QueueFullError("event queue is full")
+            self._pending += 1
+        try:
+            return self._executor.submit(self._run, fn, args, kwargs)
+        except RuntimeError:
+            # 執行緒池已被關閉
+            self._release()
+            raise QueueFullError("event executor is shut down")
+
+    def submit_keyed(self, key, fn, *args, **kwargs):
+        """依 key 排序提交單一工作，回傳 Future"""
+        return self.submit_keyed_batch([(key, fn, args, kwargs)])[0]
+
+    def submit_keyed_batch(self, jobs):
+        """一次提交多個 (key, fn, args, kwargs) 工作，回傳已接受工作的 Future 列表
+
+        容量不足時只接受批次開頭放得下的部分（同一個 key 的順序不變），
+        呼叫者需自行處理列表之後未被接受的工作；完全放不下時拋出 QueueFullError。
+        """
+        start_keys = []
+        with self._lock:
+            available = 0 if self._closed else self._capacity - self._pending
+            if available <= 0:
+                raise QueueFullError("event queue is full")
+            jobs = jobs[:available]
+            futures = [Future() for _ in jobs]
+            self._pending += len(jobs)
+            for (key, fn, args, kwargs), future in zip(jobs, futures):
+                queue = self._keyed.get(key)
+                if queue is None:
+                    queue = self._keyed[key] = deque()
+                    start_keys.append(key)
+                queue.append((fn, args, kwargs, future))
+
+        for index, key in enumerate(start_keys):
+            try:
+                self._executor.submit(self._drain, key)
+            except RuntimeError:
+                # 執行緒池已被關閉，取消尚未開始的序列
+                for pending_key in start_keys[index:]:
+                    self._cancel_key(pending_key)
+                raise QueueFullError("event executor is shut down")
+        return futures
+
+    def _drain(self, key):
+        """依序執行同一個 key 的工作，直到該 key 沒有等待中的工作"""
+        while True:
+            with self._lock:
+                queue = self._keyed[key]
+                if not queue:
+                    del self._keyed[key]
+                    return
+                fn, args, kwargs, future = queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                self._release()
+                continue
+            future.set_result(self._run(fn, args, kwargs))
+
+    def _cancel_key(self, key):
+        with self._lock:
+            queue = self._keyed.pop(key, deque())
+        for _, _, _, future in queue:
+            future.cancel()
+            self._release()
+
+    def _run(self, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Error in background event worker")
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+            if self._pending == 0:
+                self._lock.notify_all()
+
+    def shutdown(self, timeout=EVENT_DRAIN_TIMEOUT):
+        """停止接受新工作，並在逾時前等待進行中的回覆送出"""
+        with self._lock:
+            self._closed = True
+            drained = self._lock.wait_for(lambda: self._pending == 0, timeout=timeout)
+        if not drained:
+            print(f"Event executor shutdown timed out with {self._pending} pending jobs")
+        self._executor.shutdown(wait=drained)
+        return drained
+
+
+# 全域共用的事件執行緒池
+# 程序結束前由 gunicorn 的 worker_exit（gunicorn.conf.py）呼叫 shutdown 排空進行中的工作；
+# 不使用 atexit，因為 concurrent.futures 會在 atexit 之前先結束執行緒池
+event_executor = EventExecutor()
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+from modules.sqlite_db import SQLiteDatabase
+
+# 已處理事件的記錄設定（多個 worker 共用同一個 SQLite 檔案）
+IDEMPOTENCY_DB_PATH = os.environ.get('IDEMPOTENCY_DB_PATH', "data/seen_events.db")
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', 86400))  # 記錄保留秒數，涵蓋 LINE 的重送期間
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', 200000))  # 最多保留的事件數
+IDEMPOTENCY_STALE_AFTER = float(os.environ.get('IDEMPOTENCY_STALE_AFTER', 120))  # 處理中超過此秒數視為 worker 已中斷
+
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+
+
+class StoredMessage:
+    """已序列化的訊息，可直接交給 LineBotApi 再次送出"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def as_json_dict(self):
+        return self.data
+
+
+class SeenEventStore:
+    """以 webhookEventId 記錄已處理的事件，重送的事件不會再次執行"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS seen_events (
+        event_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        claimed_at REAL NOT NULL,
+        replies TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_seen_events_claimed ON seen_events (claimed_at);
+    """
+
+    # 清除過期記錄的間隔秒數
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path=IDEMPOTENCY_DB_PATH, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES,
+                 stale_after=IDEMPOTENCY_STALE_AFTER):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_after = stale_after
+        self._next_purge = 0.0
+
+    def claim(self, event_id):
+        """登記開始處理事件；第一次看到時回傳 None，否則回傳先前的狀態（processing 或 done）"""
+        now = time.time()
+        self._maybe_purge(now)
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO seen_events (event_id, status, claimed_at) VALUES (?, ?, ?)",
+            (event_id, STATUS_PROCESSING, now)
+        )
+        if cursor.rowcount == 1:
+            return None
+
+        # 處理中的 worker 太久沒有完成（例如被重啟），由這次重送接手
+        cursor = self.db.execute(
+            "UPDATE seen_events SET claimed_at = ? WHERE event_id = ? AND status = ? AND claimed_at < ?",
+            (now, event_id, STATUS_PROCESSING, now - self.stale_after)
+        )
+        if cursor.rowcount == 1:
+            return None
+
+        row = self.db.execute("SELECT status FROM seen_events WHERE event_id = ?", (event_id,)).fetchone()
+        return row["status"] if row else None
+
+    def complete(self, event_id, replies=None):
+        """標記事件已處理；replies 為未能送達的回覆，重送時可直接以新的 reply token 回覆"""
+        self.db.execute(
+            "UPDATE seen_events SET status = ?, replies = ? WHERE event_id = ?",
+            (STATUS_DONE, json.dumps(replies, ensure_ascii=False) if replies else None, event_id)
+        )
+
+    def take_replies(self, event_id):
+        """取出並清除保存的回覆，確保只會補送一次"""
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT replies FROM seen_events WHERE event_id = ?", (event_id,)).fetchone()
+            if row is None or not row["replies"]:
+                return None
+            conn.execute("UPDATE seen_events SET replies = NULL WHERE event_id = ?", (event_id,))
+        return [StoredMessage(data) for data in json.loads(row["replies"])]
+
+    def _maybe_purge(self, now):
+        if now >= self._next_purge:
+            self._next_purge = now + self.PURGE_INTERVAL
+            self.purge(now)
+
+    def purge(self, now=None):
+        """刪除過期的記錄，並只保留最新的 max_entries 筆，回傳刪除數量"""
+        now = now or time.time()
+        with self.db.transaction() as conn:
+            deleted = conn.execute(
+                "DELETE FROM seen_events WHERE claimed_at < ?", (now - self.ttl,)
+            ).rowcount
+            deleted += conn.execute(
+                "DELETE FROM seen_events WHERE event_id IN ("
+                "SELECT event_id FROM seen_events ORDER BY claimed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+        return deleted
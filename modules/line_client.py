@@ -0,0 +1,66 @@
+import threading
+from contextlib import contextmanager
+from linebot import LineBotApi
+from linebot.exceptions import LineBotApiError
+from modules.metrics import STAGE_SECONDS, LINE_API_ERRORS_TOTAL, REPLY_TOKEN_EXPIRED_TOTAL
+
+# 目前執行緒正在記錄回覆的事件
+_capture = threading.local()
+
+
+def is_reply_token_expired(error):
+    """判斷 LINE API 錯誤是否為 reply token 過期或無效"""
+    return "Invalid reply token" in str(error)
+
+
+class ReplyCapture:
+    """記錄處理單一事件時，因 reply token 過期而未能送達的回覆"""
+
+    def __init__(self):
+        self.undelivered = []
+
+    def keep(self, messages):
+        if not isinstance(messages, (list, tuple)):
+            messages = [messages]
+        self.undelivered.extend(message.as_json_dict() for message in messages)
+
+
+def keep_undelivered(messages):
+    """保留未能送達的回覆（僅在 capture_replies 區塊內有效）"""
+    capture = getattr(_capture, "current", None)
+    if capture is not None:
+        capture.keep(messages)
+
+
+@contextmanager
+def capture_replies():
+    """在區塊內記錄未送達的回覆，之後可用新的 reply token 補送"""
+    capture = ReplyCapture()
+    _capture.current = capture
+    try:
+        yield capture
+    finally:
+        _capture.current = None
+
+
+class InstrumentedLineBotApi(LineBotApi):
+    """記錄每次 LINE API 呼叫延遲與錯誤的 LineBotApi"""
+
+    def _call(self, method, call):
+        with STAGE_SECONDS.time(stage=method):
+            try:
+                return call()
+            except LineBotApiError as e:
+                LINE_API_ERRORS_TOTAL.inc(method=method)
+                if method == "reply" and is_reply_token_expired(e):
+                    REPLY_TOKEN_EXPIRED_TOTAL.inc()
+                raise
+
+    def reply_message(self, reply_token, messages, *args, **kwargs):
+        return self._call("reply", lambda: super(InstrumentedLineBotApi, self).reply_message(reply_token, messages, *args, **kwargs))
+
+    def push_message(self, to, messages, *args, **kwargs):
+        return self._call("push", lambda: super(InstrumentedLineBotApi, self).push_message(to, messages, *args, **kwargs))
+
+    def multicast(self, to, messages, *args, **kwargs):
+        return self._call("multicast", lambda: super(InstrumentedLineBotApi, self).multicast(to, messages, *args, **kwargs))
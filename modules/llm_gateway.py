@@ -0,0 +1,307 @@
+import os
+import time
+import random
+import threading
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from modules import deadline
+from modules.metrics import LLM_REQUESTS_TOTAL, LLM_SECONDS, LLM_TOKENS_TOTAL
+from modules.token_budget import token_budget, estimate_tokens
+
+# 支持網絡搜索的模型
+SEARCH_MODEL = "gpt-4o-mini-search-preview-2025-03-11"
+
+# 閘道設定
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 30))  # 單次呼叫逾時秒數
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))  # 單次請求最多重試次數
+LLM_BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE', 0.5))  # 退避基準秒數
+LLM_BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX', 4))  # 單次退避上限秒數
+LLM_RETRY_RATIO = float(os.environ.get('LLM_RETRY_RATIO', 0.2))  # 重試次數佔請求數的比例上限
+LLM_POOL_SIZE = int(os.environ.get('LLM_POOL_SIZE', 16))  # 連線池大小
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('LLM_BREAKER_THRESHOLD', 5))  # 連續失敗幾次後斷路
+BREAKER_RESET_TIMEOUT = float(os.environ.get('LLM_BREAKER_RESET', 30))  # 斷路後多久嘗試恢復
+LLM_STREAM = os.environ.get('LLM_STREAM', '0') == '1'  # 以串流方式接收回覆，達到字數上限即中斷
+
+# LINE 單則文字訊息的字數上限
+LINE_TEXT_LIMIT = 5000
+
+# 各功能回覆的字數上限（提示詞要求 500 字內，保留一些彈性）
+FEATURE_CHAR_BUDGETS = {
+    "product_query": 900,
+    "product_review": 900,
+    "product_compare": 1200,
+    "popular_ranking": 1200,
+    "product_recommend": 1200,
+    "price_query": 1500,
+}
+
+# 可以重試的錯誤（網絡或上游服務問題）
+RETRYABLE_ERRORS = (
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.RateLimitError,
+    requests.exceptions.RequestException,
+)
+
+# 設定錯誤（金鑰無效、沒有權限）：每個請求都會失敗，計入斷路器讓它快速失敗
+CONFIG_ERRORS = (
+    openai.error.AuthenticationError,
+    openai.error.PermissionError,
+)
+
+
+class LLMUnavailableError(Exception):
+    """上游 LLM 服務暫時無法使用（斷路中或重試用盡）"""
+
+
+class RetryBudget:
+    """重試預算：每個請求存入固定比例的額度，每次重試消耗一單位，避免上游故障時重試放大流量"""
+
+    def __init__(self, ratio=LLM_RETRY_RATIO, min_tokens=3, max_tokens=20):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """斷路器：連續失敗過多時快速失敗，冷卻後只放行一個探測請求"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否允許送出請求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            # 半開狀態只放行一個探測請求
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release_probe(self):
+        """請求因本身的問題失敗（與上游狀態無關）：不改變斷路器狀態，只歸還半開狀態的探測名額"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"OpenAI circuit breaker opened after {self._failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+# openai 預設在連線失敗時重試的次數（與 openai 自己建立的 session 相同）
+CONNECTION_RETRIES = 2
+
+
+class SharedSession(requests.Session):
+    """所有執行緒共用的 session
+
+    openai 每隔 MAX_SESSION_LIFETIME_SECS 會關閉各執行緒的 session 再重新取得；
+    共用的 session 關閉後所有執行緒的連線池都會被清空，因此忽略 close()，連線隨程序結束關閉。
+    """
+
+    def close(self):
+        pass
+
+
+def _make_session():
+    """建立所有執行緒共用、具連線池的 HTTP session"""
+    session = SharedSession()
+    adapter = HTTPAdapter(pool_connections=LLM_POOL_SIZE, pool_maxsize=LLM_POOL_SIZE, max_retries=CONNECTION_RETRIES)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+http_session = _make_session()
+openai.requestssession = http_session
+
+retry_budget = RetryBudget()
+breaker = CircuitBreaker()
+
+
+def _backoff_delay(attempt):
+    """完全抖動的指數退避秒數"""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _cut_at_sentence(cut, min_length):
+    """在最後一個換行或句號處斷開並加上刪節號；斷點太前面時保留全部文字"""
+    for separator in ("\n", "。"):
+        index = cut.rfind(separator)
+        if index >= min_length:
+            return cut[:index + 1].rstrip() + "…"
+    return cut + "…"
+
+
+def trim_to_budget(text, char_budget):
+    """將回覆截斷在字數上限內，盡量在換行或句號處斷開"""
+    if len(text) <= char_budget:
+        return text
+    return _cut_at_sentence(text[:char_budget - 1], char_budget * 0.6)
+
+
+def trim_truncated(text):
+    """回覆因 max_tokens 被截斷時，去掉最後不完整的句子"""
+    return _cut_at_sentence(text.rstrip(), len(text) * 0.6)
+
+
+def _read_stream(response, char_budget):
+    """逐段組合串流回覆，達到字數上限時立即關閉串流"""
+    parts = []
+    length = 0
+    try:
+        for chunk in response:
+            if not chunk["choices"]:
+                continue
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                parts.append(content)
+                length += len(content)
+                if length >= char_budget:
+                    break
+    finally:
+        # 提早中斷時關閉連線，不再接收（也不再支付）多餘的 token
+        close = getattr(response, "close", None)
+        if close:
+            close()
+    return "".join(parts)
+
+
+def _record_usage(feature, messages, content, usage, seconds, max_tokens, finish_reason=None):
+    """記錄 token 用量並交給 token 預算（串流回覆在此版本的 API 不提供 usage，改以字數估算）"""
+    if usage:
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    else:
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        completion_tokens = estimate_tokens(content)
+    if finish_reason is None:
+        truncated = completion_tokens >= max_tokens
+    else:
+        truncated = finish_reason == "length"
+    LLM_TOKENS_TOTAL.inc(prompt_tokens, feature=feature, kind="prompt")
+    LLM_TOKENS_TOTAL.inc(completion_tokens, feature=feature, kind="completion")
+    token_budget.record(feature, prompt_tokens, completion_tokens, seconds, truncated)
+
+
+def chat_completion(feature, messages, max_tokens=None, model=SEARCH_MODEL, web_search=True, timeout=LLM_TIMEOUT, stream=None):
+    """所有功能共用的 OpenAI 呼叫入口，返回回覆內容
+
+    max_tokens 未指定時由 token 預算依該功能最近的回覆長度決定。
+    """
+    if stream is None:
+        stream = LLM_STREAM
+    if max_tokens is None:
+        max_tokens = token_budget.max_tokens(feature)
+    char_budget = min(FEATURE_CHAR_BUDGETS.get(feature, LINE_TEXT_LIMIT), LINE_TEXT_LIMIT)
+
+    if not breaker.allow():
+        LLM_REQUESTS_TOTAL.inc(feature=feature, outcome="breaker_open")
+        raise LLMUnavailableError("OpenAI 服務暫時無法使用，請稍後再試")
+    retry_budget.record_request()
+
+    options = {}
+    if web_search:
+        options["web_search_options"] = {}  # 啟用網絡搜索
+
+    attempt = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                request_timeout=timeout,
+                stream=stream,
+                **options
+            )
+            if stream:
+                content = _read_stream(response, char_budget)
+                usage = finish_reason = None
+            else:
+                choice = response.choices[0]
+                content = choice.message.content
+                usage = getattr(response, "usage", None)
+                finish_reason = getattr(choice, "finish_reason", None)
+        except RETRYABLE_ERRORS as e:
+            LLM_SECONDS.observe(time.perf_counter() - started, feature=feature)
+            breaker.record_failure()
+            print(f"[{feature}] OpenAI 呼叫失敗（第{attempt + 1}次）：{str(e)}")
+            delay = _backoff_delay(attempt)
+            remaining = deadline.remaining()
+            if (attempt >= LLM_MAX_RETRIES
+                    or (remaining is not None and delay >= remaining)
+                    or not retry_budget.try_spend()
+                    or not breaker.allow()):
+                LLM_REQUESTS_TOTAL.inc(feature=feature, outcome="error")
+                raise LLMUnavailableError("與OpenAI通信失敗，請稍後再試") from e
+            LLM_REQUESTS_TOTAL.inc(feature=feature, outcome="retry")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except CONFIG_ERRORS:
+            LLM_SECONDS.observe(time.perf_counter() - started, feature=feature)
+            LLM_REQUESTS_TOTAL.inc(feature=feature, outcome="error")
+            breaker.record_failure()
+            raise
+        except Exception:
+            # 請求本身有誤（例如參數錯誤），不影響斷路器的失敗計數
+            LLM_SECONDS.observe(time.perf_counter() - started, feature=feature)
+            LLM_REQUESTS_TOTAL.inc(feature=feature, outcome="error")
+            breaker.release_probe()
+            raise
+
+        seconds = time.perf_counter() - started
+        LLM_SECONDS.observe(seconds, feature=feature)
+        LLM_REQUESTS_TOTAL.inc(feature=feature, outcome="ok")
+        _record_usage(feature, messages, content, usage, seconds, max_tokens, finish_reason)
+        breaker.record_success()
+        if finish_reason == "length":
+            # 調整後的 max_tokens 可能在句子中間截斷，改在最後一個完整的句子處結束
+            content = trim_truncated(content)
+        return trim_to_budget(content, char_budget if stream else LINE_TEXT_LIMIT)
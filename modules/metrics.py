@@ -0,0 +1,178 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# 延遲直方圖的預設區間（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# 所有已註冊的指標與額外的收集函數
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    """跳脫標籤值中的反斜線、雙引號與換行"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """只增不減的計數器"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = self._values
+            if not values and not self.labelnames:
+                values = {(): 0}  # 沒有標籤的計數器一律輸出，方便告警規則比對
+            for key, value in sorted(values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """延遲分佈直方圖"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [各區間計數..., 總和, 次數]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """計時區塊並記錄耗時"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self, **labels):
+        """回傳 (各區間累計次數, 總和, 次數)"""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                return [0] * len(self.buckets), 0.0, 0
+            return list(data[:-2]), data[-2], data[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, data):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {data[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {data[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {data[-1]}")
+        return lines
+
+
+def register_collector(collector):
+    """註冊額外的收集函數，回傳 [(名稱, 類型, 說明, [(標籤dict, 數值), ...]), ...]"""
+    _collectors.append(collector)
+    return collector
+
+
+def render():
+    """以 Prometheus 文字格式輸出所有指標"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception as e:
+            print(f"Error in metrics collector: {str(e)}")
+            continue
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# 各階段延遲：簽章驗證、狀態讀寫、LINE 回覆等
+STAGE_SECONDS = Histogram("linebot_stage_seconds", "Latency of each webhook processing stage", ["stage"])
+
+# 各指令的處理次數與延遲
+COMMANDS_TOTAL = Counter("linebot_commands_total", "Messages handled per command", ["command"])
+COMMAND_SECONDS = Histogram("linebot_command_seconds", "End-to-end handling latency per command", ["command"])
+
+# OpenAI 呼叫
+LLM_REQUESTS_TOTAL = Counter("linebot_llm_requests_total", "OpenAI calls per feature and outcome", ["feature", "outcome"])
+LLM_SECONDS = Histogram("linebot_llm_seconds", "OpenAI call latency per feature", ["feature"])
+LLM_TOKENS_TOTAL = Counter("linebot_llm_tokens_total", "OpenAI token usage per feature", ["feature", "kind"])
+
+# LINE API
+LINE_API_ERRORS_TOTAL = Counter("linebot_line_api_errors_total", "LINE Messaging API errors", ["method"])
+REPLY_TOKEN_EXPIRED_TOTAL = Counter("linebot_reply_token_expired_total", "Replies rejected because the reply token had expired")
+
+# 回覆路由：reply、push_fallback（token 失效改用 push）、deferred（先回覆查詢中）、push、cancelled
+REPLY_ROUTES_TOTAL = Counter("linebot_reply_routes_total", "How answers were delivered to users", ["route"])
+
+# 金榜題名的回覆來源（precomputed：預先產生的排行，live：即時查詢）
+RANKING_ANSWERS_TOTAL = Counter("linebot_ranking_answers_total", "Popular ranking answers by source", ["source"])
+
+# 查詢裝置的離線目錄比對結果（hit：目錄回覆，ambiguous：列出候選，miss：改用即時查詢）
+CATALOG_LOOKUPS_TOTAL = Counter("linebot_catalog_lookups_total", "Offline catalog lookups for product queries", ["result"])
+
+# 重送的 webhook 事件（dropped：略過，replayed：以保存的回覆補送）
+DUPLICATE_EVENTS_TOTAL = Counter("linebot_duplicate_events_total", "Redelivered webhook events that were not processed again", ["action"])
+
+
+@register_collector
+def _cache_metrics():
+    """回應快取與合併查詢的統計"""
+    from modules.response_cache import response_cache, in_flight
+    cache = response_cache.stats()
+    flights = in_flight.stats()
+    return [
+        ("linebot_response_cache_hits_total", "counter", "Response cache hits", [({}, cache["hits"])]),
+        ("linebot_response_cache_misses_total", "counter", "Response cache misses", [({}, cache["misses"])]),
+        ("linebot_response_cache_evictions_total", "counter", "Response cache LRU evictions", [({}, cache["evictions"])]),
+        ("linebot_response_cache_entries", "gauge", "Response cache entries", [({}, cache["size"])]),
+        ("linebot_llm_coalesced_total", "counter", "LLM requests served by an identical in-flight call", [({}, flights["coalesced"])]),
+    ]
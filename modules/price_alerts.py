@@ -0,0 +1,120 @@
+import os
+import json
+import datetime
+from linebot.models import TextSendMessage
+from linebot.exceptions import LineBotApiError
+from modules.rate_limit import RateLimiter
+
+# LINE multicast 每次最多 500 位收件者
+MULTICAST_BATCH_SIZE = 500
+
+# 降價通知設定
+PRICE_ALERT_RATE = float(os.environ.get('PRICE_ALERT_RATE', 10))  # 每秒最多幾次 multicast
+PRICE_ALERT_CHECKPOINT = os.environ.get('PRICE_ALERT_CHECKPOINT', "data/price_alert_checkpoint.json")
+
+
+def find_price_drops(products, prices):
+    """比較用戶儲存的最低價格與新價格，依產品分組需要通知的用戶"""
+    drops = {}
+    for key, new_price in prices.items():
+        if not isinstance(new_price, int):
+            continue
+        users = [
+            user_id
+            for user_id, old_price in products[key]['users'].items()
+            if isinstance(old_price, int) and new_price < old_price
+        ]
+        if users:
+            drops[key] = {
+                'name': products[key]['name'],
+                'price': new_price,
+                'users': sorted(users),
+            }
+    return drops
+
+
+def load_checkpoint(path=PRICE_ALERT_CHECKPOINT):
+    """讀取尚未完成的通知進度，沒有時回傳 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint, path=PRICE_ALERT_CHECKPOINT):
+    """原子性寫入通知進度"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_alert_message(drop):
+    """降價通知訊息"""
+    return TextSendMessage(
+        text=f"📉 降價通知\n您願望清單中的 {drop['name']} 目前最低價格為 NT${drop['price']}。\n輸入「查看我的車車」查看願望清單。"
+    )
+
+
+def send_price_alerts(line_bot_api, store, checkpoint, path=PRICE_ALERT_CHECKPOINT, rate=PRICE_ALERT_RATE):
+    """依產品分批 multicast 降價通知；每批送出後記錄進度，中斷後可從檢查點繼續"""
+    limiter = RateLimiter(rate)
+    sent = set(checkpoint['sent'])
+    notified = 0
+
+    for key in sorted(checkpoint['drops']):
+        drop = checkpoint['drops'][key]
+        users = drop['users']
+        message = build_alert_message(drop)
+        for start in range(0, len(users), MULTICAST_BATCH_SIZE):
+            batch_id = f"{key}:{start}"
+            if batch_id in sent:
+                continue
+            batch = users[start:start + MULTICAST_BATCH_SIZE]
+            limiter.acquire()
+            try:
+                line_bot_api.multicast(batch, message)
+            except LineBotApiError as e:
+                # 保留檢查點，下次執行時從這一批繼續
+                print(f"LINE API Error in send_price_alerts ({batch_id}): {str(e)}")
+                raise
+
+            # 更新已通知用戶的最低價格，避免重複通知
+            for user_id in batch:
+                store.update_price(user_id, drop['name'], drop['price'])
+            sent.add(batch_id)
+            checkpoint['sent'].append(batch_id)
+            save_checkpoint(checkpoint, path)
+            notified += len(batch)
+
+    # 全部送出後移除檢查點
+    if os.path.exists(path):
+        os.remove(path)
+    return notified
+
+
+def resume_price_alerts(line_bot_api, store, path=PRICE_ALERT_CHECKPOINT, rate=PRICE_ALERT_RATE):
+    """完成上次中斷的降價通知，回傳通知的用戶數；應在掃描願望清單之前執行"""
+    checkpoint = load_checkpoint(path)
+    if not checkpoint:
+        return 0
+    print(f"繼續 {checkpoint['created_at']} 中斷的降價通知")
+    return send_price_alerts(line_bot_api, store, checkpoint, path, rate)
+
+
+def notify_price_drops(line_bot_api, store, products, prices, path=PRICE_ALERT_CHECKPOINT, rate=PRICE_ALERT_RATE):
+    """找出降價的產品並通知用戶，回傳通知的用戶數"""
+    drops = find_price_drops(products, prices)
+    if not drops:
+        return 0
+
+    checkpoint = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'drops': drops,
+        'sent': [],
+    }
+    save_checkpoint(checkpoint, path)
+    return send_price_alerts(line_bot_api, store, checkpoint, path, rate)
@@ -0,0 +1,45 @@
+import os
+import datetime
+from modules.sqlite_db import SQLiteDatabase
+
+# 價格歷史資料庫位置
+PRICE_HISTORY_DB_PATH = os.environ.get('PRICE_HISTORY_DB_PATH', "data/price_history.db")
+
+
+class PriceHistoryStore:
+    """產品價格歷史（每次刷新附加一筆，不覆寫）"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS price_history (
+        canonical_name TEXT NOT NULL,
+        name TEXT NOT NULL,
+        price INTEGER NOT NULL,
+        fetched_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_price_history_product ON price_history (canonical_name, fetched_at);
+    """
+
+    def __init__(self, path=PRICE_HISTORY_DB_PATH):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+
+    def append(self, records):
+        """附加多筆價格紀錄，records 為 (canonical_name, name, price) 的列表"""
+        fetched_at = datetime.datetime.now().isoformat(timespec='seconds')
+        self.db.executemany(
+            "INSERT INTO price_history (canonical_name, name, price, fetched_at) VALUES (?, ?, ?, ?)",
+            [(canonical_name, name, price, fetched_at) for canonical_name, name, price in records]
+        )
+
+    def history(self, canonical_name, limit=30):
+        """取得產品最近的價格紀錄（由新到舊）"""
+        rows = self.db.execute(
+            "SELECT name, price, fetched_at FROM price_history WHERE canonical_name = ? "
+            "ORDER BY fetched_at DESC LIMIT ?",
+            (canonical_name, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def latest(self, canonical_name):
+        """取得產品最新的價格紀錄，沒有紀錄時回傳 None"""
+        records = self.history(canonical_name, limit=1)
+        return records[0] if records else None
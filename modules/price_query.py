@@ -1,13 +1,43 @@
 import os
-import openai
+import re
+import time
 from linebot.models import TextSendMessage, FlexSendMessage, QuickReply, QuickReplyButton, MessageAction
-from linebot.exceptions import LineBotApiError
+from modules.response_cache import cached
+from modules.reply_dispatcher import respond
+from modules.llm_gateway import chat_completion
+from modules.prompts import system_message, is_refusal
+from modules.product_names import canonical_key
 
-def handle_price_query(line_bot_api, reply_token, user_id, product_model):
-    """處理產品價格查詢"""
-    try:
-        # 調用GPT-4.1進行網絡搜索
-        response = call_gpt_with_web_search(product_model)
+# 用戶上下文中保存最近一次查詢到的最低價格
+PRICE_QUOTE_KEY = "price_quote"
+PRICE_QUOTE_TTL = 10 * 60  # 與價格查詢的快取時間相同
+
+# 非3C產品的標記（與願望清單的最低價格查詢相同）
+NOT_3C = "非3C產品"
+
+# 回覆第一行的最低價格，例如「最低價：NT$25,900」
+_LOWEST_PRICE_LINE = re.compile(r'^\s*最低價\s*[:：]\s*(?:NT\$|\$)?\s*([\d,]+)')
+
+def handle_price_query(line_bot_api, reply_token, user_id, product_model, remember=None):
+    """處理產品價格查詢
+
+    remember(quote) 在取得結果後呼叫，quote 為 make_price_quote 產生的最低價格，
+    讓用戶接著點選「添加到願望清單」時不必再次查詢。
+    """
+    def produce():
+        try:
+            # 調用GPT-4.1進行網絡搜索
+            response = call_gpt_with_web_search(product_model)
+        except Exception as e:
+            return TextSendMessage(text=f"查詢時發生錯誤：{str(e)}")
+        
+        # 保存回覆中的最低價格
+        price = parse_lowest_price(response)
+        if remember and price is not None:
+            try:
+                remember(make_price_quote(product_model, price))
+            except Exception as e:
+                print(f"保存最低價格時發生錯誤：{str(e)}")
         
         # 創建快速回覆按鈕，詢問是否添加到願望清單
         quick_reply = QuickReply(
@@ -20,62 +50,50 @@ def handle_price_query(line_bot_api, reply_token, user_id, product_model):
                 )
             ]
         )
-        
-        # 回覆用戶
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                [
-                    TextSendMessage(text=response),
-                    TextSendMessage(text="是否要將此產品添加到願望清單？", quick_reply=quick_reply)
-                ]
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in handle_price_query: {str(api_error)}")
-    except Exception as e:
-        error_message = f"查詢時發生錯誤：{str(e)}"
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=error_message)
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in handle_price_query error handler: {str(api_error)}")
+        return [
+            TextSendMessage(text=response),
+            TextSendMessage(text="是否要將此產品添加到願望清單？", quick_reply=quick_reply)
+        ]
+    
+    # 回覆用戶（預估趕不上 reply token 期限時先回覆查詢中，再以 push 送出）
+    respond(line_bot_api, reply_token, "price_query", produce,
+            ready=lambda: call_gpt_with_web_search.is_cached(product_model))
+
+def parse_lowest_price(response):
+    """從價格查詢的回覆取出最低價格：整數、非3C產品，或無法判斷時回傳 None"""
+    if is_refusal(response):
+        return NOT_3C
+    match = _LOWEST_PRICE_LINE.match(response)
+    if match:
+        digits = match.group(1).replace(',', '')
+        if digits:
+            return int(digits)
+    return None
+
+def make_price_quote(product_model, price):
+    """要保存在用戶上下文中的最低價格"""
+    return {"product": canonical_key(product_model), "price": price, "quoted_at": time.time()}
 
+def quoted_price(user_state, product_model):
+    """用戶最近查詢過此產品時回傳當時的最低價格，否則回傳 None"""
+    quote = user_state.get_context(PRICE_QUOTE_KEY)
+    if not quote or quote.get("product") != canonical_key(product_model):
+        return None
+    if time.time() - quote.get("quoted_at", 0) > PRICE_QUOTE_TTL:
+        return None
+    return quote.get("price")
+
+@cached("price_query", normalize=canonical_key)
 def call_gpt_with_web_search(product_model):
     """調用GPT-4.1進行網絡搜索並返回產品價格"""
-    # 設定系統訊息
-    system_message = """
-    你是一個專業的3C產品價格查詢助手。請根據用戶提供的產品型號，提供該產品在台灣地區的最新價格信息。
-    
-    回覆要求：
-    1. 只提供台灣地區的商品價格，使用新台幣（NT$）為單位
-    2. 如果有多個版本或顏色，請列出各版本的價格
-    3. 如果可能，提供不同通路的價格比較（如官網、電商平台等）
-    4. 標明價格的來源和更新時間
-    5. 如果找不到確切型號的價格，請明確說明並提供最相近型號的價格信息
-    6. 盡可能的減少特殊字符 ex: ** | - 等 以換行做區隔
-    7. 請盡可能的使用繁體中文回覆
-    9. 128=>128GB 256=>256GB 512=>512GB 1TB=>1TB
-    10. 重要：只回覆與3C產品（電腦、手機、平板、相機、耳機、智能手錶等電子產品）相關的內容
-    11. 如果用戶查詢的不是3C產品，請回覆：「很抱歉，我只能提供3C電子產品的價格信息。請嘗試查詢電腦、手機、平板、相機、耳機、智能手錶等電子產品。」
-    12. 在回答前，請先判斷查詢的產品是否為3C產品，如果不是，則回覆上述訊息
-    
-    """
-    
     # 設定用戶訊息
     user_message = f"請提供{product_model}在台灣地區的最新價格信息"
     
-    # 調用OpenAI API
-    response = openai.ChatCompletion.create(
-        model="gpt-4o-mini-search-preview-2025-03-11",  # 使用支持網絡搜索的模型
-        messages=[
-            {"role": "system", "content": system_message},
+    # 透過OpenAI閘道調用API
+    return chat_completion(
+        "price_query",
+        [
+            {"role": "system", "content": system_message("price_query")},
             {"role": "user", "content": user_message}
-        ],
-        web_search_options={},  # 啟用網絡搜索
-        max_tokens=1000
-    )
-    
-    # 提取回覆內容
-    return response.choices[0].message.content
\ No newline at end of file
+        ]
+    )
\ No newline at end of file
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import argparse
+import openai
+from linebot import LineBotApi
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from modules.product_names import canonical_key
+from modules.rate_limit import RateLimiter
+from modules.price_history import PriceHistoryStore
+from modules.wishlist import get_wishlist_store, get_product_lowest_price
+from modules.price_alerts import notify_price_drops, resume_price_alerts
+
+# 價格刷新設定
+PRICE_REFRESH_CONCURRENCY = int(os.environ.get('PRICE_REFRESH_CONCURRENCY', 4))  # 同時查詢的產品數
+PRICE_REFRESH_RATE = float(os.environ.get('PRICE_REFRESH_RATE', 1))  # 全域每秒查詢次數上限
+
+
+def collect_products(store):
+    """掃描所有願望清單，依標準產品鍵去重，回傳 {canonical_name: {'name', 'users'}}"""
+    products = {}
+    for user_id, item in list(store.iter_items()):
+        key = canonical_key(item['name'])
+        product = products.setdefault(key, {'name': item['name'], 'users': {}})
+        product['users'][user_id] = item.get('lowest_price')
+    return products
+
+
+def lookup_prices(products, concurrency=PRICE_REFRESH_CONCURRENCY, rate=PRICE_REFRESH_RATE):
+    """以有限的並行數與全域限流查詢每個產品一次，回傳 {canonical_name: price}"""
+    limiter = RateLimiter(rate, burst=concurrency)
+
+    def lookup(item):
+        key, product = item
+        limiter.acquire()
+        return key, get_product_lowest_price(product['name'])
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="price-refresh") as executor:
+        return dict(executor.map(lookup, products.items()))
+
+
+def refresh_prices(store=None, history=None, concurrency=PRICE_REFRESH_CONCURRENCY, rate=PRICE_REFRESH_RATE):
+    """刷新所有願望清單產品的價格並寫入價格歷史，回傳 (products, prices)"""
+    store = store or get_wishlist_store()
+    history = history or PriceHistoryStore()
+
+    products = collect_products(store)
+    user_count = sum(len(product['users']) for product in products.values())
+    print(f"價格刷新：{user_count} 個清單項目，共 {len(products)} 個不同產品")
+
+    started = time.monotonic()
+    prices = lookup_prices(products, concurrency, rate)
+    history.append([
+        (key, products[key]['name'], price)
+        for key, price in prices.items()
+        if isinstance(price, int)
+    ])
+    print(f"價格刷新完成，耗時 {time.monotonic() - started:.1f} 秒")
+    return products, prices
+
+
+def apply_prices(store, products, prices):
+    """將新價格寫回每位用戶的願望清單"""
+    updated = 0
+    for key, price in prices.items():
+        if not isinstance(price, int):
+            continue
+        for user_id, old_price in products[key]['users'].items():
+            if old_price != price and store.update_price(user_id, products[key]['name'], price):
+                updated += 1
+    return updated
+
+
+def run_once(concurrency=PRICE_REFRESH_CONCURRENCY, rate=PRICE_REFRESH_RATE, line_bot_api=None):
+    """執行一次完整的價格刷新；提供 line_bot_api 時會發送降價通知"""
+    store = get_wishlist_store()
+    if line_bot_api:
+        resume_price_alerts(line_bot_api, store)
+    products, prices = refresh_prices(store, concurrency=concurrency, rate=rate)
+    if line_bot_api:
+        notified = notify_price_drops(line_bot_api, store, products, prices)
+        print(f"已發送降價通知給 {notified} 位用戶")
+    updated = apply_prices(store, products, prices)
+    print(f"已更新 {updated} 個願望清單項目的價格")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="刷新願望清單產品價格")
+    parser.add_argument("--interval", type=float, default=0, help="定期執行的間隔秒數（0 表示只執行一次）")
+    parser.add_argument("--concurrency", type=int, default=PRICE_REFRESH_CONCURRENCY, help="同時查詢的產品數")
+    parser.add_argument("--rate", type=float, default=PRICE_REFRESH_RATE, help="全域每秒查詢次數上限")
+    parser.add_argument("--notify", action="store_true", help="刷新後以 LINE multicast 發送降價通知")
+    args = parser.parse_args(argv)
+    
+    # 載入環境變數並設定OpenAI API
+    load_dotenv()
+    openai.api_key = os.environ.get('OPENAI_API_KEY')
+    line_bot_api = LineBotApi(os.environ.get('LINE_CHANNEL_ACCESS_TOKEN')) if args.notify else None
+
+    while True:
+        try:
+            run_once(args.concurrency, args.rate, line_bot_api)
+        except Exception as e:
+            print(f"價格刷新時發生錯誤：{str(e)}")
+            if not args.interval:
+                return 1
+        if not args.interval:
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,86 +1,135 @@
 import os
-import openai
+import re
+from concurrent.futures import ThreadPoolExecutor
 from linebot.models import TextSendMessage
-from linebot.exceptions import LineBotApiError
+from modules import deadline
+from modules import product_query
+from modules.response_cache import cached
+from modules.llm_gateway import chat_completion
+from modules.prompts import system_message, REFUSAL_TEMPLATE
+from modules.product_specs import STRUCTURED_SPECS, get_spec_record, has_spec_record, render_comparison, is_3c
+from modules.product_names import canonical_key
+from modules.reply_dispatcher import reply, respond
+
+# 一次可比較的產品數量
+MIN_PRODUCTS = 2
+MAX_PRODUCTS = 4
+
+# 整理比較結果的模型（規格已事先取得，不需網絡搜索）
+COMPOSE_MODEL = "gpt-4o-mini"
+
+# 並行取得各產品規格的執行緒池
+_fetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('COMPARE_FETCH_WORKERS', 8)),
+    thread_name_prefix="compare-fetch"
+)
+
+# 產品之間的分隔符號：逗號、頓號或 vs
+_PRODUCT_SEPARATOR = re.compile(r'\s*(?:,|，|、|\bvs\.?(?=\s|$))\s*', re.IGNORECASE)
+
+def parse_products(input_text):
+    """解析輸入的產品型號，去除空白與重複的產品"""
+    products = []
+    seen = set()
+    for product in _PRODUCT_SEPARATOR.split(input_text):
+        product = product.strip()
+        key = canonical_key(product)
+        if product and key not in seen:
+            seen.add(key)
+            products.append(product)
+    return products
 
 def handle_product_compare(line_bot_api, reply_token, input_text):
     """處理產品比較"""
-    try:
-        # 解析輸入的兩個產品型號
-        products = [p.strip() for p in input_text.split(',')]
-        
-        if len(products) != 2:
-            try:
-                line_bot_api.reply_message(
-                    reply_token,
-                    TextSendMessage(text="請輸入兩個產品型號，以逗號分隔。例如：iPhone 13, Samsung S21")
-                )
-            except LineBotApiError as api_error:
-                print(f"LINE API Error in handle_product_compare (invalid format): {str(api_error)}")
-            return
-        
-        # 調用GPT-4.1進行網絡搜索
-        response = call_gpt_with_web_search(products[0], products[1])
-        
-        # 回覆用戶
+    # 解析輸入的產品型號
+    products = parse_products(input_text)
+    
+    if not MIN_PRODUCTS <= len(products) <= MAX_PRODUCTS:
+        reply(
+            line_bot_api, reply_token,
+            TextSendMessage(text=f"請輸入{MIN_PRODUCTS}到{MAX_PRODUCTS}個產品型號，以逗號分隔。例如：iPhone 13, Samsung S21")
+        )
+        return
+    
+    def produce():
         try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=response)
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in handle_product_compare: {str(api_error)}")
+            # 結構化規格模式：已知產品直接由本機規格比較
+            if STRUCTURED_SPECS:
+                text = compare_structured(products)
+                if text:
+                    return TextSendMessage(text=text)
+            # 並行取得各產品規格後整理比較
+            return TextSendMessage(text=call_gpt_with_web_search(*products))
+        except Exception as e:
+            return TextSendMessage(text=f"比較時發生錯誤：{str(e)}")
+    
+    def ready():
+        if STRUCTURED_SPECS and all(has_spec_record(product) for product in products):
+            return True
+        return call_gpt_with_web_search.is_cached(*products)
+    
+    # 回覆用戶（預估趕不上 reply token 期限時先回覆查詢中，再以 push 送出）
+    respond(line_bot_api, reply_token, "product_compare", produce, ready=ready)
+
+def compare_structured(products):
+    """由結構化規格產生比較；任一產品無法取得結構化規格時回傳 None，改用一般比較"""
+    try:
+        records = fetch_specs(products, fetch_one=get_spec_record)
     except Exception as e:
-        error_message = f"比較時發生錯誤：{str(e)}"
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=error_message)
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in handle_product_compare error handler: {str(api_error)}")
+        print(f"無法取得結構化規格：{str(e)}")
+        return None
+    if any(record is None for record in records):
+        return None
+    if not all(is_3c(record) for record in records):
+        return REFUSAL_TEMPLATE.format(topic="比較信息")
+    return render_comparison(products, records)
 
-def call_gpt_with_web_search(product1, product2):
-    """調用GPT-4.1進行網絡搜索並返回產品比較"""
-    # 設定系統訊息
-    system_message = """
-    你是一個專業的3C產品比較助手。請根據用戶提供的兩個產品型號，提供這兩個產品的詳細比較。
+def fetch_specs(products, fetch_one=None):
+    """並行取得每個產品的規格，重用產品規格查詢的快取；總耗時取決於最慢的一個查詢"""
+    fetch_one = fetch_one or product_query.call_gpt_with_web_search
+    caller_deadline = deadline.get_deadline()
     
-    回覆要求：
-    1. 回覆必須控制在500字以內
-    2. 確保比較的是台灣發行版本的產品
-    3. 比較應包括但不限於：性能、相機、電池、顯示屏、設計、價格等關鍵方面
-    4. 使用表格或清晰的分類方式呈現比較結果
-    5. 在比較的最後，根據不同使用場景給出簡短的建議
-    6. 如果找不到確切型號，請明確說明並提供最相近型號的比較
-    7. 盡可能的減少特殊字符 ex: ** | - 等 
-    8. 請盡可能的使用繁體中文回覆
-    9. 優先引用製造商官網來源
-    10.兩裝裝置以換行處理 範例： 處理器 :
-                                     裝置1:處理器1
-                                     裝置2:處理器2
-    11.來源網址提供在回覆的最下方，必免中斷閱讀體驗，且確保能夠準確提供網址
-    12.顯示屏==螢幕（避免使用中國名詞，使用台灣的名詞）
-    13.以換行做區隔,不使用makedown格式輸出表格
-    13.請盡可能的使用繁體中文回覆
-    14.重要：只回覆與3C產品（電腦、手機、平板、相機、耳機、智能手錶等電子產品）相關的內容
-    15.如果用戶查詢的不是3C產品，請回覆：「很抱歉，我只能提供3C電子產品的比較信息。請嘗試查詢電腦、手機、平板、相機、耳機、智能手錶等電子產品。」
-    16.在回答前，請先判斷查詢的產品是否為3C產品，如果不是，則回覆上述訊息
-    """
+    def fetch(product):
+        # 沿用呼叫者的 reply token 截止時間
+        deadline.set_deadline(caller_deadline)
+        try:
+            return fetch_one(product)
+        finally:
+            deadline.clear_deadline()
     
-    # 設定用戶訊息
-    user_message = f"請比較{product1}和{product2}這兩款產品的優缺點和適用場景"
+    futures = [_fetch_executor.submit(fetch, product) for product in products]
+    specs = []
+    errors = []
+    for product, future in zip(products, futures):
+        try:
+            specs.append(future.result())
+        except Exception as e:
+            print(f"取得 {product} 規格時發生錯誤：{str(e)}")
+            errors.append(e)
+            specs.append(None)
     
-    # 調用OpenAI API
-    response = openai.ChatCompletion.create(
-        model="gpt-4o-mini-search-preview-2025-03-11",  # 使用支持網絡搜索的模型
-        messages=[
-            {"role": "system", "content": system_message},
+    if len(errors) == len(products):
+        raise errors[0]
+    return specs
+
+@cached("product_compare", normalize=canonical_key)
+def call_gpt_with_web_search(*products):
+    """取得各產品規格並調用GPT整理產品比較"""
+    specs = fetch_specs(products)
+    
+    # 設定用戶訊息：附上各產品的規格資料
+    sections = []
+    for i, (product, spec) in enumerate(zip(products, specs), 1):
+        sections.append(f"裝置{i}：{product}\n{spec or '（無法取得規格資料）'}")
+    user_message = f"請比較{'、'.join(products)}這{len(products)}款產品的優缺點和適用場景。\n\n" + "\n\n".join(sections)
+    
+    # 透過OpenAI閘道調用API
+    return chat_completion(
+        "product_compare",
+        [
+            {"role": "system", "content": system_message("product_compare")},
             {"role": "user", "content": user_message}
         ],
-        web_search_options={},  # 啟用網絡搜索
-        max_tokens=1000
+        model=COMPOSE_MODEL,
+        web_search=False
     )
-    
-    # 提取回覆內容
-    return response.choices[0].message.content
\ No newline at end of file
@@ -0,0 +1,118 @@
+import os
+import re
+import sys
+import json
+import threading
+import unicodedata
+
+# 別名表：正規化後的輸入 -> 標準產品鍵
+ALIAS_PATH = os.environ.get('PRODUCT_ALIAS_PATH', "data/product_aliases.json")
+
+# 品牌與系列的常見寫法，依序套用在正規化後（小寫、半形）的文字上
+SEED_REWRITES = [
+    (re.compile(r'(?:apple\s*|蘋果\s*)?iphone'), 'iphone '),
+    # 「蘋果15」視為 iPhone；「apple 2024」等年份不改寫
+    (re.compile(r'(?:蘋果|apple)\s*(?=\d{1,2}(?!\d))'), 'iphone '),
+    # 只有整段查詢以「i11」到「i19」開頭時才視為 iPhone；「i5」、「i7」、「Intel i9」等處理器型號不改寫
+    (re.compile(r'^i\s*(?=1[1-9](?![\d-]))(?!.*(?:intel|core|ryzen|cpu|gen|處理器|筆電|筆記|電腦|桌機|laptop|notebook))'), 'iphone '),
+    (re.compile(r'(?:蘋果|apple)\s*(?=ipad|macbook|airpods)'), ''),
+    (re.compile(r'(?:蘋果|apple)\s*watch'), 'apple watch '),
+    (re.compile(r'(?:samsung|三星)\s*(?:galaxy\s*)?(?=[szaf]\s*\d)'), 'galaxy '),
+    (re.compile(r'(?:samsung|三星)\s*galaxy'), 'galaxy '),
+    (re.compile(r'(?:google\s*|谷歌\s*)?pixel'), 'pixel '),
+    (re.compile(r'小米'), 'xiaomi '),
+    (re.compile(r'華碩'), 'asus '),
+    (re.compile(r'索尼'), 'sony '),
+]
+
+# 儲存容量：128 => 128gb、1t => 1tb；數字前面必須是分隔字元，「Galaxy A32」、「OnePlus 8T」等型號不改寫
+# 單獨的「t」只在 1、2 之後視為 TB（「8T」、「4T」通常是型號後綴）
+_STORAGE_GB = re.compile(r'(?<![\da-z.])(32|64|128|256|512)\s*(?:gb|g)?(?![\da-z])')
+_STORAGE_TB = re.compile(r'(?<![\da-z.])(?:([1248])\s*tb|([12])\s*t)(?![\da-z])')
+_SEPARATORS = re.compile(r'[\s\-_/·・,，。.]+')
+
+_aliases = None
+_aliases_lock = threading.Lock()
+
+
+def fold_text(text):
+    """全形轉半形、統一大小寫並整理空白"""
+    text = unicodedata.normalize('NFKC', str(text))
+    return " ".join(text.split()).casefold()
+
+
+def normalize_product_name(text):
+    """將產品名稱轉換為標準鍵（不含別名表），例如「ｉＰｈｏｎｅ 15 Pro 128」=>「iphone15pro128gb」"""
+    text = fold_text(text)
+    for pattern, replacement in SEED_REWRITES:
+        text = pattern.sub(replacement, text)
+    text = _STORAGE_GB.sub(r'\1gb', text)
+    text = _STORAGE_TB.sub(lambda match: f"{match.group(1) or match.group(2)}tb", text)
+    return _SEPARATORS.sub('', text)
+
+
+def _load_aliases():
+    global _aliases
+    if _aliases is None:
+        with _aliases_lock:
+            if _aliases is None:
+                aliases = {}
+                if os.path.exists(ALIAS_PATH):
+                    try:
+                        with open(ALIAS_PATH, 'r', encoding='utf-8') as f:
+                            aliases = json.load(f)
+                    except (OSError, ValueError) as e:
+                        print(f"無法載入產品別名表：{str(e)}")
+                _aliases = aliases
+    return _aliases
+
+
+def canonical_key(text):
+    """取得產品的標準鍵；快取、去重與願望清單比對都使用這個鍵"""
+    if text is None:
+        return None
+    key = normalize_product_name(text)
+    return _load_aliases().get(key, key)
+
+
+def learn_alias(alias, canonical_name):
+    """記錄別名與標準產品的對應，並寫回別名表"""
+    alias_key = normalize_product_name(alias)
+    target_key = canonical_key(canonical_name)
+    if not alias_key or alias_key == target_key:
+        return False
+    aliases = _load_aliases()
+    with _aliases_lock:
+        if aliases.get(alias_key) == target_key:
+            return False
+        aliases[alias_key] = target_key
+        snapshot = dict(aliases)
+    try:
+        directory = os.path.dirname(ALIAS_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{ALIAS_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, ALIAS_PATH)
+    except OSError as e:
+        print(f"無法寫入產品別名表：{str(e)}")
+    return True
+
+
+def same_product(name1, name2):
+    """判斷兩個產品名稱是否指向同一個產品"""
+    return canonical_key(name1) == canonical_key(name2)
+
+
+if __name__ == "__main__":
+    # 用法：python -m modules.product_names <名稱>            顯示標準鍵
+    #       python -m modules.product_names learn <別名> <標準名稱>
+    if len(sys.argv) == 4 and sys.argv[1] == "learn":
+        learn_alias(sys.argv[2], sys.argv[3])
+        print(f"{sys.argv[2]} => {canonical_key(sys.argv[2])}")
+    elif len(sys.argv) == 2:
+        print(canonical_key(sys.argv[1]))
+    else:
+        print("用法：python -m modules.product_names <名稱> | learn <別名> <標準名稱>")
+        sys.exit(1)
@@ -1,64 +1,114 @@
 import os
-import openai
-from linebot.models import TextSendMessage
-from linebot.exceptions import LineBotApiError
+from linebot.models import TextSendMessage, QuickReply, QuickReplyButton, MessageAction
+from modules.response_cache import cached
+from modules.reply_dispatcher import reply, respond
+from modules.llm_gateway import chat_completion
+from modules.prompts import system_message, REFUSAL_TEMPLATE
+from modules.product_specs import (
+    STRUCTURED_SPECS, MIN_SPEC_FIELDS, SpecExtractionError, get_spec_record, has_spec_record, render_specs, is_3c
+)
+from modules.product_names import canonical_key
+from modules.catalog import get_catalog, HIT, AMBIGUOUS, MISS
+from modules.metrics import CATALOG_LOOKUPS_TOTAL
 
-def handle_product_query(line_bot_api, reply_token, product_model):
+# 選擇候選產品時送出的訊息前綴，例如「查詢裝置:iPhone 15 Pro」；候選都不是時以「即時查詢:」略過目錄
+QUERY_PREFIX = "查詢裝置:"
+LIVE_QUERY_PREFIX = "即時查詢:"
+
+# 快速回覆按鈕標籤的長度上限（LINE 限制 20 字）
+QUICK_REPLY_LABEL_MAX = 20
+
+def handle_product_query(line_bot_api, reply_token, product_model, use_catalog=True):
     """處理產品規格查詢"""
-    try:
-        # 調用GPT-4.1進行網絡搜索
-        response = call_gpt_with_web_search(product_model)
-        
-        # 回覆用戶
+    # 離線目錄中確定的產品直接回覆，無法確定時列出候選讓用戶選擇
+    if use_catalog:
+        result, products = lookup_catalog(product_model)
+        CATALOG_LOOKUPS_TOTAL.inc(result=result)
+        if result == HIT and len(products[0]["specs"]) >= MIN_SPEC_FIELDS:
+            reply(line_bot_api, reply_token, TextSendMessage(text=render_catalog_specs(products[0])))
+            return
+        if result == HIT:
+            # 目錄中的規格不足：以標準名稱即時查詢
+            product_model = products[0]["name"]
+        if result == AMBIGUOUS:
+            reply(line_bot_api, reply_token, candidates_message(product_model, products))
+            return
+    
+    if STRUCTURED_SPECS:
+        handle_structured_query(line_bot_api, reply_token, product_model)
+        return
+    
+    def produce():
         try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=response)
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in handle_product_query: {str(api_error)}")
-    except Exception as e:
-        error_message = f"查詢時發生錯誤：{str(e)}"
+            # 調用GPT-4.1進行網絡搜索
+            return TextSendMessage(text=call_gpt_with_web_search(product_model))
+        except Exception as e:
+            return TextSendMessage(text=f"查詢時發生錯誤：{str(e)}")
+    
+    # 回覆用戶（預估趕不上 reply token 期限時先回覆查詢中，再以 push 送出）
+    respond(line_bot_api, reply_token, "product_query", produce,
+            ready=lambda: call_gpt_with_web_search.is_cached(product_model))
+
+def handle_structured_query(line_bot_api, reply_token, product_model):
+    """結構化規格模式：由本機規格資料產生回覆，本機沒有時才查詢 JSON 規格"""
+    def produce():
         try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=error_message)
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in handle_product_query error handler: {str(api_error)}")
+            record = get_spec_record(product_model)
+        except SpecExtractionError as e:
+            # 無法取得結構化規格時改用一般查詢
+            print(f"無法取得 {product_model} 的結構化規格：{str(e)}")
+            try:
+                return TextSendMessage(text=call_gpt_with_web_search(product_model))
+            except Exception as e:
+                return TextSendMessage(text=f"查詢時發生錯誤：{str(e)}")
+        except Exception as e:
+            return TextSendMessage(text=f"查詢時發生錯誤：{str(e)}")
+        if not is_3c(record):
+            return TextSendMessage(text=REFUSAL_TEMPLATE.format(topic="規格信息"))
+        return TextSendMessage(text=render_specs(record))
+    
+    respond(line_bot_api, reply_token, "product_query", produce,
+            ready=lambda: has_spec_record(product_model))
 
+def lookup_catalog(product_model):
+    """在離線目錄中比對產品；讀取失敗時視為沒有相符的產品"""
+    try:
+        return get_catalog().match(product_model)
+    except Exception as e:
+        print(f"讀取產品目錄時發生錯誤：{str(e)}")
+        return MISS, []
+
+def render_catalog_specs(product):
+    """由目錄中的產品規格產生回覆"""
+    return render_specs({"name": product["name"], "specs": product["specs"], "fetched_at": product["updated_at"]})
+
+def candidates_message(product_model, products):
+    """列出候選產品的快速回覆，最後一個選項以原本的輸入即時查詢"""
+    items = [
+        QuickReplyButton(
+            action=MessageAction(label=product["name"][:QUICK_REPLY_LABEL_MAX], text=f"{QUERY_PREFIX}{product['name']}")
+        )
+        for product in products
+    ]
+    items.append(
+        QuickReplyButton(
+            action=MessageAction(label="都不是，直接查詢", text=f"{LIVE_QUERY_PREFIX}{product_model}")
+        )
+    )
+    names = "\n".join(f"・{product['name']}" for product in products)
+    return TextSendMessage(text=f"目錄中沒有完全相符的裝置，請選擇：\n{names}", quick_reply=QuickReply(items=items))
+
+@cached("product_query", normalize=canonical_key)
 def call_gpt_with_web_search(product_model):
     """調用GPT-4.1進行網絡搜索並返回產品規格"""
-    # 設定系統訊息
-    system_message = """
-    你是一個專業的3C產品規格查詢助手。請根據用戶提供的產品型號，提供該產品的詳細規格信息。
-    
-    回覆要求：
-    1. 回覆必須控制在500字以內
-    2. 只提供裝置規格信息，不要包含價格、評價或其他非規格信息
-    3. 確保提供的是台灣發行版本的規格
-    4. 格式應清晰易讀，可使用項目符號或表格形式
-    5. 如果找不到確切型號，請明確說明並提供最相近型號的信息
-    6. 盡可能的減少特殊字符 ex: ** | - 等 以換行做區隔
-    7. 請盡可能的使用繁體中文回覆
-    8. 重要：只回覆與3C產品（電腦、手機、平板、相機、耳機、智能手錶等電子產品）相關的內容
-    9. 如果用戶查詢的不是3C產品，請回覆：「很抱歉，我只能提供3C電子產品的規格信息。請嘗試查詢電腦、手機、平板、相機、耳機、智能手錶等電子產品。」
-    10. 在回答前，請先判斷查詢的產品是否為3C產品，如果不是，則回覆上述訊息
-    """
-    
     # 設定用戶訊息
     user_message = f"請提供{product_model}的詳細規格信息"
     
-    # 調用OpenAI API
-    response = openai.ChatCompletion.create(
-        model="gpt-4o-mini-search-preview-2025-03-11",  # 使用支持網絡搜索的模型
-        messages=[
-            {"role": "system", "content": system_message},
+    # 透過OpenAI閘道調用API
+    return chat_completion(
+        "product_query",
+        [
+            {"role": "system", "content": system_message("product_query")},
             {"role": "user", "content": user_message}
-        ],
-        web_search_options={},  # 啟用網絡搜索
-        max_tokens=1000
-    )
-    
-    # 提取回覆內容
-    return response.choices[0].message.content
\ No newline at end of file
+        ]
+    )
\ No newline at end of file
@@ -0,0 +1,108 @@
+import os
+import json
+from modules.response_cache import cached
+from modules.llm_gateway import chat_completion
+from modules.prompts import system_message
+from modules.product_names import canonical_key
+from modules.spec_store import get_spec_store, SPEC_FIELDS
+
+# 結構化規格模式：以 JSON 取得規格並保存在本機，規格查詢與產品比較由本機資料產生回覆
+STRUCTURED_SPECS = os.environ.get('STRUCTURED_SPECS', '0') == '1'
+
+# 至少要有幾個欄位才視為有效的規格
+MIN_SPEC_FIELDS = 3
+
+# 缺少的欄位顯示的文字
+MISSING_VALUE = "無資料"
+
+
+class SpecExtractionError(Exception):
+    """無法從回覆中取得結構化規格"""
+
+
+def parse_specs(text):
+    """解析模型回覆的 JSON 規格，回傳 {'is_3c': bool, 欄位: 值...}"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        raise SpecExtractionError("回覆中沒有 JSON")
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise SpecExtractionError(f"JSON 格式錯誤：{str(e)}") from e
+    if not isinstance(data, dict):
+        raise SpecExtractionError("JSON 不是物件")
+
+    if data.get("is_3c") is False:
+        return {"is_3c": False}
+    specs = {"is_3c": True}
+    for field, _ in SPEC_FIELDS:
+        value = data.get(field)
+        if isinstance(value, (list, tuple)):
+            value = "、".join(str(item) for item in value if item)
+        if value not in (None, ""):
+            specs[field] = str(value).strip()
+    if len(specs) - 1 < MIN_SPEC_FIELDS:
+        raise SpecExtractionError("規格欄位不足")
+    return specs
+
+
+def get_spec_record(product_model):
+    """取得產品的規格記錄；本機沒有或已過期時才查詢"""
+    record = get_spec_store().get(product_model)
+    if record is None:
+        record = fetch_spec_record(product_model)
+    return record
+
+
+def has_spec_record(product_model):
+    """本機是否已有產品的規格（不需要呼叫 LLM）"""
+    return get_spec_store().get(product_model) is not None
+
+
+@cached("spec_extract", normalize=canonical_key)
+def fetch_spec_record(product_model):
+    """調用GPT進行網絡搜索取得 JSON 規格，寫入本機規格儲存"""
+    # 設定用戶訊息
+    user_message = f"請以 JSON 提供{product_model}的規格"
+
+    # 透過OpenAI閘道調用API
+    content = chat_completion(
+        "spec_extract",
+        [
+            {"role": "system", "content": system_message("spec_extract")},
+            {"role": "user", "content": user_message}
+        ]
+    )
+    specs = parse_specs(content)
+    store = get_spec_store()
+    store.save(product_model, specs)
+    return store.get(product_model)
+
+
+def render_specs(record):
+    """由規格記錄產生規格查詢的回覆"""
+    specs = record["specs"]
+    lines = [f"{record['name']} 規格", ""]
+    for field, label in SPEC_FIELDS:
+        lines.append(f"{label}：{specs.get(field, MISSING_VALUE)}")
+    lines.append("")
+    lines.append(f"（規格資料更新於 {record['fetched_at'].strftime('%Y-%m-%d')}）")
+    return "\n".join(lines)
+
+
+def render_comparison(products, records):
+    """由多個產品的規格記錄產生比較回覆，每個項目中各裝置分行列出"""
+    lines = [f"{' vs '.join(products)} 規格比較"]
+    for field, label in SPEC_FIELDS:
+        lines.append("")
+        lines.append(f"{label}：")
+        for product, record in zip(products, records):
+            lines.append(f"{product}：{record['specs'].get(field, MISSING_VALUE)}")
+    oldest = min(record["fetched_at"] for record in records)
+    lines.append("")
+    lines.append(f"（規格資料更新於 {oldest.strftime('%Y-%m-%d')}）")
+    return "\n".join(lines)
+
+
+def is_3c(record):
+    return record["specs"].get("is_3c", True)
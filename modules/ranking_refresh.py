@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import argparse
+import openai
+from dotenv import load_dotenv
+from modules.rate_limit import RateLimiter
+from modules.popular_ranking import request_ranking
+from modules.prompts import is_refusal
+from modules.ranking_store import RankingStore, RANKING_CATEGORIES
+
+# 排行刷新設定
+RANKING_REFRESH_RATE = float(os.environ.get('RANKING_REFRESH_RATE', 0.5))  # 每秒查詢次數上限
+
+
+def refresh_rankings(categories=None, store=None, rate=RANKING_REFRESH_RATE):
+    """為每個類型即時查詢一次排行並寫入排行表，回傳成功更新的類型"""
+    categories = categories or RANKING_CATEGORIES
+    store = store or RankingStore()
+    limiter = RateLimiter(rate)
+
+    refreshed = []
+    for category in categories:
+        limiter.acquire()
+        started = time.monotonic()
+        try:
+            content = request_ranking(category)
+        except Exception as e:
+            # 查詢失敗時保留舊的排行
+            print(f"刷新 {category} 排行時發生錯誤：{str(e)}")
+            continue
+        if not content or is_refusal(content):
+            print(f"{category} 排行內容無效，略過")
+            continue
+        store.save(category, content)
+        refreshed.append(category)
+        print(f"已刷新 {category} 排行，耗時 {time.monotonic() - started:.1f} 秒")
+    return refreshed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="預先產生常見類型的熱門排行")
+    parser.add_argument("--interval", type=float, default=0, help="定期執行的間隔秒數（0 表示只執行一次）")
+    parser.add_argument("--categories", help="以逗號分隔的產品類型（預設為 RANKING_CATEGORIES）")
+    parser.add_argument("--rate", type=float, default=RANKING_REFRESH_RATE, help="每秒查詢次數上限")
+    args = parser.parse_args(argv)
+
+    # 載入環境變數並設定OpenAI API
+    load_dotenv()
+    openai.api_key = os.environ.get('OPENAI_API_KEY')
+    categories = [c.strip() for c in args.categories.split(",") if c.strip()] if args.categories else None
+
+    while True:
+        refreshed = refresh_rankings(categories, rate=args.rate)
+        print(f"排行刷新完成：{len(refreshed)} 個類型")
+        if not args.interval:
+            return 0 if refreshed else 1
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
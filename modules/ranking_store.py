@@ -0,0 +1,103 @@
+import os
+import datetime
+import threading
+from modules.sqlite_db import SQLiteDatabase
+from modules.response_cache import normalize_text
+from modules.metrics import register_collector
+
+# 預先產生的熱門排行設定
+RANKING_DB_PATH = os.environ.get('RANKING_DB_PATH', "data/rankings.db")
+RANKING_CATEGORIES = [
+    category.strip()
+    for category in os.environ.get('RANKING_CATEGORIES', "手機,筆電,耳機,平板").split(",")
+    if category.strip()
+]  # 定期預先產生排行的產品類型
+RANKING_MAX_AGE = float(os.environ.get('RANKING_MAX_AGE', 24 * 3600))  # 超過此秒數的排行不再使用，改為即時查詢
+
+# 常見的類型別名，對應到預先產生的類型
+CATEGORY_ALIASES = {
+    "手機": ["智慧型手機", "智能手機", "智慧手機", "smartphone", "phone"],
+    "筆電": ["筆記型電腦", "筆記本電腦", "筆記本", "筆電電腦", "laptop", "notebook"],
+    "耳機": ["無線耳機", "藍牙耳機", "藍芽耳機", "earphone", "earbuds", "headphone", "headphones"],
+    "平板": ["平板電腦", "tablet", "ipad"],
+}
+
+_ALIAS_LOOKUP = {
+    normalize_text(alias): category
+    for category, aliases in CATEGORY_ALIASES.items()
+    for alias in [category] + aliases
+}
+
+
+def category_key(product_type):
+    """產品類型的查詢鍵：別名對應到同一個類型，其餘以正規化的文字為鍵"""
+    key = normalize_text(product_type)
+    return normalize_text(_ALIAS_LOOKUP.get(key, key))
+
+
+class RankingStore:
+    """預先產生的熱門排行，每個類型只保留最新一份並記錄產生時間"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rankings (
+        category_key TEXT PRIMARY KEY,
+        category TEXT NOT NULL,
+        content TEXT NOT NULL,
+        generated_at TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path=RANKING_DB_PATH):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+
+    def save(self, category, content, generated_at=None):
+        """寫入（覆寫）類型的排行"""
+        generated_at = generated_at or datetime.datetime.now()
+        self.db.execute(
+            "INSERT OR REPLACE INTO rankings (category_key, category, content, generated_at) VALUES (?, ?, ?, ?)",
+            (category_key(category), category, content, generated_at.isoformat(timespec='seconds'))
+        )
+
+    def get(self, product_type, max_age=RANKING_MAX_AGE):
+        """取得類型的排行，回傳 {'category', 'content', 'generated_at'}；沒有或已過期時回傳 None"""
+        row = self.db.execute(
+            "SELECT category, content, generated_at FROM rankings WHERE category_key = ?",
+            (category_key(product_type),)
+        ).fetchone()
+        if row is None:
+            return None
+        generated_at = datetime.datetime.fromisoformat(row["generated_at"])
+        if max_age and (datetime.datetime.now() - generated_at).total_seconds() > max_age:
+            return None
+        return {"category": row["category"], "content": row["content"], "generated_at": generated_at}
+
+    def all(self):
+        """所有類型的排行產生時間（由舊到新）"""
+        rows = self.db.execute("SELECT category, generated_at FROM rankings ORDER BY generated_at").fetchall()
+        return [dict(row) for row in rows]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_ranking_store():
+    """取得排行儲存"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RankingStore()
+    return _store
+
+
+@register_collector
+def _ranking_metrics():
+    """各類型預先產生的排行距今的秒數"""
+    if _store is None:
+        return []
+    now = datetime.datetime.now()
+    return [("linebot_ranking_age_seconds", "gauge", "Age of each precomputed popular ranking", [
+        ({"category": row["category"]}, round((now - datetime.datetime.fromisoformat(row["generated_at"])).total_seconds()))
+        for row in _store.all()
+    ])]
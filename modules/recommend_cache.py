@@ -0,0 +1,262 @@
+import os
+import re
+import time
+import bisect
+import threading
+from collections import OrderedDict
+from modules.product_names import fold_text
+from modules.ranking_store import CATEGORY_ALIASES, category_key
+from modules.response_cache import FEATURE_TTLS
+from modules.metrics import register_collector
+
+# 推薦相似度快取設定
+RECOMMEND_CACHE_SIZE = int(os.environ.get('RECOMMEND_CACHE_SIZE', 512))  # 最多保留的推薦數（0 表示停用）
+RECOMMEND_CACHE_THRESHOLD = float(os.environ.get('RECOMMEND_CACHE_THRESHOLD', 0.6))  # 需求相似度達此值時使用快取的推薦
+RECOMMEND_BUDGET_BUCKETS = [
+    int(bound)
+    for bound in os.environ.get('RECOMMEND_BUDGET_BUCKETS', "5000,10000,15000,20000,25000,30000,40000,50000,70000,100000").split(",")
+    if bound.strip()
+]  # 預算區間的上界（元），同一區間的推薦可以互相使用
+
+# 預算金額：數字（可含千分位、小數）或中文數字，單位為萬、千、k、w
+_NUMBER = r'\d+(?:[.,]\d+)*|[一二兩三四五六七八九十]+'
+_AMOUNT = re.compile(
+    rf'(?:nt\$|\$|台幣)?\s*({_NUMBER})\s*(萬|千|k|w)?((?<=萬)(?:{_NUMBER}))?(?:千)?\s*(?:元|塊)?(?![a-z年月日號吋寸])'
+)
+_CN_DIGITS = {"一": 1, "二": 2, "兩": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_UNITS = {"萬": 10000, "w": 10000, "千": 1000, "k": 1000}
+
+# 金額前後表示上限、下限或大約的用詞
+_UPPER_AFTER = ("以內", "以下", "之內", "內", "有找", "為限")
+_LOWER_AFTER = ("以上", "起")
+_AROUND_AFTER = ("左右", "上下")
+_UPPER_BEFORE = ("不超過", "不要超過", "低於", "少於", "最多", "最高", "上限")
+_LOWER_BEFORE = ("至少", "超過", "高於", "最少")
+_RANGE_SEPARATORS = ("-", "~", "～", "到", "至", "—")
+
+# 比對需求時略過的用詞
+FILLER_WORDS = [
+    "預算", "推薦", "請問", "請", "我想要", "我想", "想要", "想", "我", "需要", "要", "買", "找",
+    "一台", "一支", "一個", "一副", "以內", "以下", "之內", "以上", "左右", "上下", "大概", "大約", "約",
+    "不超過", "最多", "至少", "有找", "台幣", "元", "的", "好", "比較", "適合", "可以", "能", "有",
+]
+_ASCII_WORD = re.compile(r'[a-z0-9+]*[a-z][a-z0-9+]*')
+_CJK_RUN = re.compile(r'[一-鿿]+')
+
+
+def _number(text):
+    if text[0].isdigit():
+        return float(text.replace(",", ""))
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        return _CN_DIGITS.get(tens, 1) * 10 + _CN_DIGITS.get(ones, 0)
+    value = 0
+    for char in text:
+        value = value * 10 + _CN_DIGITS.get(char, 0)
+    return value
+
+
+def parse_budget(text):
+    """解析需求中的預算，回傳 ((下限, 上限), 去掉預算後的文字)；沒有預算時為 (None, 文字)
+
+    只寫一個金額時視為上限，例如「預算兩萬」與「2萬以內」都是 (None, 20000)。
+    """
+    text = fold_text(text)
+    amounts = []
+    for match in _AMOUNT.finditer(text):
+        unit = _UNITS.get(match.group(2), 1)
+        value = _number(match.group(1)) * unit
+        if match.group(3):
+            extra = _number(match.group(3))
+            value += extra * 1000 if extra < 10 else extra
+        amounts.append({"value": value, "unit": match.group(2), "start": match.start(), "end": match.end()})
+
+    budget, spans = None, []
+    i = 0
+    while i < len(amounts):
+        amount = amounts[i]
+        following = amounts[i + 1] if i + 1 < len(amounts) else None
+        if following and text[amount["end"]:following["start"]].strip() in _RANGE_SEPARATORS:
+            # 範圍：「1~2萬」的第一個金額沿用第二個金額的單位
+            low = amount["value"]
+            if not amount["unit"] and following["unit"]:
+                low *= _UNITS[following["unit"]]
+            if low >= 1000 and following["value"] >= 1000:
+                budget = (min(low, following["value"]), max(low, following["value"]))
+                spans.append((amount["start"], following["end"]))
+            i += 2
+            continue
+        i += 1
+        value = amount["value"]
+        if value < 1000:
+            continue
+        before = text[:amount["start"]].rstrip()
+        after = text[amount["end"]:].lstrip()
+        if after.startswith(_UPPER_AFTER) or before.endswith(_UPPER_BEFORE):
+            budget = (None, value)
+        elif after.startswith(_LOWER_AFTER) or before.endswith(_LOWER_BEFORE):
+            budget = (value, None)
+        elif after.startswith(_AROUND_AFTER) or before.endswith(("約", "大約", "大概")):
+            budget = (value * 0.9, value * 1.1)
+        else:
+            budget = (None, value)
+        spans.append((amount["start"], amount["end"]))
+
+    for start, end in reversed(spans):
+        text = text[:start] + " " + text[end:]
+    return budget, text
+
+
+def budget_bucket(budget):
+    """預算所屬的區間；只有下限時另成一組（「2萬以上」與「2萬以內」不共用推薦）"""
+    if budget is None:
+        return None
+    low, high = budget
+    if high is None:
+        return ("above", bisect.bisect_left(RECOMMEND_BUDGET_BUCKETS, low))
+    value = high if low is None else (low + high) / 2
+    return ("within", bisect.bisect_left(RECOMMEND_BUDGET_BUCKETS, value))
+
+
+def need_tokens(text, device_type=None):
+    """需求的比對詞：英文單字，中文則取單字與相鄰兩字"""
+    text = fold_text(text)
+    category = category_key(device_type) if device_type else None
+    for word in sorted(
+        [device_type or ""] + [alias for name, aliases in CATEGORY_ALIASES.items()
+                               if category_key(name) == category for alias in [name] + aliases],
+        key=len, reverse=True
+    ):
+        if word:
+            text = text.replace(fold_text(word), " ")
+    for word in FILLER_WORDS:
+        text = text.replace(word, " ")
+
+    tokens = set(_ASCII_WORD.findall(text))
+    for run in _CJK_RUN.findall(text):
+        tokens.update(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return frozenset(tokens)
+
+
+def similarity(tokens1, tokens2):
+    """兩組比對詞的 Jaccard 相似度；兩者都沒有需求時視為相同"""
+    if not tokens1 and not tokens2:
+        return 1.0
+    return len(tokens1 & tokens2) / len(tokens1 | tokens2)
+
+
+def request_signature(device_type, requirements):
+    """推薦請求的分組鍵（裝置類型、預算區間）與需求比對詞"""
+    budget, needs = parse_budget(requirements)
+    group = (category_key(device_type) if device_type else None, budget_bucket(budget))
+    return group, need_tokens(needs, device_type)
+
+
+class RecommendationCache:
+    """裝置類型與預算區間相同、需求相似的推薦可以互相使用；依最久未使用淘汰"""
+
+    def __init__(self, max_size=RECOMMEND_CACHE_SIZE, threshold=RECOMMEND_CACHE_THRESHOLD,
+                 ttl=FEATURE_TTLS["product_recommend"]):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self._entries = OrderedDict()  # entry_id -> (group, tokens, expires_at, content)
+        self._groups = {}  # group -> {entry_id}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, entry_id):
+        group = self._entries.pop(entry_id)[0]
+        members = self._groups[group]
+        members.discard(entry_id)
+        if not members:
+            del self._groups[group]
+
+    def _find(self, group, tokens, now):
+        """同一組中相似度最高且達門檻的項目"""
+        best_id, best_score = None, self.threshold
+        for entry_id in list(self._groups.get(group, ())):
+            _, entry_tokens, expires_at, _ = self._entries[entry_id]
+            if expires_at <= now:
+                self._remove(entry_id)
+                self.expirations += 1
+                continue
+            score = similarity(tokens, entry_tokens)
+            if score >= best_score:
+                best_id, best_score = entry_id, score
+        return best_id
+
+    def get(self, device_type, requirements):
+        """取得相似需求的推薦；沒有時回傳 None"""
+        if not self.max_size:
+            return None
+        group, tokens = request_signature(device_type, requirements)
+        with self._lock:
+            entry_id = self._find(group, tokens, time.monotonic())
+            if entry_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id][3]
+
+    def contains(self, device_type, requirements):
+        """是否有相似需求的推薦（不影響命中統計與 LRU 順序）"""
+        if not self.max_size:
+            return False
+        group, tokens = request_signature(device_type, requirements)
+        now = time.monotonic()
+        with self._lock:
+            return any(
+                self._entries[entry_id][2] > now and similarity(tokens, self._entries[entry_id][1]) >= self.threshold
+                for entry_id in self._groups.get(group, ())
+            )
+
+    def put(self, device_type, requirements, content):
+        """保存推薦，超過容量時淘汰最久未使用的項目"""
+        if not self.max_size:
+            return
+        group, tokens = request_signature(device_type, requirements)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (group, tokens, time.monotonic() + self.ttl, content)
+            self._groups.setdefault(group, set()).add(entry_id)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        """回傳命中、未命中與淘汰次數"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# 全域共用的推薦相似度快取
+recommend_cache = RecommendationCache()
+
+
+@register_collector
+def _recommend_cache_metrics():
+    """推薦相似度快取的統計"""
+    stats = recommend_cache.stats()
+    return [
+        ("linebot_recommend_cache_hits_total", "counter", "Recommendations served from a similar cached request", [({}, stats["hits"])]),
+        ("linebot_recommend_cache_misses_total", "counter", "Recommendation similarity cache misses", [({}, stats["misses"])]),
+        ("linebot_recommend_cache_evictions_total", "counter", "Recommendation similarity cache LRU evictions", [({}, stats["evictions"])]),
+        ("linebot_recommend_cache_entries", "gauge", "Recommendation similarity cache entries", [({}, stats["size"])]),
+    ]
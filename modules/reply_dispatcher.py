@@ -0,0 +1,220 @@
+import os
+import time
+import threading
+from collections import deque
+from linebot.models import TextSendMessage
+from linebot.exceptions import LineBotApiError
+from modules import deadline
+from modules.event_queue import event_executor, QueueFullError
+from modules.line_client import is_reply_token_expired, keep_undelivered
+from modules.metrics import REPLY_ROUTES_TOTAL
+
+# 回覆路由設定
+ACK_TEXT = "查詢中…"
+REPLY_SAFETY_MARGIN = float(os.environ.get('REPLY_SAFETY_MARGIN', 5))  # 預留給回覆送達的秒數
+REPLY_PUSH_FALLBACK = os.environ.get('REPLY_PUSH_FALLBACK', '1') == '1'  # reply token 失效時改用 push
+
+# 背景查詢等待「查詢中…」送出的最長秒數，避免結果比確認訊息先送達
+ACK_WAIT_SECONDS = 10
+
+# 估計各功能耗時所用的樣本數與百分位數
+LATENCY_WINDOW = 50
+LATENCY_PERCENTILE = 0.9
+
+# 目前執行緒正在處理的事件
+_local = threading.local()
+
+
+class EventContext:
+    """處理中事件的用戶與時間戳，決定回覆路由所需的資訊"""
+
+    __slots__ = ("user_id", "timestamp")
+
+    def __init__(self, user_id, timestamp):
+        self.user_id = user_id
+        self.timestamp = timestamp
+
+
+def begin_event(user_id, timestamp):
+    """登記目前執行緒開始處理的事件"""
+    _local.event = EventContext(user_id, timestamp or time.time() * 1000)
+
+
+def current_event():
+    return getattr(_local, 'event', None)
+
+
+class LatencyTracker:
+    """記錄各功能最近的耗時，以百分位數估計下一次查詢需要多久"""
+
+    def __init__(self, window=LATENCY_WINDOW, percentile=LATENCY_PERCENTILE):
+        self.window = window
+        self.percentile = percentile
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, feature, seconds):
+        with self._lock:
+            samples = self._samples.get(feature)
+            if samples is None:
+                samples = self._samples[feature] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def estimate(self, feature):
+        """預估耗時（秒）；還沒有樣本時回傳 0"""
+        with self._lock:
+            samples = sorted(self._samples.get(feature, ()))
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile))]
+
+
+class ReplyDispatcher:
+    """依 reply token 剩餘時間決定直接回覆，或先回覆「查詢中…」再以 push 送出結果"""
+
+    def __init__(self, executor=event_executor):
+        self.latency = LatencyTracker()
+        # 背景查詢與 webhook 事件共用有界的執行緒池，佇列滿時改為直接回覆，關閉時一併排空
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._deferred = {}  # (user_id, feature) -> 背景查詢中的數量
+        self._latest = {}  # (user_id, feature) -> 最近一次同功能查詢的事件時間戳（僅記錄有背景查詢的功能）
+
+    def reply(self, line_bot_api, reply_token, messages):
+        """以 reply token 回覆；token 已失效時改用 push，回傳是否送達"""
+        event = current_event()
+        try:
+            line_bot_api.reply_message(reply_token, messages)
+            REPLY_ROUTES_TOTAL.inc(route="reply")
+        except LineBotApiError as e:
+            if not is_reply_token_expired(e):
+                print(f"LINE API Error when replying: {str(e)}")
+                return False
+            if not (REPLY_PUSH_FALLBACK and event and event.user_id):
+                # 無法改用 push，保留給重送的事件補送
+                keep_undelivered(messages)
+                return False
+            print("Reply token expired, sending push message instead")
+            if not self._push(line_bot_api, event.user_id, messages):
+                return False
+            REPLY_ROUTES_TOTAL.inc(route="push_fallback")
+        return True
+
+    def respond(self, line_bot_api, reply_token, feature, produce, ready=None):
+        """執行可能很慢的查詢並送出結果
+
+        produce() 回傳要送出的訊息；ready() 回傳 True 表示結果已在快取中，可直接回覆。
+        依該功能最近的耗時預估，若趕不上 reply token 的期限，先回覆「查詢中…」，
+        查詢改由背景執行緒完成後以 push 送出，不佔用該用戶的事件序列；
+        背景佇列已滿時仍在目前的執行緒查詢並直接回覆。
+        """
+        event = current_event()
+        if event:
+            self._mark_requested(event, feature)
+        if self._should_defer(feature, event, ready):
+            acked = threading.Event()
+            try:
+                self._defer(line_bot_api, event, feature, produce, acked)
+            except QueueFullError:
+                print(f"Deferred queue is full, answering {feature} directly")
+            else:
+                try:
+                    line_bot_api.reply_message(reply_token, TextSendMessage(text=ACK_TEXT))
+                except LineBotApiError as e:
+                    print(f"LINE API Error when acknowledging: {str(e)}")
+                finally:
+                    acked.set()
+                REPLY_ROUTES_TOTAL.inc(route="deferred")
+                return
+
+        self.reply(line_bot_api, reply_token, self._produce(feature, produce))
+
+    def _should_defer(self, feature, event, ready):
+        if not (REPLY_PUSH_FALLBACK and event and event.user_id):
+            return False
+        remaining = deadline.remaining()
+        if remaining is None:
+            return False
+        if ready is not None and ready():
+            return False
+        return self.latency.estimate(feature) > remaining - REPLY_SAFETY_MARGIN
+
+    def _produce(self, feature, produce):
+        started = time.monotonic()
+        try:
+            return produce()
+        finally:
+            self.latency.record(feature, time.monotonic() - started)
+
+    def _defer(self, line_bot_api, event, feature, produce, acked):
+        """提交背景查詢；佇列已滿時拋出 QueueFullError"""
+        key = (event.user_id, feature)
+        with self._lock:
+            self._deferred[key] = self._deferred.get(key, 0) + 1
+            self._latest[key] = max(self._latest.get(key, 0), event.timestamp)
+        try:
+            self._executor.submit(self._run_deferred, line_bot_api, event, feature, produce, acked)
+        except QueueFullError:
+            self._finish_deferred(key)
+            raise
+
+    def _finish_deferred(self, key):
+        with self._lock:
+            count = self._deferred.get(key, 1) - 1
+            if count:
+                self._deferred[key] = count
+            else:
+                self._deferred.pop(key, None)
+                self._latest.pop(key, None)
+
+    def _run_deferred(self, line_bot_api, event, feature, produce, acked):
+        # 結果以 push 送出，不受 reply token 期限限制
+        deadline.clear_deadline()
+        try:
+            # 用戶在等待期間又送出同一功能的新查詢，取消尚未開始的舊查詢
+            if self.is_superseded(event, feature):
+                REPLY_ROUTES_TOTAL.inc(route="cancelled")
+                return
+            # 已經開始的查詢一定送出結果
+            messages = self._produce(feature, produce)
+            acked.wait(ACK_WAIT_SECONDS)
+            if self._push(line_bot_api, event.user_id, messages):
+                REPLY_ROUTES_TOTAL.inc(route="push")
+        except Exception as e:
+            print(f"Error in deferred {feature} reply: {str(e)}")
+            self._push(line_bot_api, event.user_id, TextSendMessage(text="處理您的請求時發生錯誤，請稍後再試。"))
+        finally:
+            self._finish_deferred((event.user_id, feature))
+
+    def _push(self, line_bot_api, user_id, messages):
+        try:
+            line_bot_api.push_message(user_id, messages)
+            return True
+        except LineBotApiError as e:
+            print(f"Failed to send push message: {str(e)}")
+            return False
+
+    def _mark_requested(self, event, feature):
+        key = (event.user_id, feature)
+        with self._lock:
+            if key in self._deferred:
+                self._latest[key] = max(self._latest.get(key, 0), event.timestamp)
+
+    def is_superseded(self, event, feature):
+        """用戶是否在這個事件之後又送出了同一功能的查詢"""
+        with self._lock:
+            return self._latest.get((event.user_id, feature), 0) > event.timestamp
+
+
+# 全域共用的回覆分派器
+reply_dispatcher = ReplyDispatcher()
+
+
+def reply(line_bot_api, reply_token, messages):
+    """回覆目前處理中的事件（reply token 失效時改用 push）"""
+    return reply_dispatcher.reply(line_bot_api, reply_token, messages)
+
+
+def respond(line_bot_api, reply_token, feature, produce, ready=None):
+    """執行查詢並依 reply token 剩餘時間選擇回覆方式"""
+    reply_dispatcher.respond(line_bot_api, reply_token, feature, produce, ready)
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import hashlib
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+from modules.metrics import register_collector
+
+# 日誌設定
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # 等待寫出的日誌上限，超過時丟棄
+LOG_BODY_SAMPLE_RATE = float(os.environ.get('LOG_BODY_SAMPLE_RATE', 0))  # 記錄完整 webhook 內容的比例（0 到 1）
+LOG_USER_SALT = os.environ.get('LOG_USER_SALT', '')  # 雜湊用戶 ID 時加入的鹽
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """把日誌放進佇列後立即返回；佇列已滿時丟棄，不讓日誌拖慢請求"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # 同一程序內的佇列不需要序列化，訊息格式化交給背景執行緒
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆日誌輸出一行 JSON，結構化欄位放在 record.fields"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+_handler = None
+_listener = None
+
+
+def setup_logging(logger, level=logging.INFO, stream=None):
+    """將 logger 改為經由佇列輸出，實際寫入由背景執行緒完成"""
+    global _handler, _listener
+    if _listener is None:
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter())
+        _handler = NonBlockingQueueHandler(log_queue)
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return _listener
+
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """記錄一筆結構化日誌"""
+    if logger.isEnabledFor(level):
+        fields["event"] = event
+        logger.log(level, event, extra={"fields": fields})
+
+
+def hash_user_id(user_id):
+    """以雜湊代替用戶 ID，日誌中可以關聯同一位用戶但看不到原始 ID"""
+    if not user_id:
+        return None
+    return hashlib.sha256(f"{LOG_USER_SALT}{user_id}".encode("utf-8")).hexdigest()[:16]
+
+
+def should_log_body(rate=LOG_BODY_SAMPLE_RATE):
+    """依取樣比例決定是否記錄完整的 webhook 內容"""
+    return rate > 0 and random.random() < rate
+
+
+@register_collector
+def _log_metrics():
+    """因佇列已滿而丟棄的日誌數"""
+    dropped = _handler.dropped if _handler else 0
+    return [("linebot_log_dropped_total", "counter", "Log records dropped because the log queue was full", [({}, dropped)])]
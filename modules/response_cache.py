@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+import functools
+from collections import OrderedDict
+from modules import deadline
+from modules.single_flight import SingleFlight
+
+# 快取容量上限（筆數）
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+
+# 各功能的快取存活時間（秒）：規格可保存數天，排行數小時，價格數分鐘
+FEATURE_TTLS = {
+    "product_query": 3 * 24 * 3600,
+    "product_compare": 3 * 24 * 3600,
+    "product_review": 24 * 3600,
+    "popular_ranking": 6 * 3600,
+    "product_recommend": 6 * 3600,
+    "price_query": 10 * 60,
+}
+DEFAULT_TTL = 10 * 60
+
+
+def normalize_text(value):
+    """正規化查詢參數，讓大小寫與空白不同的相同查詢對應到同一個鍵"""
+    if value is None:
+        return None
+    return " ".join(str(value).split()).casefold()
+
+
+class ResponseCache:
+    """具容量上限與存活時間的 LRU 快取"""
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """取得快取值；不存在或已過期時回傳 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def contains(self, key):
+        """檢查是否有未過期的快取值（不影響命中統計與 LRU 順序）"""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def set(self, key, value, ttl):
+        """寫入快取，超過容量時淘汰最久未使用的項目"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """回傳命中、未命中與淘汰次數"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# 全域共用的回應快取
+response_cache = ResponseCache()
+
+# 合併相同查詢的並行 LLM 呼叫
+in_flight = SingleFlight()
+
+
+def cached(feature, ttl=None, normalize=normalize_text):
+    """以功能名稱加上正規化參數作為鍵，快取 LLM 查詢結果並合併相同的並行查詢
+
+    normalize 用於將每個參數轉換為鍵，產品相關功能應傳入 canonical_key，
+    讓「iphone15pro」與「iPhone 15 Pro」命中同一筆快取。
+    """
+    if ttl is None:
+        ttl = FEATURE_TTLS.get(feature, DEFAULT_TTL)
+
+    def decorator(func):
+        def make_key(args):
+            return (feature,) + tuple(normalize(arg) for arg in args)
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = make_key(args)
+            value = response_cache.get(key)
+            if value is not None:
+                return value
+
+            def load():
+                result = func(*args)
+                if result:
+                    response_cache.set(key, result, ttl)
+                return result
+
+            # 相同查詢正在進行時等待其結果，但不超過呼叫者的 reply token 截止時間
+            return in_flight.do(key, load, timeout=deadline.remaining())
+
+        # 讓呼叫者在查詢前得知結果是否已在快取中（例如決定能否直接回覆）
+        wrapper.is_cached = lambda *args: response_cache.contains(make_key(args))
+        return wrapper
+    return decorator
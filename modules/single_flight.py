@@ -0,0 +1,62 @@
+import threading
+from modules.deadline import DeadlineExceeded
+
+
+class _Call:
+    """一個進行中的呼叫，完成後通知所有等待者"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """合併相同鍵的並行呼叫：只有第一個呼叫者實際執行，其餘等待並共用結果"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, timeout=None):
+        """執行 fn 或等待進行中的相同呼叫；等待超過 timeout 秒時拋出 DeadlineExceeded"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(timeout):
+            # 錯誤訊息會回覆給用戶，鍵只記錄在日誌中
+            print(f"Timed out waiting for in-flight call {key!r}")
+            raise DeadlineExceeded("查詢逾時，請稍後再試")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        """回傳實際執行與被合併的呼叫次數"""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+            }
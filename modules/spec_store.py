@@ -0,0 +1,77 @@
+import os
+import json
+import datetime
+import threading
+from modules.sqlite_db import SQLiteDatabase
+from modules.product_names import canonical_key
+
+# 結構化規格資料庫設定
+SPEC_DB_PATH = os.environ.get('SPEC_DB_PATH', "data/specs.db")
+SPEC_MAX_AGE = float(os.environ.get('SPEC_MAX_AGE', 30 * 24 * 3600))  # 超過此秒數的規格重新查詢
+
+# 規格欄位與顯示名稱（依顯示順序）
+SPEC_FIELDS = [
+    ("soc", "處理器"),
+    ("ram", "記憶體"),
+    ("storage", "儲存空間"),
+    ("display", "螢幕"),
+    ("battery", "電池"),
+    ("camera", "相機"),
+    ("weight", "重量"),
+    ("release_date", "上市日期"),
+]
+
+
+class SpecStore:
+    """每個標準產品一筆結構化規格（JSON），供規格查詢與產品比較共用"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS product_specs (
+        canonical_name TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        specs TEXT NOT NULL,
+        fetched_at TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path=SPEC_DB_PATH, max_age=SPEC_MAX_AGE):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+        self.max_age = max_age
+
+    def save(self, name, specs):
+        """寫入（覆寫）產品的規格，specs 為 {欄位: 值} 與 is_3c"""
+        self.db.execute(
+            "INSERT OR REPLACE INTO product_specs (canonical_name, name, specs, fetched_at) VALUES (?, ?, ?, ?)",
+            (canonical_key(name), name, json.dumps(specs, ensure_ascii=False),
+             datetime.datetime.now().isoformat(timespec='seconds'))
+        )
+
+    def get(self, name):
+        """取得產品的規格記錄 {'name', 'specs', 'fetched_at'}；沒有或已過期時回傳 None"""
+        row = self.db.execute(
+            "SELECT name, specs, fetched_at FROM product_specs WHERE canonical_name = ?",
+            (canonical_key(name),)
+        ).fetchone()
+        if row is None:
+            return None
+        fetched_at = datetime.datetime.fromisoformat(row["fetched_at"])
+        if self.max_age and (datetime.datetime.now() - fetched_at).total_seconds() > self.max_age:
+            return None
+        return {"name": row["name"], "specs": json.loads(row["specs"]), "fetched_at": fetched_at}
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM product_specs").fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_spec_store():
+    """取得規格儲存"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SpecStore()
+    return _store
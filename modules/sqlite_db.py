@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteDatabase:
+    """以 WAL 模式開啟的 SQLite 資料庫，每個執行緒使用自己的連線，可跨 gunicorn worker 共用"""
+
+    def __init__(self, path, schema="", timeout=10):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if schema:
+            self.connection().executescript(schema)
+
+    def connection(self):
+        """取得目前執行緒的連線"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None：預設自動提交，多個語句時才明確開啟交易
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql, params=()):
+        """執行單一語句（自動提交）"""
+        return self.connection().execute(sql, params)
+
+    def executemany(self, sql, rows):
+        """以同一語句寫入多筆資料（自動提交）"""
+        return self.connection().executemany(sql, rows)
+
+    @contextmanager
+    def transaction(self):
+        """開啟寫入交易，區塊結束時提交，發生錯誤時回滾"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
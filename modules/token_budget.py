@@ -0,0 +1,142 @@
+import os
+import math
+import threading
+from collections import deque
+from modules.metrics import register_collector
+
+# token 預算設定
+TOKEN_BUDGET_ADAPTIVE = os.environ.get('TOKEN_BUDGET_ADAPTIVE', '1') == '1'  # 依實際回覆長度調整 max_tokens
+TOKEN_BUDGET_WINDOW = int(os.environ.get('TOKEN_BUDGET_WINDOW', 200))  # 每個功能保留的回覆長度樣本數
+TOKEN_BUDGET_MIN_SAMPLES = int(os.environ.get('TOKEN_BUDGET_MIN_SAMPLES', 20))  # 樣本不足時沿用原本的 max_tokens
+TOKEN_BUDGET_PERCENTILE = float(os.environ.get('TOKEN_BUDGET_PERCENTILE', 0.99))  # 以此百分位數的回覆長度為準
+TOKEN_BUDGET_HEADROOM = float(os.environ.get('TOKEN_BUDGET_HEADROOM', 1.2))  # 在百分位數之上保留的倍數
+TOKEN_BUDGET_FLOOR = int(os.environ.get('TOKEN_BUDGET_FLOOR', 16))  # max_tokens 下限
+
+# 每百萬 token 的價格（美元），用於估算費用
+LLM_PRICE_INPUT = float(os.environ.get('LLM_PRICE_INPUT', 0.15))
+LLM_PRICE_OUTPUT = float(os.environ.get('LLM_PRICE_OUTPUT', 0.60))
+
+# 改版前各功能的 max_tokens，調整後的 max_tokens 不會超過原本的設定
+# （原本的系統提示詞長度由 benchmarks/token_budget.py 從改版前的版本重新估算）
+BASELINES = {
+    "product_query": {"max_tokens": 1000},
+    "product_review": {"max_tokens": 1000},
+    "price_query": {"max_tokens": 1000},
+    "popular_ranking": {"max_tokens": 1000},
+    "product_compare": {"max_tokens": 1000},
+    "product_recommend": {"max_tokens": 1000},
+    "lowest_price": {"max_tokens": 50},
+    "spec_extract": {"max_tokens": 400},
+}
+DEFAULT_MAX_TOKENS = 1000
+
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓文字約一字一個 token，其他字元約四個一個 token"""
+    if not text:
+        return 0
+    wide = sum(1 for char in text if ord(char) >= 0x2E80)
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+class FeatureUsage:
+    """單一功能的 token 用量與耗時"""
+
+    def __init__(self, window):
+        self.completions = deque(maxlen=window)  # 最近的回覆 token 數
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.truncated = 0
+        self.seconds = 0.0
+
+
+class TokenBudget:
+    """記錄各功能的 token 用量，並依回覆長度分佈決定 max_tokens"""
+
+    def __init__(self, baselines=BASELINES, window=TOKEN_BUDGET_WINDOW, min_samples=TOKEN_BUDGET_MIN_SAMPLES,
+                 percentile=TOKEN_BUDGET_PERCENTILE, headroom=TOKEN_BUDGET_HEADROOM, adaptive=TOKEN_BUDGET_ADAPTIVE):
+        self.baselines = baselines
+        self.window = window
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.headroom = headroom
+        self.adaptive = adaptive
+        self._usage = {}
+        self._lock = threading.Lock()
+
+    def _get(self, feature):
+        usage = self._usage.get(feature)
+        if usage is None:
+            usage = self._usage[feature] = FeatureUsage(self.window)
+        return usage
+
+    def baseline_max_tokens(self, feature):
+        return self.baselines.get(feature, {}).get("max_tokens", DEFAULT_MAX_TOKENS)
+
+    def max_tokens(self, feature):
+        """這次呼叫的 max_tokens：回覆長度百分位數乘上保留倍數，介於下限與原本設定之間"""
+        ceiling = self.baseline_max_tokens(feature)
+        if not self.adaptive:
+            return ceiling
+        with self._lock:
+            samples = sorted(self._get(feature).completions)
+        if len(samples) < self.min_samples:
+            return ceiling
+        index = min(len(samples) - 1, math.ceil(len(samples) * self.percentile) - 1)
+        return max(TOKEN_BUDGET_FLOOR, min(ceiling, math.ceil(samples[index] * self.headroom)))
+
+    def record(self, feature, prompt_tokens, completion_tokens, seconds, truncated=False):
+        """記錄一次呼叫；因 max_tokens 而截斷的回覆以原本的上限計入樣本，讓下一次的預算回升"""
+        with self._lock:
+            usage = self._get(feature)
+            usage.calls += 1
+            usage.prompt_tokens += prompt_tokens
+            usage.completion_tokens += completion_tokens
+            usage.seconds += seconds
+            if truncated:
+                usage.truncated += 1
+                usage.completions.append(self.baseline_max_tokens(feature))
+            else:
+                usage.completions.append(completion_tokens)
+
+    def report(self):
+        """各功能的平均用量、費用與耗時，以及目前與改版前的 max_tokens"""
+        with self._lock:
+            features = {feature: usage for feature, usage in self._usage.items() if usage.calls}
+            snapshot = {
+                feature: (usage.calls, usage.prompt_tokens, usage.completion_tokens, usage.truncated, usage.seconds)
+                for feature, usage in features.items()
+            }
+        rows = {}
+        for feature, (calls, prompt_tokens, completion_tokens, truncated, seconds) in snapshot.items():
+            prompt_avg = prompt_tokens / calls
+            completion_avg = completion_tokens / calls
+            cost = (prompt_avg * LLM_PRICE_INPUT + completion_avg * LLM_PRICE_OUTPUT) / 1e6
+            rows[feature] = {
+                "calls": calls,
+                "prompt_tokens_avg": round(prompt_avg, 1),
+                "completion_tokens_avg": round(completion_avg, 1),
+                "max_tokens": self.max_tokens(feature),
+                "baseline_max_tokens": self.baseline_max_tokens(feature),
+                "truncated": truncated,
+                "cost_per_call": cost,
+                "seconds_avg": seconds / calls,
+            }
+        return rows
+
+
+# 全域共用的 token 預算
+token_budget = TokenBudget()
+
+
+@register_collector
+def _token_budget_metrics():
+    """目前各功能的 max_tokens 與被截斷的回覆數"""
+    rows = token_budget.report()
+    return [
+        ("linebot_llm_max_tokens", "gauge", "Current adaptive max_tokens per feature",
+         [({"feature": feature}, row["max_tokens"]) for feature, row in sorted(rows.items())]),
+        ("linebot_llm_truncated_total", "counter", "Completions cut off by max_tokens per feature",
+         [({"feature": feature}, row["truncated"]) for feature, row in sorted(rows.items())]),
+    ]
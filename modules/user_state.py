@@ -1,45 +1,270 @@
+import os
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from modules.sqlite_db import SQLiteDatabase
+
+# 用戶狀態儲存方式："memory"（單一程序）或 "sqlite"（多個 worker 共用）
+USER_STATE_BACKEND = os.environ.get('USER_STATE_BACKEND', 'memory')
+USER_STATE_DB_PATH = os.environ.get('USER_STATE_DB_PATH', "data/user_states.db")
+USER_STATE_TIMEOUT = 1800  # 30 分鐘無活動即過期
+USER_STATE_MAX_ENTRIES = int(os.environ.get('USER_STATE_MAX_ENTRIES', 100000))  # 記憶體中最多保留的用戶數
+USER_STATE_SWEEP_INTERVAL = float(os.environ.get('USER_STATE_SWEEP_INTERVAL', 60))  # 背景淘汰過期狀態的間隔秒數（0 表示停用）
+
 class UserState:
     """用戶狀態管理類"""
     
+    # 使用 __slots__ 減少每位用戶狀態佔用的記憶體
+    __slots__ = ("current_state", "waiting_for_input", "context", "last_activity_time")
+    
     def __init__(self):
         self.current_state = None  # 當前狀態（功能）
         self.waiting_for_input = False  # 是否等待用戶輸入
-        self.context = {}  # 上下文數據存儲
+        self.context = None  # 上下文數據存儲（需要時才建立）
         self.last_activity_time = None  # 最後活動時間
     
     def set_state(self, state, waiting_for_input=False):
         """設置當前狀態"""
-        import time
         self.current_state = state
         self.waiting_for_input = waiting_for_input
         self.last_activity_time = time.time()  # 更新最後活動時間
         
     def reset(self):
         """重置狀態"""
-        import time
         self.current_state = None
         self.waiting_for_input = False
-        self.context = {}
+        self.context = None
         self.last_activity_time = time.time()  # 更新最後活動時間
     
     def set_context(self, key, value):
         """設置上下文數據"""
-        import time
+        if self.context is None:
+            self.context = {}
         self.context[key] = value
         self.last_activity_time = time.time()  # 更新最後活動時間
     
     def get_context(self, key, default=None):
         """獲取上下文數據"""
+        if self.context is None:
+            return default
         return self.context.get(key, default)
     
-    def is_expired(self, timeout_seconds=1800):  # 預設 30 分鐘超時
+    def is_expired(self, timeout_seconds=USER_STATE_TIMEOUT):  # 預設 30 分鐘超時
         """檢查用戶狀態是否已過期"""
-        import time
         if self.last_activity_time is None:
             return False
         return (time.time() - self.last_activity_time) > timeout_seconds
     
     def update_activity_time(self):
         """更新最後活動時間"""
-        import time
-        self.last_activity_time = time.time()
\ No newline at end of file
+        self.last_activity_time = time.time()
+    
+    def to_dict(self):
+        """轉換為可序列化的字典"""
+        return {
+            "current_state": self.current_state,
+            "waiting_for_input": self.waiting_for_input,
+            "context": self.context or {},
+            "last_activity_time": self.last_activity_time,
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        """從字典還原用戶狀態"""
+        state = cls()
+        state.current_state = data.get("current_state")
+        state.waiting_for_input = bool(data.get("waiting_for_input"))
+        state.context = data.get("context") or None
+        state.last_activity_time = data.get("last_activity_time")
+        return state
+
+
+class UserStateStore(ABC):
+    """用戶狀態儲存介面"""
+    
+    @abstractmethod
+    def get(self, user_id):
+        """取得用戶狀態，不存在時回傳新的 UserState"""
+    
+    @abstractmethod
+    def save(self, user_id, state):
+        """保存用戶狀態"""
+    
+    @abstractmethod
+    def delete(self, user_id):
+        """刪除用戶狀態"""
+    
+    @abstractmethod
+    def update_context(self, user_id, key, value):
+        """只更新用戶上下文中的一個值（不覆寫其他欄位），供請求以外的背景工作使用"""
+
+
+class InMemoryUserStateStore(UserStateStore):
+    """單一程序內的用戶狀態儲存：超過閒置時間自動淘汰，並以 LRU 限制總數"""
+    
+    # 每次存取最多順帶淘汰的過期項目數，避免單次請求延遲過長
+    SWEEP_BATCH = 64
+    
+    def __init__(self, max_entries=USER_STATE_MAX_ENTRIES, timeout_seconds=USER_STATE_TIMEOUT,
+                 sweep_interval=USER_STATE_SWEEP_INTERVAL):
+        self.max_entries = max_entries
+        self.timeout_seconds = timeout_seconds
+        # 依最後存取時間排序，最久未使用的在最前面
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+        # 沒有新請求時存取時的順帶淘汰不會執行，由背景執行緒定期淘汰閒置的狀態
+        self._closed = threading.Event()
+        if sweep_interval > 0:
+            threading.Thread(
+                target=self._sweep_loop, args=(sweep_interval,), name="user-state-sweep", daemon=True
+            ).start()
+    
+    def _sweep(self, limit):
+        """從最久未使用的一端淘汰已過期的狀態（需持有鎖）"""
+        cutoff = time.time() - self.timeout_seconds
+        while limit and self._states:
+            state = next(iter(self._states.values()))
+            if (state.last_activity_time or 0) >= cutoff:
+                break
+            self._states.popitem(last=False)
+            self.expired += 1
+            limit -= 1
+    
+    def get(self, user_id):
+        with self._lock:
+            self._sweep(self.SWEEP_BATCH)
+            state = self._states.get(user_id)
+            if state is None:
+                state = UserState()
+                self._insert(user_id, state)
+            else:
+                self._states.move_to_end(user_id)
+            return state
+    
+    def save(self, user_id, state):
+        with self._lock:
+            self._insert(user_id, state)
+    
+    def _insert(self, user_id, state):
+        """寫入狀態，超過上限時淘汰最久未使用的用戶（需持有鎖）"""
+        self._states[user_id] = state
+        self._states.move_to_end(user_id)
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+            self.evicted += 1
+    
+    def delete(self, user_id):
+        with self._lock:
+            self._states.pop(user_id, None)
+    
+    def update_context(self, user_id, key, value):
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is not None:
+                state.set_context(key, value)
+    
+    def sweep(self):
+        """淘汰所有已過期的狀態，回傳淘汰數量；每批之間釋放鎖，不會長時間擋住請求"""
+        removed = 0
+        while True:
+            with self._lock:
+                before = len(self._states)
+                self._sweep(self.SWEEP_BATCH)
+                count = before - len(self._states)
+            removed += count
+            if count < self.SWEEP_BATCH:
+                return removed
+    
+    def _sweep_loop(self, interval):
+        while not self._closed.wait(interval):
+            self.sweep()
+    
+    def close(self):
+        """停止背景淘汰"""
+        self._closed.set()
+    
+    def __len__(self):
+        return len(self._states)
+
+
+class SQLiteUserStateStore(UserStateStore):
+    """以 SQLite（WAL）保存的用戶狀態，多個 gunicorn worker 共用同一份資料"""
+    
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS user_states (
+        user_id TEXT PRIMARY KEY,
+        current_state TEXT,
+        waiting_for_input INTEGER NOT NULL DEFAULT 0,
+        context TEXT,
+        last_activity_time REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_states_activity ON user_states (last_activity_time);
+    """
+    
+    # 清除過期狀態的間隔秒數
+    PURGE_INTERVAL = 60
+    
+    def __init__(self, path=USER_STATE_DB_PATH, timeout_seconds=USER_STATE_TIMEOUT):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+        self.timeout_seconds = timeout_seconds
+        self._next_purge = 0.0
+    
+    def get(self, user_id):
+        row = self.db.execute(
+            "SELECT current_state, waiting_for_input, context, last_activity_time FROM user_states WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        if row is None:
+            return UserState()
+        data = dict(row)
+        data["context"] = json.loads(data["context"]) if data["context"] else {}
+        return UserState.from_dict(data)
+    
+    def save(self, user_id, state):
+        self.db.execute(
+            "INSERT OR REPLACE INTO user_states (user_id, current_state, waiting_for_input, context, last_activity_time) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                user_id,
+                state.current_state,
+                int(state.waiting_for_input),
+                json.dumps(state.context, ensure_ascii=False) if state.context else None,
+                state.last_activity_time,
+            )
+        )
+        
+        # 定期清除閒置超過期限的狀態
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + self.PURGE_INTERVAL
+            self.purge_expired()
+    
+    def purge_expired(self):
+        """刪除閒置超過期限的狀態，回傳刪除數量"""
+        cursor = self.db.execute(
+            "DELETE FROM user_states WHERE last_activity_time < ?",
+            (time.time() - self.timeout_seconds,)
+        )
+        return cursor.rowcount
+    
+    def delete(self, user_id):
+        self.db.execute("DELETE FROM user_states WHERE user_id = ?", (user_id,))
+    
+    def update_context(self, user_id, key, value):
+        # 以 json_set 就地更新，不會蓋掉其他請求同時寫入的狀態
+        self.db.execute(
+            "UPDATE user_states SET context = json_set(COALESCE(context, '{}'), ?, json(?)), last_activity_time = ? "
+            "WHERE user_id = ?",
+            (f"$.{key}", json.dumps(value, ensure_ascii=False), time.time(), user_id)
+        )
+
+
+def create_user_state_store(backend=USER_STATE_BACKEND):
+    """依設定建立用戶狀態儲存"""
+    if backend == "sqlite":
+        return SQLiteUserStateStore()
+    return InMemoryUserStateStore()
@@ -1,69 +1,59 @@
 import os
-import json
 import datetime
 import re
-import openai
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from linebot.models import TextSendMessage, FlexSendMessage
 from linebot.exceptions import LineBotApiError
+from modules.wishlist_store import create_wishlist_store
+from modules.llm_gateway import chat_completion
+from modules.prompts import system_message
+from modules.reply_dispatcher import reply
 
-# 簡單的文件數據庫，用於存儲用戶的願望清單
-WISHLIST_DIR = "data/wishlists"
+# 價格尚未查詢完成的標記
+PRICE_PENDING = "pending"
 
-def ensure_wishlist_dir():
-    """確保願望清單目錄存在"""
-    os.makedirs(WISHLIST_DIR, exist_ok=True)
+# 背景查詢最低價格的執行緒池
+_price_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('WISHLIST_PRICE_WORKERS', 4)),
+    thread_name_prefix="wishlist-price"
+)
 
-def get_wishlist_path(user_id):
-    """獲取用戶願望清單文件路徑"""
-    ensure_wishlist_dir()
-    return os.path.join(WISHLIST_DIR, f"{user_id}.json")
+# 願望清單儲存（依 WISHLIST_BACKEND 設定，首次使用時建立）
+_store = None
+_store_lock = threading.Lock()
+
+def get_wishlist_store():
+    """取得願望清單儲存"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_wishlist_store()
+    return _store
 
 def load_wishlist(user_id):
     """載入用戶願望清單"""
-    wishlist_path = get_wishlist_path(user_id)
-    if os.path.exists(wishlist_path):
-        with open(wishlist_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+    return get_wishlist_store().load(user_id)
 
 def save_wishlist(user_id, wishlist):
     """保存用戶願望清單"""
-    wishlist_path = get_wishlist_path(user_id)
-    with open(wishlist_path, 'w', encoding='utf-8') as f:
-        json.dump(wishlist, f, ensure_ascii=False, indent=2)
+    get_wishlist_store().save(user_id, wishlist)
 
 def get_product_lowest_price(product_name):
     """獲取產品的最低價格"""
     try:
-        # 設定系統訊息
-        system_message = """
-        你是一個專業的3C產品價格查詢助手。請根據用戶提供的產品型號，提供該產品在台灣地區的最低價格信息。
-        
-        回覆要求：
-        1. 只提供台灣地區的商品最低價格，使用新台幣（NT$）為單位
-        2. 只返回一個數字，不要包含任何其他文字或符號
-        3. 如果找不到確切型號的價格，請返回「價格未知」
-        4. 重要：只回覆與3C產品（電腦、手機、平板、相機、耳機、智能手錶等電子產品）相關的內容
-        5. 如果用戶查詢的不是3C產品，請返回「非3C產品」
-        6. 在回答前，請先判斷查詢的產品是否為3C產品，如果不是，則返回上述訊息
-        """
-        
         # 設定用戶訊息
         user_message = f"請提供{product_name}在台灣地區的最低價格，只返回數字"
         
-        # 調用OpenAI API
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini-search-preview-2025-03-11",  # 使用支持網絡搜索的模型
-            messages=[
-                {"role": "system", "content": system_message},
+        # 透過OpenAI閘道調用API
+        price_text = chat_completion(
+            "lowest_price",
+            [
+                {"role": "system", "content": system_message("lowest_price")},
                 {"role": "user", "content": user_message}
-            ],
-            web_search_options={},  # 啟用網絡搜索
-            max_tokens=50
-        )
-        
-        # 提取回覆內容
-        price_text = response.choices[0].message.content.strip()
+            ]
+        ).strip()
         
         # 檢查是否為非3C產品
         if price_text == "非3C產品":
@@ -81,8 +71,12 @@ def get_product_lowest_price(product_name):
         print(f"獲取價格時發生錯誤：{str(e)}")
         return "價格未知"
 
-def add_to_wishlist(line_bot_api, reply_token, user_id, product_info):
-    """添加產品到願望清單"""
+def add_to_wishlist(line_bot_api, reply_token, user_id, product_info, quoted_price=None):
+    """添加產品到願望清單
+
+    quoted_price 為用戶剛才查詢價格時得到的最低價格（整數或「非3C產品」），
+    有值時直接寫入，不需要再查詢一次。
+    """
     try:
         # 解析產品信息
         if product_info.startswith("添加到願望清單:"):
@@ -90,62 +84,58 @@ def add_to_wishlist(line_bot_api, reply_token, user_id, product_info):
         else:
             product_name = product_info.strip()
         
-        # 載入願望清單
-        wishlist = load_wishlist(user_id)
+        # 剛查詢過價格且不是3C產品，不加入清單
+        if quoted_price == "非3C產品":
+            reply(
+                line_bot_api, reply_token,
+                TextSendMessage(text=f"很抱歉，我只能將3C電子產品添加到願望清單，無法添加 '{product_name}'。請嘗試添加電腦、手機、平板、相機、耳機、智能手錶等電子產品。")
+            )
+            return
+        
+        store = get_wishlist_store()
         
         # 檢查產品是否已在清單中
-        for item in wishlist:
-            if item.get('name') == product_name:
-                try:
-                    line_bot_api.reply_message(
-                        reply_token,
-                        TextSendMessage(text=f"產品 '{product_name}' 已在您的願望清單中。")
-                    )
-                except LineBotApiError as e:
-                    print(f"LINE API Error in add_to_wishlist (duplicate check): {str(e)}")
-                return
+        existing = store.find(user_id, product_name)
+        if existing:
+            reply(line_bot_api, reply_token, TextSendMessage(text=f"產品 '{existing['name']}' 已在您的願望清單中。"))
+            return
         
-        # 獲取產品最低價格
+        # 已知最低價格時直接寫入；否則先以「更新中」的價格添加，最低價格由背景工作補上
+        added = store.add(user_id, {
+            'name': product_name,
+            'lowest_price': quoted_price if isinstance(quoted_price, int) else PRICE_PENDING,
+            'added_at': datetime.datetime.now().isoformat(timespec='seconds')
+        })
+        if added and not isinstance(quoted_price, int):
+            _price_executor.submit(fill_lowest_price, line_bot_api, user_id, product_name)
+        
+        # 回覆用戶
+        reply(line_bot_api, reply_token, TextSendMessage(text=f"已將 '{product_name}' 添加到您的願望清單。"))
+    except Exception as e:
+        error_message = f"添加到願望清單時發生錯誤：{str(e)}"
+        reply(line_bot_api, reply_token, TextSendMessage(text=error_message))
+
+def fill_lowest_price(line_bot_api, user_id, product_name):
+    """背景查詢產品最低價格並寫回願望清單"""
+    try:
+        store = get_wishlist_store()
         lowest_price = get_product_lowest_price(product_name)
         
-        # 檢查是否為非3C產品
+        # 非3C產品：從清單移除並通知用戶
         if lowest_price == "非3C產品":
+            store.remove(user_id, product_name)
             try:
-                line_bot_api.reply_message(
-                    reply_token,
-                    TextSendMessage(text=f"很抱歉，我只能將3C電子產品添加到願望清單。請嘗試添加電腦、手機、平板、相機、耳機、智能手錶等電子產品。")
+                line_bot_api.push_message(
+                    user_id,
+                    TextSendMessage(text=f"很抱歉，我只能將3C電子產品添加到願望清單，已移除 '{product_name}'。請嘗試添加電腦、手機、平板、相機、耳機、智能手錶等電子產品。")
                 )
             except LineBotApiError as e:
-                print(f"LINE API Error in add_to_wishlist (non-3C product): {str(e)}")
+                print(f"LINE API Error in fill_lowest_price (non-3C product): {str(e)}")
             return
         
-        # 添加產品到願望清單
-        wishlist.append({
-            'name': product_name,
-            'lowest_price': lowest_price,
-            'added_date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        
-        # 保存願望清單
-        save_wishlist(user_id, wishlist)
-        
-        # 回覆用戶
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=f"已將 '{product_name}' 添加到您的願望清單。")
-            )
-        except LineBotApiError as e:
-            print(f"LINE API Error in add_to_wishlist (success reply): {str(e)}")
+        store.update_price(user_id, product_name, lowest_price)
     except Exception as e:
-        error_message = f"添加到願望清單時發生錯誤：{str(e)}"
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=error_message)
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in add_to_wishlist error handler: {str(api_error)}")
+        print(f"背景更新 {product_name} 價格時發生錯誤：{str(e)}")
 
 def view_wishlist(line_bot_api, reply_token, user_id):
     """查看願望清單"""
@@ -154,13 +144,7 @@ def view_wishlist(line_bot_api, reply_token, user_id):
         wishlist = load_wishlist(user_id)
         
         if not wishlist:
-            try:
-                line_bot_api.reply_message(
-                    reply_token,
-                    TextSendMessage(text="您的願望清單是空的。")
-                )
-            except LineBotApiError as e:
-                print(f"LINE API Error in view_wishlist (empty list): {str(e)}")
+            reply(line_bot_api, reply_token, TextSendMessage(text="您的願望清單是空的。"))
             return
         
         # 構建願望清單訊息
@@ -178,7 +162,9 @@ def view_wishlist(line_bot_api, reply_token, user_id):
             # 獲取價格信息
             price_info = ""
             if 'lowest_price' in item:
-                if item['lowest_price'] != "價格未知":
+                if item['lowest_price'] == PRICE_PENDING:
+                    price_info = "更新中 | "
+                elif item['lowest_price'] != "價格未知":
                     price_info = f"NT${item['lowest_price']} | "
             
             wishlist_text += f"{i}. {item['name']}\n   {price_info}加入日期: {added_date}\n"
@@ -186,99 +172,41 @@ def view_wishlist(line_bot_api, reply_token, user_id):
         wishlist_text += "\n要移除項目，請輸入「移除+產品名稱」\n要清空清單，請輸入「清空購物車」"
         
         # 回覆用戶
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=wishlist_text)
-            )
-        except LineBotApiError as e:
-            print(f"LINE API Error in view_wishlist (display list): {str(e)}")
+        reply(line_bot_api, reply_token, TextSendMessage(text=wishlist_text))
     except Exception as e:
         error_message = f"查看願望清單時發生錯誤：{str(e)}"
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=error_message)
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in view_wishlist error handler: {str(api_error)}")
+        reply(line_bot_api, reply_token, TextSendMessage(text=error_message))
 
 def remove_from_wishlist(line_bot_api, reply_token, user_id, product_name):
     """從願望清單中移除產品"""
     try:
-        # 載入願望清單
-        wishlist = load_wishlist(user_id)
+        store = get_wishlist_store()
         
-        if not wishlist:
-            try:
-                line_bot_api.reply_message(
-                    reply_token,
-                    TextSendMessage(text="您的願望清單是空的。")
-                )
-            except LineBotApiError as e:
-                print(f"LINE API Error in remove_from_wishlist (empty list): {str(e)}")
-            return
+        # 移除產品（單一語句刪除）
+        removed_name = store.remove(user_id, product_name)
         
-        # 尋找並移除產品
-        found = False
-        new_wishlist = []
-        for item in wishlist:
-            if item.get('name') == product_name:
-                found = True
-            else:
-                new_wishlist.append(item)
-        
-        if not found:
-            try:
-                line_bot_api.reply_message(
-                    reply_token,
-                    TextSendMessage(text=f"未在您的願望清單中找到 '{product_name}'。")
-                )
-            except LineBotApiError as e:
-                print(f"LINE API Error in remove_from_wishlist (not found): {str(e)}")
+        if removed_name is None and not store.load(user_id):
+            reply(line_bot_api, reply_token, TextSendMessage(text="您的願望清單是空的。"))
             return
         
-        # 保存更新後的願望清單
-        save_wishlist(user_id, new_wishlist)
+        if removed_name is None:
+            reply(line_bot_api, reply_token, TextSendMessage(text=f"未在您的願望清單中找到 '{product_name}'。"))
+            return
         
         # 回覆用戶
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=f"已從您的願望清單中移除 '{product_name}'。")
-            )
-        except LineBotApiError as e:
-            print(f"LINE API Error in remove_from_wishlist (success reply): {str(e)}")
+        reply(line_bot_api, reply_token, TextSendMessage(text=f"已從您的願望清單中移除 '{removed_name}'。"))
     except Exception as e:
         error_message = f"移除願望清單項目時發生錯誤：{str(e)}"
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=error_message)
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in remove_from_wishlist error handler: {str(api_error)}")
+        reply(line_bot_api, reply_token, TextSendMessage(text=error_message))
 
 def clear_wishlist(line_bot_api, reply_token, user_id):
     """清空願望清單"""
     try:
-        # 保存空的願望清單
-        save_wishlist(user_id, [])
+        # 清空願望清單
+        get_wishlist_store().clear(user_id)
         
         # 回覆用戶
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text="已清空您的願望清單。")
-            )
-        except LineBotApiError as e:
-            print(f"LINE API Error in clear_wishlist (success reply): {str(e)}")
+        reply(line_bot_api, reply_token, TextSendMessage(text="已清空您的願望清單。"))
     except Exception as e:
         error_message = f"清空願望清單時發生錯誤：{str(e)}"
-        try:
-            line_bot_api.reply_message(
-                reply_token,
-                TextSendMessage(text=error_message)
-            )
-        except LineBotApiError as api_error:
-            print(f"LINE API Error in clear_wishlist error handler: {str(api_error)}")
\ No newline at end of file
+        reply(line_bot_api, reply_token, TextSendMessage(text=error_message))
\ No newline at end of file
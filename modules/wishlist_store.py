@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import glob
+import threading
+from modules.sqlite_db import SQLiteDatabase
+from modules.product_names import canonical_key, same_product
+
+# 願望清單儲存方式："sqlite"（預設）或 "json"（每位用戶一個檔案）
+WISHLIST_BACKEND = os.environ.get('WISHLIST_BACKEND', 'sqlite')
+WISHLIST_DB_PATH = os.environ.get('WISHLIST_DB_PATH', "data/wishlist.db")
+WISHLIST_JSON_DIR = os.environ.get('WISHLIST_JSON_DIR', "data/wishlists")  # 舊版 JSON 願望清單目錄
+
+
+class JsonWishlistStore:
+    """每位用戶一個 JSON 檔案的願望清單儲存，以原子性改名避免寫入一半的檔案"""
+
+    def __init__(self, directory=WISHLIST_JSON_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}.json")
+
+    def load(self, user_id):
+        """載入用戶願望清單"""
+        path = self._path(user_id)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return []
+
+    def save(self, user_id, items):
+        """保存用戶願望清單（先寫入暫存檔再改名）"""
+        path = self._path(user_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def find(self, user_id, product_name):
+        """尋找清單中的相同產品，找不到時回傳 None"""
+        for item in self.load(user_id):
+            if same_product(item.get('name'), product_name):
+                return item
+        return None
+
+    def add(self, user_id, item):
+        """新增產品，已存在時回傳 False"""
+        with self._lock:
+            items = self.load(user_id)
+            if any(same_product(existing.get('name'), item['name']) for existing in items):
+                return False
+            items.append(item)
+            self.save(user_id, items)
+            return True
+
+    def remove(self, user_id, product_name):
+        """移除產品，回傳被移除的產品名稱，找不到時回傳 None"""
+        with self._lock:
+            items = self.load(user_id)
+            kept = [item for item in items if not same_product(item.get('name'), product_name)]
+            if len(kept) == len(items):
+                return None
+            removed = next(item for item in items if same_product(item.get('name'), product_name))
+            self.save(user_id, kept)
+            return removed['name']
+
+    def clear(self, user_id):
+        """清空願望清單"""
+        with self._lock:
+            self.save(user_id, [])
+
+    def update_price(self, user_id, product_name, price):
+        """更新產品的最低價格，產品不存在時回傳 False"""
+        with self._lock:
+            items = self.load(user_id)
+            for item in items:
+                if same_product(item.get('name'), product_name):
+                    item['lowest_price'] = price
+                    self.save(user_id, items)
+                    return True
+            return False
+
+    def iter_items(self):
+        """逐一列出所有用戶的願望清單項目，產生 (user_id, item)"""
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+            user_id = os.path.splitext(os.path.basename(path))[0]
+            for item in self.load(user_id):
+                yield user_id, item
+
+
+class SQLiteWishlistStore:
+    """SQLite（WAL）願望清單儲存，以 (user_id, canonical_name) 為索引，多個 worker 可安全並行寫入"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS wishlist_items (
+        user_id TEXT NOT NULL,
+        canonical_name TEXT NOT NULL,
+        name TEXT NOT NULL,
+        lowest_price,
+        added_at TEXT,
+        PRIMARY KEY (user_id, canonical_name)
+    );
+    CREATE INDEX IF NOT EXISTS idx_wishlist_canonical ON wishlist_items (canonical_name);
+    CREATE TABLE IF NOT EXISTS wishlist_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """
+
+    def __init__(self, path=WISHLIST_DB_PATH, json_dir=WISHLIST_JSON_DIR):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+        if json_dir:
+            self.migrate_once(json_dir)
+
+    @staticmethod
+    def _row_to_item(row):
+        item = {'name': row['name'], 'lowest_price': row['lowest_price']}
+        if row['added_at']:
+            item['added_at'] = row['added_at']
+        return item
+
+    @staticmethod
+    def _item_to_row(user_id, item):
+        return (
+            user_id,
+            canonical_key(item['name']),
+            item['name'],
+            item.get('lowest_price'),
+            item.get('added_at') or item.get('added_date'),
+        )
+
+    def load(self, user_id):
+        """載入用戶願望清單（依加入順序）"""
+        rows = self.db.execute(
+            "SELECT name, lowest_price, added_at FROM wishlist_items WHERE user_id = ? ORDER BY rowid",
+            (user_id,)
+        ).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def save(self, user_id, items):
+        """以整份清單取代用戶願望清單"""
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM wishlist_items WHERE user_id = ?", (user_id,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO wishlist_items (user_id, canonical_name, name, lowest_price, added_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [self._item_to_row(user_id, item) for item in items]
+            )
+
+    def find(self, user_id, product_name):
+        """尋找清單中的相同產品，找不到時回傳 None"""
+        row = self.db.execute(
+            "SELECT name, lowest_price, added_at FROM wishlist_items WHERE user_id = ? AND canonical_name = ?",
+            (user_id, canonical_key(product_name))
+        ).fetchone()
+        return self._row_to_item(row) if row else None
+
+    def add(self, user_id, item):
+        """新增產品，已存在時回傳 False"""
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO wishlist_items (user_id, canonical_name, name, lowest_price, added_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            self._item_to_row(user_id, item)
+        )
+        return cursor.rowcount == 1
+
+    def remove(self, user_id, product_name):
+        """移除產品，回傳被移除的產品名稱，找不到時回傳 None"""
+        key = (user_id, canonical_key(product_name))
+        # 查詢與刪除在同一個寫入交易中，其他 worker 無法在兩者之間修改同一筆項目
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT name FROM wishlist_items WHERE user_id = ? AND canonical_name = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM wishlist_items WHERE user_id = ? AND canonical_name = ?", key)
+        return row['name']
+
+    def clear(self, user_id):
+        """清空願望清單"""
+        self.db.execute("DELETE FROM wishlist_items WHERE user_id = ?", (user_id,))
+
+    def update_price(self, user_id, product_name, price):
+        """更新產品的最低價格，產品不存在時回傳 False"""
+        cursor = self.db.execute(
+            "UPDATE wishlist_items SET lowest_price = ? WHERE user_id = ? AND canonical_name = ?",
+            (price, user_id, canonical_key(product_name))
+        )
+        return cursor.rowcount == 1
+
+    def iter_items(self):
+        """逐一列出所有用戶的願望清單項目，產生 (user_id, item)"""
+        cursor = self.db.execute(
+            "SELECT user_id, name, lowest_price, added_at FROM wishlist_items ORDER BY canonical_name"
+        )
+        for row in cursor:
+            yield row['user_id'], self._row_to_item(row)
+
+    def migrate_once(self, json_dir):
+        """首次啟動時從 JSON 目錄匯入既有的願望清單（多個 worker 同時啟動也只會執行一次）"""
+        with self.db.transaction() as conn:
+            done = conn.execute("SELECT value FROM wishlist_meta WHERE key = 'json_migrated'").fetchone()
+            if done:
+                return 0
+            count = self._import_json_dir(conn, json_dir)
+            conn.execute("INSERT INTO wishlist_meta (key, value) VALUES ('json_migrated', ?)", (str(count),))
+        if count:
+            print(f"已從 {json_dir} 匯入 {count} 筆願望清單項目")
+        return count
+
+    def _import_json_dir(self, conn, json_dir):
+        count = 0
+        for path in sorted(glob.glob(os.path.join(json_dir, "*.json"))):
+            user_id = os.path.splitext(os.path.basename(path))[0]
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    items = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"無法匯入 {path}：{str(e)}")
+                continue
+            rows = [self._item_to_row(user_id, item) for item in items if item.get('name')]
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO wishlist_items (user_id, canonical_name, name, lowest_price, added_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            count += max(cursor.rowcount, 0)
+        return count
+
+
+def create_wishlist_store(backend=WISHLIST_BACKEND):
+    """依設定建立願望清單儲存"""
+    if backend == "json":
+        return JsonWishlistStore()
+    return SQLiteWishlistStore()
+
+
+if __name__ == "__main__":
+    # 用法：python -m modules.wishlist_store migrate [JSON目錄] [資料庫路徑]
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        json_dir = sys.argv[2] if len(sys.argv) > 2 else WISHLIST_JSON_DIR
+        db_path = sys.argv[3] if len(sys.argv) > 3 else WISHLIST_DB_PATH
+        store = SQLiteWishlistStore(db_path, json_dir=None)
+        with store.db.transaction() as conn:
+            count = store._import_json_dir(conn, json_dir)
+            conn.execute("INSERT OR REPLACE INTO wishlist_meta (key, value) VALUES ('json_migrated', ?)", (str(count),))
+        print(f"已從 {json_dir} 匯入 {count} 筆願望清單項目到 {db_path}")
+    else:
+        print("用法：python -m modules.wishlist_store migrate [JSON目錄] [資料庫路徑]")
+        sys.exit(1)
@@ -0,0 +1,48 @@
+import pytest
+from modules.catalog import CatalogIndex, HIT, AMBIGUOUS, MISS
+
+
+def product(name, aliases=()):
+    return {"name": name, "category": None, "aliases": list(aliases), "specs": {}, "updated_at": None}
+
+
+@pytest.fixture
+def index():
+    return CatalogIndex([
+        product("iPhone 15 Pro Max"),
+        product("Pixel 8 Pro"),
+        product("Pixel 8"),
+        product("Galaxy S24 Ultra", aliases=["S24U"]),
+    ])
+
+
+def names(products):
+    return [p["name"] for p in products]
+
+
+@pytest.mark.parametrize("text, name", [
+    ("iPhone 15 Pro Max", "iPhone 15 Pro Max"),
+    ("iphone15promax", "iPhone 15 Pro Max"),
+    ("pixel 8", "Pixel 8"),
+    ("s24u", "Galaxy S24 Ultra"),
+])
+def test_exact_name_or_alias_is_a_hit(index, text, name):
+    result, products = index.match(text)
+    assert result == HIT
+    assert names(products) == [name]
+
+
+@pytest.mark.parametrize("text, candidate", [
+    ("iPhone 15 Pro", "iPhone 15 Pro Max"),
+    ("Pixel 8a", "Pixel 8"),
+    ("Pixel 8 Pro XL", "Pixel 8 Pro"),
+    ("Galaxy S24", "Galaxy S24 Ultra"),
+])
+def test_sibling_models_are_only_candidates(index, text, candidate):
+    result, products = index.match(text)
+    assert result == AMBIGUOUS
+    assert candidate in names(products)
+
+
+def test_unrelated_input_is_a_miss(index):
+    assert index.match("電動牙刷") == (MISS, [])
@@ -0,0 +1,88 @@
+import time
+import logging
+import threading
+import pytest
+from modules.event_queue import EventExecutor, QueueFullError
+
+
+@pytest.fixture
+def executor():
+    executor = EventExecutor(max_workers=4, queue_size=8)
+    yield executor
+    executor.shutdown(timeout=5)
+
+
+def test_jobs_with_the_same_key_run_in_order(executor):
+    order = []
+
+    def job(i):
+        time.sleep(0.001 * (5 - i))
+        order.append(i)
+
+    futures = [executor.submit_keyed("user", job, i) for i in range(5)]
+    for future in futures:
+        future.result(timeout=5)
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_jobs_with_different_keys_run_in_parallel(executor):
+    barrier = threading.Barrier(2, timeout=5)
+    futures = executor.submit_keyed_batch([
+        ("user1", barrier.wait, (), {}),
+        ("user2", barrier.wait, (), {}),
+    ])
+    # 兩個工作必須同時執行才能通過 barrier
+    assert all(future.result(timeout=5) is not None for future in futures)
+
+
+def test_full_queue_rejects_new_jobs():
+    executor = EventExecutor(max_workers=1, queue_size=1)
+    release = threading.Event()
+    try:
+        executor.submit(release.wait, 5)
+        executor.submit_keyed("user", release.wait, 5)
+        with pytest.raises(QueueFullError):
+            executor.submit(release.wait, 5)
+        with pytest.raises(QueueFullError):
+            executor.submit_keyed_batch([("user", release.wait, (5,), {})])
+    finally:
+        release.set()
+        executor.shutdown(timeout=5)
+
+
+def test_batch_admits_the_prefix_that_fits():
+    executor = EventExecutor(max_workers=1, queue_size=1)
+    release = threading.Event()
+    try:
+        executor.submit(release.wait, 5)
+        futures = executor.submit_keyed_batch([("user", lambda i=i: i, (), {}) for i in range(3)])
+        assert len(futures) == 1
+        release.set()
+        assert futures[0].result(timeout=5) == 0
+    finally:
+        release.set()
+        executor.shutdown(timeout=5)
+
+
+def test_shutdown_drains_pending_jobs():
+    executor = EventExecutor(max_workers=1, queue_size=4)
+    done = []
+    futures = [executor.submit_keyed("user", lambda i=i: (time.sleep(0.02), done.append(i))) for i in range(4)]
+    assert executor.shutdown(timeout=5)
+    assert done == [0, 1, 2, 3]
+    assert all(future.done() for future in futures)
+    with pytest.raises(QueueFullError):
+        executor.submit(done.append, 4)
+
+
+def test_handler_errors_are_logged_and_do_not_stop_the_key(executor, caplog):
+    def fail():
+        raise ValueError("boom")
+
+    with caplog.at_level(logging.ERROR, logger="modules.event_queue"):
+        failed = executor.submit_keyed("user", fail)
+        following = executor.submit_keyed("user", lambda: "ok")
+        assert failed.result(timeout=5) is None
+        assert following.result(timeout=5) == "ok"
+    assert "Error in background event worker" in caplog.text
+    assert "boom" in caplog.text
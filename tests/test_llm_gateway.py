@@ -0,0 +1,23 @@
+from modules.llm_gateway import http_session, trim_to_budget, trim_truncated
+
+
+def test_trim_truncated_drops_the_unfinished_sentence():
+    text = "第一點：續航力很好。\n第二點：螢幕很亮。第三點：相機"
+    assert trim_truncated(text) == "第一點：續航力很好。\n第二點：螢幕很亮。…"
+
+
+def test_trim_truncated_keeps_text_without_a_late_boundary():
+    assert trim_truncated("價格約為 NT$32,900") == "價格約為 NT$32,900…"
+
+
+def test_trim_to_budget_keeps_short_text():
+    assert trim_to_budget("很短的回覆。", 100) == "很短的回覆。"
+
+
+def test_shared_session_survives_openai_recycling():
+    adapter = http_session.get_adapter("https://api.openai.com")
+    pool = adapter.poolmanager.connection_from_url("https://api.openai.com")
+    # openai 0.27 在 session 使用超過 MAX_SESSION_LIFETIME_SECS 後呼叫 close() 再重新取得
+    http_session.close()
+    assert adapter.poolmanager.connection_from_url("https://api.openai.com") is pool
+    assert adapter.max_retries.total == 2
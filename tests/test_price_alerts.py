@@ -0,0 +1,73 @@
+import collections
+import pytest
+from linebot.exceptions import LineBotApiError
+from modules.price_alerts import (
+    MULTICAST_BATCH_SIZE, load_checkpoint, notify_price_drops, resume_price_alerts,
+)
+
+
+class LineApi:
+    """記錄 multicast 收件者，在第 fail_on 次呼叫時失敗"""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = 0
+        self.batches = []
+
+    def multicast(self, to, message):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise LineBotApiError(500, {})
+        self.batches.append(list(to))
+
+
+class Store:
+    def __init__(self):
+        self.prices = {}
+
+    def update_price(self, user_id, product_name, price):
+        self.prices[(user_id, product_name)] = price
+        return True
+
+
+@pytest.fixture
+def drops():
+    users = {f"U{i:05d}": 30000 for i in range(MULTICAST_BATCH_SIZE * 2 + 1)}
+    products = {
+        "iphone15pro": {"name": "iPhone 15 Pro", "users": users},
+        "pixel8": {"name": "Pixel 8", "users": {"U00001": 20000, "U99999": 18000}},
+    }
+    prices = {"iphone15pro": 29000, "pixel8": 19000}
+    return products, prices
+
+
+def test_recipients_are_sent_in_batches_of_500(tmp_path, drops):
+    line_api, store = LineApi(), Store()
+    path = str(tmp_path / "checkpoint.json")
+    assert notify_price_drops(line_api, store, *drops, path=path, rate=0) == MULTICAST_BATCH_SIZE * 2 + 2
+    assert [len(batch) for batch in line_api.batches] == [MULTICAST_BATCH_SIZE, MULTICAST_BATCH_SIZE, 1, 1]
+    assert load_checkpoint(path) is None
+
+
+def test_resume_after_interruption_neither_repeats_nor_skips_users(tmp_path, drops):
+    products, prices = drops
+    path = str(tmp_path / "checkpoint.json")
+    store = Store()
+
+    # 第二批送出失敗：第一批已記錄在檢查點，第二批之後尚未送出
+    interrupted = LineApi(fail_on=2)
+    with pytest.raises(LineBotApiError):
+        notify_price_drops(interrupted, store, products, prices, path=path, rate=0)
+    assert load_checkpoint(path)["sent"] == ["iphone15pro:0"]
+
+    resumed = LineApi()
+    assert resume_price_alerts(resumed, store, path=path, rate=0) == MULTICAST_BATCH_SIZE + 2
+    assert load_checkpoint(path) is None
+
+    recipients = collections.Counter(user for batch in interrupted.batches + resumed.batches for user in batch)
+    expected = collections.Counter(list(products["iphone15pro"]["users"]) + ["U00001"])
+    assert recipients == expected
+    assert len(store.prices) == sum(expected.values())
+
+    # 檢查點已移除，再執行一次不會重複通知
+    assert resume_price_alerts(LineApi(), store, path=path, rate=0) == 0
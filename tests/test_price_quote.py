@@ -0,0 +1,83 @@
+import pytest
+from modules import wishlist
+from modules.price_query import (
+    NOT_3C, PRICE_QUOTE_KEY, PRICE_QUOTE_TTL, make_price_quote, parse_lowest_price, quoted_price,
+)
+from modules.user_state import UserState
+from modules.wishlist_store import SQLiteWishlistStore
+
+
+@pytest.mark.parametrize("response, price", [
+    ("最低價：NT$25,900\n各通路價格如下", 25900),
+    ("最低價: $ 1,299,000\n", 1299000),
+    ("  最低價：32900 元起", 32900),
+    ("最低價：NT$,\n", None),
+    ("最低價：約兩萬元\n", None),
+    ("價格：NT$25,900\n", None),
+    ("以下是各通路價格\n最低價：NT$25,900", None),
+    ("", None),
+])
+def test_parse_lowest_price(response, price):
+    assert parse_lowest_price(response) == price
+
+
+def state_with_quote(product, price, age=0):
+    state = UserState()
+    quote = make_price_quote(product, price)
+    quote["quoted_at"] -= age
+    state.set_context(PRICE_QUOTE_KEY, quote)
+    return state
+
+
+def test_quote_is_reused_for_the_same_product():
+    assert quoted_price(state_with_quote("iPhone 15 Pro", 32900), "iphone15pro") == 32900
+
+
+@pytest.mark.parametrize("state, product", [
+    (UserState(), "iPhone 15 Pro"),
+    (state_with_quote("iPhone 15 Pro", 32900), "Pixel 8"),
+    (state_with_quote("iPhone 15 Pro", 32900, age=PRICE_QUOTE_TTL + 1), "iPhone 15 Pro"),
+])
+def test_missing_other_or_expired_quote_is_not_reused(state, product):
+    assert quoted_price(state, product) is None
+
+
+class Executor:
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        self.jobs.append((fn, args))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = SQLiteWishlistStore(str(tmp_path / "wishlist.db"), json_dir=None)
+    monkeypatch.setattr(wishlist, "get_wishlist_store", lambda: store)
+    monkeypatch.setattr(wishlist, "reply", lambda *args: None)
+    return store
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = Executor()
+    monkeypatch.setattr(wishlist, "_price_executor", executor)
+    return executor
+
+
+def test_quoted_price_is_stored_without_another_lookup(store, executor):
+    wishlist.add_to_wishlist(None, "token", "U1", "添加到願望清單:iPhone 15 Pro", quoted_price=32900)
+    assert store.find("U1", "iPhone 15 Pro")["lowest_price"] == 32900
+    assert executor.jobs == []
+
+
+def test_without_a_quote_the_price_is_filled_in_the_background(store, executor):
+    wishlist.add_to_wishlist(None, "token", "U1", "添加到願望清單:iPhone 15 Pro", quoted_price=None)
+    assert store.find("U1", "iPhone 15 Pro")["lowest_price"] == wishlist.PRICE_PENDING
+    assert executor.jobs == [(wishlist.fill_lowest_price, (None, "U1", "iPhone 15 Pro"))]
+
+
+def test_non_3c_quote_is_not_added(store, executor):
+    wishlist.add_to_wishlist(None, "token", "U1", "添加到願望清單:電動牙刷", quoted_price=NOT_3C)
+    assert store.load("U1") == []
+    assert executor.jobs == []
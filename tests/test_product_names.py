@@ -0,0 +1,39 @@
+import pytest
+from modules.product_names import normalize_product_name
+
+
+@pytest.mark.parametrize("text, key", [
+    ("i15 pro", "iphone15pro"),
+    ("i15", "iphone15"),
+    ("ｉＰｈｏｎｅ 15 Pro 128", "iphone15pro128gb"),
+    ("蘋果15 pro", "iphone15pro"),
+    ("Intel i7 筆電", "inteli7筆電"),
+    ("i7 筆電", "i7筆電"),
+    ("i7-13700", "i713700"),
+    ("ASUS Zenbook 14 i5", "asuszenbook14i5"),
+    ("Apple Watch Series 10", "applewatchseries10"),
+    ("蘋果 watch ultra 2", "applewatchultra2"),
+    ("Apple AirPods Pro 2", "airpodspro2"),
+    ("iPhone 15 Pro 1T", "iphone15pro1tb"),
+    ("iPhone 15 Pro 1 TB", "iphone15pro1tb"),
+    ("MacBook Pro 14 4TB", "macbookpro144tb"),
+    ("Galaxy A32 128G", "galaxya32128gb"),
+])
+def test_normalize_product_name(text, key):
+    assert normalize_product_name(text) == key
+
+
+@pytest.mark.parametrize("text, key", [
+    ("Galaxy A32", "galaxya32"),
+    ("Galaxy A32 5G", "galaxya325g"),
+    ("OnePlus 8T", "oneplus8t"),
+    ("Redmi Note 8T", "redminote8t"),
+    ("ROG Phone 8", "rogphone8"),
+    ("i7", "i7"),
+    ("i5 筆電", "i5筆電"),
+    ("i9-14900K", "i914900k"),
+    ("Apple 2024", "apple2024"),
+    ("MacBook Air Apple 2024", "macbookairapple2024"),
+])
+def test_model_numbers_are_not_rewritten(text, key):
+    assert normalize_product_name(text) == key
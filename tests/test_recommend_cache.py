@@ -0,0 +1,78 @@
+import pytest
+from modules.recommend_cache import (
+    RecommendationCache, budget_bucket, parse_budget, request_signature, similarity,
+)
+
+
+@pytest.mark.parametrize("text, budget", [
+    ("預算兩萬", (None, 20000)),
+    ("預算2萬", (None, 20000)),
+    ("預算20000", (None, 20000)),
+    ("20,000元以內", (None, 20000)),
+    ("15k", (None, 15000)),
+    ("一萬五", (None, 15000)),
+    ("1萬5", (None, 15000)),
+    ("兩萬五千", (None, 25000)),
+    ("不超過25000", (None, 25000)),
+    ("2萬以上", (20000, None)),
+    ("1~2萬", (10000, 20000)),
+    ("3萬左右", (27000, 33000)),
+    ("大約3萬", (27000, 33000)),
+    ("推薦拍照好的手機", None),
+    ("iphone 15", None),
+])
+def test_parse_budget(text, budget):
+    assert parse_budget(text)[0] == budget
+
+
+@pytest.mark.parametrize("budget, bucket", [
+    (None, None),
+    ((None, 5000), ("within", 0)),
+    ((None, 5001), ("within", 1)),
+    ((None, 10000), ("within", 1)),
+    ((None, 10001), ("within", 2)),
+    ((None, 100000), ("within", 9)),
+    ((None, 100001), ("within", 10)),
+    ((15000, 25000), ("within", 3)),
+    ((20000, None), ("above", 3)),
+])
+def test_budget_bucket(budget, bucket):
+    assert budget_bucket(budget) == bucket
+
+
+def test_equivalent_budgets_share_a_signature():
+    signatures = {request_signature("手機", f"預算{amount} 拍照好") for amount in ("兩萬", "2萬", "20000")}
+    assert len(signatures) == 1
+
+
+def test_upper_and_lower_bounds_do_not_share_a_group():
+    assert request_signature("手機", "2萬以內")[0] != request_signature("手機", "2萬以上")[0]
+
+
+@pytest.mark.parametrize("tokens1, tokens2, score", [
+    (frozenset(), frozenset(), 1.0),
+    (frozenset({"拍照"}), frozenset({"拍照"}), 1.0),
+    (frozenset({"拍", "照", "拍照"}), frozenset({"拍", "照", "拍照", "遊戲"}), 0.75),
+    (frozenset({"拍照"}), frozenset({"遊戲"}), 0.0),
+])
+def test_similarity(tokens1, tokens2, score):
+    assert similarity(tokens1, tokens2) == score
+
+
+@pytest.fixture
+def cache():
+    cache = RecommendationCache(max_size=8, threshold=0.6, ttl=60)
+    cache.put("手機", "預算兩萬 拍照好", "推薦 A")
+    return cache
+
+
+@pytest.mark.parametrize("device_type, requirements, expected", [
+    ("手機", "2萬以內 拍照好", "推薦 A"),
+    ("手機", "預算20000 拍照好 的", "推薦 A"),
+    ("手機", "預算兩萬 打遊戲", None),
+    ("手機", "預算兩萬五 拍照好", None),
+    ("手機", "2萬以上 拍照好", None),
+    ("筆電", "預算兩萬 拍照好", None),
+])
+def test_cache_only_serves_similar_requests_in_the_same_bucket(cache, device_type, requirements, expected):
+    assert cache.get(device_type, requirements) == expected
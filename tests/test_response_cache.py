@@ -0,0 +1,96 @@
+import pytest
+from modules import response_cache as cache_module
+from modules.product_names import canonical_key
+from modules.response_cache import ResponseCache, cached, response_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    response_cache.clear()
+    yield
+    response_cache.clear()
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache(max_size=10)
+    cache.set("key", "value", ttl=60)
+    clock.now += 59
+    assert cache.get("key") == "value"
+    clock.now += 1
+    assert not cache.contains("key")
+    assert cache.get("key") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_size=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    cache.get("a")
+    cache.set("c", 3, ttl=60)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_canonical_key_merges_spellings_of_the_same_product():
+    calls = []
+
+    @cached("product_query", normalize=canonical_key)
+    def query(product):
+        calls.append(product)
+        return f"規格：{product}"
+
+    assert query("iPhone 15 Pro") == "規格：iPhone 15 Pro"
+    assert query("ｉＰｈｏｎｅ15pro") == "規格：iPhone 15 Pro"
+    assert query.is_cached("i15 pro")
+    assert calls == ["iPhone 15 Pro"]
+
+
+def test_default_normalization_ignores_case_and_spacing():
+    calls = []
+
+    @cached("popular_ranking")
+    def ranking(category):
+        calls.append(category)
+        return "排行"
+
+    ranking("Gaming  Laptop")
+    ranking("gaming laptop")
+    assert calls == ["Gaming  Laptop"]
+
+
+def test_errors_and_empty_results_are_not_cached():
+    results = [RuntimeError("upstream failed"), "", "答案"]
+
+    @cached("price_query")
+    def price(product):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    with pytest.raises(RuntimeError):
+        price("Pixel 8")
+    assert not price.is_cached("Pixel 8")
+    assert price("Pixel 8") == ""
+    assert not price.is_cached("Pixel 8")
+    assert price("Pixel 8") == "答案"
+    assert price("Pixel 8") == "答案"
+    assert results == []
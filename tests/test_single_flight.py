@@ -0,0 +1,88 @@
+import time
+import threading
+import pytest
+from modules.deadline import DeadlineExceeded
+from modules.single_flight import SingleFlight
+
+
+def start_leader(flight, key, fn):
+    """在背景執行緒成為 key 的執行者，等到呼叫開始後才返回"""
+    started = threading.Event()
+    outcome = {}
+
+    def run():
+        def call():
+            started.set()
+            return fn()
+        try:
+            outcome["result"] = flight.do(key, call)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert started.wait(5)
+    return thread, outcome
+
+
+def test_followers_share_the_leader_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    thread, outcome = start_leader(flight, "key", lambda: release.wait(5) and "answer")
+    results = []
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", lambda: "other", timeout=5)))
+                 for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while flight.stats()["coalesced"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for follower in followers + [thread]:
+        follower.join(5)
+    assert outcome["result"] == "answer"
+    assert results == ["answer"] * 3
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 3}
+
+
+def test_followers_receive_the_leader_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("upstream failed")
+
+    thread, outcome = start_leader(flight, "key", fail)
+    errors = []
+
+    def follow():
+        try:
+            flight.do("key", lambda: "other", timeout=5)
+        except ValueError as e:
+            errors.append(e)
+
+    follower = threading.Thread(target=follow)
+    follower.start()
+    while flight.stats()["coalesced"] < 1:
+        time.sleep(0.001)
+    release.set()
+    follower.join(5)
+    thread.join(5)
+    assert isinstance(outcome["error"], ValueError)
+    assert errors == [outcome["error"]]
+
+
+def test_follower_deadline_does_not_leak_the_key():
+    flight = SingleFlight()
+    release = threading.Event()
+    key = ("product_query", "secret-user-key")
+    thread, _ = start_leader(flight, key, lambda: release.wait(5))
+    try:
+        with pytest.raises(DeadlineExceeded) as info:
+            flight.do(key, lambda: "other", timeout=0.05)
+        assert "secret-user-key" not in str(info.value)
+    finally:
+        release.set()
+        thread.join(5)
+    # 逾時的等待者不影響之後的呼叫
+    assert flight.do(key, lambda: "fresh") == "fresh"
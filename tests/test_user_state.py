@@ -0,0 +1,34 @@
+import time
+from modules.user_state import InMemoryUserStateStore, UserState
+
+
+def idle_state(seconds):
+    state = UserState()
+    state.set_state("product_query", waiting_for_input=True)
+    state.last_activity_time -= seconds
+    return state
+
+
+def test_background_sweep_evicts_idle_states():
+    store = InMemoryUserStateStore(timeout_seconds=60, sweep_interval=0.05)
+    try:
+        store.save("idle", idle_state(120))
+        store.save("active", idle_state(0))
+        deadline = time.monotonic() + 2
+        while len(store) > 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(store) == 1
+        assert store.expired == 1
+        assert store.get("active").current_state == "product_query"
+    finally:
+        store.close()
+
+
+def test_sweep_evicts_more_than_one_batch():
+    store = InMemoryUserStateStore(timeout_seconds=60, sweep_interval=0)
+    count = InMemoryUserStateStore.SWEEP_BATCH * 3 + 1
+    for i in range(count):
+        store.save(f"user{i}", idle_state(120))
+    store.save("active", idle_state(0))
+    assert store.sweep() == count
+    assert len(store) == 1
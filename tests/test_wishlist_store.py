@@ -0,0 +1,37 @@
+import json
+import pytest
+from modules.wishlist_store import SQLiteWishlistStore
+
+
+@pytest.fixture
+def json_dir(tmp_path):
+    directory = tmp_path / "wishlists"
+    directory.mkdir()
+    (directory / "U1.json").write_text(json.dumps([
+        {"name": "iPhone 15 Pro", "lowest_price": 32900, "added_date": "2024-01-01"},
+        {"name": "Pixel 8", "lowest_price": None},
+    ]), encoding="utf-8")
+    return directory
+
+
+def test_json_wishlists_are_migrated_only_once(tmp_path, json_dir):
+    db_path = str(tmp_path / "wishlist.db")
+    store = SQLiteWishlistStore(db_path, json_dir=str(json_dir))
+    assert [item["name"] for item in store.load("U1")] == ["iPhone 15 Pro", "Pixel 8"]
+
+    # 用戶刪除項目後重新啟動（或其他 worker 啟動）不會再匯入一次
+    store.remove("U1", "Pixel 8")
+    restarted = SQLiteWishlistStore(db_path, json_dir=str(json_dir))
+    assert restarted.migrate_once(str(json_dir)) == 0
+    assert [item["name"] for item in restarted.load("U1")] == ["iPhone 15 Pro"]
+
+
+def test_remove_matches_other_spellings_of_the_product(tmp_path):
+    store = SQLiteWishlistStore(str(tmp_path / "wishlist.db"), json_dir=None)
+    store.add("U1", {"name": "iPhone 15 Pro", "lowest_price": None})
+    store.add("U1", {"name": "Pixel 8", "lowest_price": None})
+
+    assert store.remove("U1", "ｉ15 pro") == "iPhone 15 Pro"
+    assert store.remove("U1", "iphone15pro") is None
+    assert store.remove("U2", "Pixel 8") is None
+    assert [item["name"] for item in store.load("U1")] == ["Pixel 8"]